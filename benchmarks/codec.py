@@ -0,0 +1,62 @@
+"""Compare the NATS wire formats: bytes on the wire and encode/decode time per message.
+
+Covers a plain request, a response with a large `data` payload and batch responses of `--batch` bulbs, each in
+JSON and the compact binary format, with and without zlib compression.
+
+    python -m benchmarks.codec --iterations 2000 --batch 100 --ctx-keys 200
+"""
+import argparse
+import time
+
+from src.codec import BINARY, JSON, WireFormat, decode
+from src.models import LightbulbBatchResponse, LightbulbRequest, LightbulbResponse
+from .common import print_report
+
+FORMATS = {
+    "json": WireFormat(JSON),
+    "json_zlib": WireFormat(JSON, 0),
+    "binary": WireFormat(BINARY),
+    "binary_zlib": WireFormat(BINARY, 0),
+}
+
+
+def make_messages(args) -> dict:
+    ctx = {f"setting_{i}": {"value": i * 1.5, "enabled": i % 2 == 0, "label": f"Setting number {i}"} for i in range(args.ctx_keys)}
+    bulb = {"ctx": {"room": "kitchen", "floor": 2}, "status": "ON"}
+    return {
+        "request": LightbulbRequest(id="bulb-123"),
+        "large_data": LightbulbResponse(success=True, id="bulb-123", data={"ctx": ctx, "status": "ON"}),
+        "batch": LightbulbBatchResponse(success=True, results=[
+            LightbulbResponse(success=True, id=f"bulb-{i}", data=bulb) for i in range(args.batch)
+        ]),
+    }
+
+
+def bench(message, wire_format: WireFormat, iterations: int) -> dict:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        payload, headers = wire_format.encode(message)
+    encode_s = (time.perf_counter() - started) / iterations
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        decoded = decode(payload, headers, type(message))
+    decode_s = (time.perf_counter() - started) / iterations
+
+    assert decoded == message
+    return {"bytes": len(payload), "encode_us": round(encode_s * 1e6, 2), "decode_us": round(decode_s * 1e6, 2)}
+
+
+def main(args):
+    print_report({
+        name: {format_name: bench(message, wire_format, args.iterations) for format_name, wire_format in FORMATS.items()}
+        for name, message in make_messages(args).items()
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark NATS message codecs")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=100, help="Bulbs per batch response")
+    parser.add_argument("--ctx-keys", type=int, default=200, help="Entries in the large data payload")
+    main(parser.parse_args())
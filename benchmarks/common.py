@@ -0,0 +1,72 @@
+import asyncio
+import json
+import socket
+import statistics
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+import uvicorn
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    """Summarize latencies (seconds) into a JSON friendly dict with millisecond percentiles."""
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "throughput": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+async def run_closed_loop(operation: Callable[[int], Awaitable[None]], total: int, concurrency: int) -> dict:
+    """Run `total` operations with `concurrency` workers, each issuing its next operation as soon as the last one finished."""
+    latencies: list[float] = []
+    counter = iter(range(total))
+
+    async def _worker():
+        for i in counter:
+            started = time.perf_counter()
+            await operation(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@asynccontextmanager
+async def standin_server(app, port: int | None = None, lifespan: str = "off"):
+    """Serve an ASGI app on localhost for the duration of the context and yield its base URL."""
+    port = port or free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan=lifespan))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
+
+
+def print_report(report: dict):
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,104 @@
+"""Compare edge link message throughput of serial per-message handling and micro-batched processing.
+
+Messages are fed to the handlers through a stand-in NATS connection that only records replies, in bursts of
+`--burst` messages per event loop tick. Logging is configured at INFO to a null stream so formatting costs are
+included without terminal I/O. The serial numbers already exclude the per-message state dump, which is now opt-in.
+
+    python -m benchmarks.edge_link_batching --messages 50000 --burst 256
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+from src.edge_link import main as edge_link
+from .common import print_report
+
+
+class RecordingNATS:
+    def __init__(self):
+        self.replies = 0
+
+    async def publish(self, subject: str, payload: bytes):
+        # State change events are published too
+        if subject.startswith("_INBOX."):
+            self.replies += 1
+
+
+class Msg:
+    __slots__ = ("subject", "data", "reply", "headers")
+
+    def __init__(self, subject: str, data: bytes, reply: str, headers: dict | None = None):
+        self.subject = subject
+        self.data = data
+        self.reply = reply
+        self.headers = headers
+
+
+def make_messages(count: int, bulbs: int) -> list[Msg]:
+    subjects = ["lightbulb.get", "lightbulb.toggle", "lightbulb.get", "lightbulb.get"]
+    return [Msg(subjects[i % len(subjects)], json.dumps({"id": f"bulb-{i % bulbs}"}).encode(), f"_INBOX.{i}") for i in range(count)]
+
+
+def reset_state(bulbs: int):
+    edge_link.light_bulbs.clear()
+    for i in range(bulbs):
+        edge_link.light_bulbs.install(f"bulb-{i}")
+
+
+async def bench_serial(messages: list[Msg], burst: int) -> float:
+    nc = RecordingNATS()
+    handler = edge_link.construct_handler(nc)
+
+    started = time.perf_counter()
+    for i, msg in enumerate(messages):
+        await handler(msg)
+        if i % burst == 0:
+            await asyncio.sleep(0)
+
+    return len(messages) / (time.perf_counter() - started)
+
+
+async def bench_batch(messages: list[Msg], burst: int) -> float:
+    nc = RecordingNATS()
+    processor = edge_link.BatchProcessor(nc)
+    processor.start()
+
+    started = time.perf_counter()
+    for i, msg in enumerate(messages):
+        await processor.enqueue(msg)
+        if i % burst == 0:
+            await asyncio.sleep(0)
+    await processor.stop()
+
+    assert nc.replies == len(messages)
+    return len(messages) / (time.perf_counter() - started)
+
+
+async def main(args):
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, "w"), force=True)
+    messages = make_messages(args.messages, args.bulbs)
+
+    reset_state(args.bulbs)
+    serial = await bench_serial(messages, args.burst)
+
+    reset_state(args.bulbs)
+    batch = await bench_batch(messages, args.burst)
+
+    print_report({
+        "messages": args.messages,
+        "burst": args.burst,
+        "serial_msgs_per_sec": round(serial, 1),
+        "batch_msgs_per_sec": round(batch, 1),
+        "speedup": round(batch / serial, 2),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark serial vs micro-batched edge link processing")
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--bulbs", type=int, default=1000)
+    parser.add_argument("--burst", type=int, default=256, help="Messages arriving per event loop tick")
+    asyncio.run(main(parser.parse_args()))
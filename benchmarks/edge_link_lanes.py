@@ -0,0 +1,98 @@
+"""Measure how a slow bulb affects the others with one processing lane and with per-bulb ordered lanes.
+
+Messages for `--bulbs` bulbs are enqueued at `--rate` per second. Replies to the first bulb take `--slow-ms` to
+publish, standing in for a slow downstream; every other reply is immediate. Latency is measured from enqueueing a
+message to publishing its reply and reported separately for the slow bulb and the rest. One lane corresponds to the
+serial per-callback processing.
+
+    python -m benchmarks.edge_link_lanes --messages 5000 --rate 5000 --lanes 16 --slow-ms 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+from src.edge_link import main as edge_link
+from .common import print_report, summarize
+
+
+class Msg:
+    __slots__ = ("subject", "data", "reply", "headers")
+
+    def __init__(self, subject: str, data: bytes, reply: str, headers: dict | None = None):
+        self.subject = subject
+        self.data = data
+        self.reply = reply
+        self.headers = headers
+
+
+class TimingNATS:
+    def __init__(self, slow_s: float):
+        self.slow_s = slow_s
+        self.enqueued: dict[str, float] = {}
+        self.latencies: dict[str, list[float]] = {"slow": [], "others": []}
+
+    async def publish(self, subject: str, payload: bytes):
+        if not subject.startswith("_INBOX."):
+            return
+
+        kind = "slow" if subject.startswith("_INBOX.slow.") else "others"
+        if kind == "slow":
+            await asyncio.sleep(self.slow_s)
+        self.latencies[kind].append(time.perf_counter() - self.enqueued.pop(subject))
+
+
+async def bench(lanes: int, args) -> dict:
+    edge_link.light_bulbs.clear()
+    for i in range(args.bulbs):
+        edge_link.light_bulbs.install(f"bulb-{i}")
+
+    nc = TimingNATS(args.slow_ms / 1000)
+    scheduler = edge_link.LaneScheduler(nc, lane_count=lanes, queue_size=args.queue_size)
+    scheduler.start()
+
+    started = time.perf_counter()
+    for i in range(args.messages):
+        delay = started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        bulb = i % args.bulbs
+        reply = f"_INBOX.{'slow.' if bulb == 0 else ''}{i}"
+        subject = "lightbulb.toggle" if i % 4 == 0 else "lightbulb.get"
+        nc.enqueued[reply] = time.perf_counter()
+        await scheduler.enqueue(Msg(subject, json.dumps({"id": f"bulb-{bulb}"}).encode(), reply))
+    await scheduler.stop()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "slow": summarize(nc.latencies["slow"], elapsed),
+        "others": summarize(nc.latencies["others"], elapsed),
+        "max_lane_depth": max(lane["max_depth"] for lane in scheduler.stats()),
+    }
+
+
+async def main(args):
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, "w"), force=True)
+    edge_link.PUBLISH_EVENTS = False
+
+    print_report({
+        "messages": args.messages,
+        "rate": args.rate,
+        "slow_ms": args.slow_ms,
+        "one_lane": await bench(1, args),
+        f"{args.lanes}_lanes": await bench(args.lanes, args),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-bulb ordered lanes in the edge link")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=5000, help="Messages enqueued per second")
+    parser.add_argument("--bulbs", type=int, default=100)
+    parser.add_argument("--lanes", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--slow-ms", type=float, default=5.0, help="Reply latency of the slow bulb")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,72 @@
+"""Compare the memory held by the legacy dict-of-dicts bulb layout with `LightbulbStore`.
+
+Each layout and size is measured in a fresh subprocess as the growth of resident memory while the bulbs are installed,
+so the bulb ID strings are counted for both layouts.
+
+    python -m benchmarks.edge_link_memory --sizes 1000000 10000000 --ctx-ratio 0.1
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+
+from .common import print_report
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+
+    # ru_maxrss is reported in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(layout: str, size: int, ctx_ratio: float) -> dict:
+    from src.edge_link.store import LightbulbStore
+
+    ctx_every = int(1 / ctx_ratio) if ctx_ratio else 0
+    before = _rss_bytes()
+
+    if layout == "dict":
+        light_bulbs = {}
+        for i in range(size):
+            light_bulbs[f"bulb-{i}"] = {"ctx": {"room": "kitchen"} if ctx_every and i % ctx_every == 0 else {}, "status": "OFF"}
+    else:
+        light_bulbs = LightbulbStore()
+        for i in range(size):
+            light_bulbs.install(f"bulb-{i}", {"room": "kitchen"} if ctx_every and i % ctx_every == 0 else None)
+
+    used = _rss_bytes() - before
+    return {"layout": layout, "bulbs": len(light_bulbs), "rss_mb": round(used / 2**20, 1), "bytes_per_bulb": round(used / size, 1)}
+
+
+def main(args):
+    results = []
+    for size in args.sizes:
+        for layout in ("dict", "store"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.edge_link_memory", "--measure", layout, "--sizes", str(size), "--ctx-ratio", str(args.ctx_ratio)],
+                check=True, capture_output=True, text=True,
+            )
+            results.append(json.loads(output.stdout))
+
+    print_report({"ctx_ratio": args.ctx_ratio, "results": results})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark edge link bulb memory layouts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--ctx-ratio", type=float, default=0.1, help="Fraction of bulbs installed with a ctx payload")
+    parser.add_argument("--measure", choices=["dict", "store"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.sizes[0], args.ctx_ratio)))
+    else:
+        main(args)
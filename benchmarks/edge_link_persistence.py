@@ -0,0 +1,102 @@
+"""Measure the cost of edge link persistence: durable write throughput and recovery time.
+
+The write benchmark runs toggles through the edge link request handling with `concurrency` messages outstanding,
+each waiting for its group commit, and reports how many fsyncs were shared. The recovery benchmark snapshots
+`--bulbs` bulbs, appends `--log-records` toggles to the log and times a cold recovery.
+
+    python -m benchmarks.edge_link_persistence --bulbs 1000000 --writes 20000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from src.edge_link import main as edge_link
+from src.edge_link.persistence import EdgeLinkPersistence
+from .common import print_report
+
+
+async def bench_writes(directory: str, writes: int, concurrency: int, commit_interval_ms: float) -> dict:
+    edge_link.light_bulbs.clear()
+    persistence = EdgeLinkPersistence(directory, commit_interval=commit_interval_ms / 1000)
+    await persistence.start(edge_link.light_bulbs)
+    edge_link.persistence = persistence
+
+    requests = [json.dumps({"id": f"bulb-{i}"}) for i in range(concurrency)]
+    for request in requests:
+        edge_link.get_response("lightbulb.install", request)
+    await persistence.sync()
+
+    fsyncs = 0
+    original_fsync = os.fsync
+
+    def counting_fsync(fd):
+        nonlocal fsyncs
+        fsyncs += 1
+        original_fsync(fd)
+
+    os.fsync = counting_fsync
+    counter = iter(range(writes))
+
+    async def _client(request: str):
+        for _ in counter:
+            edge_link.get_response("lightbulb.toggle", request)
+            await persistence.sync()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(request) for request in requests))
+    elapsed = time.perf_counter() - started
+    os.fsync = original_fsync
+
+    await persistence.close()
+    edge_link.persistence = None
+    return {"writes": writes, "concurrency": concurrency, "msgs_per_sec": round(writes / elapsed, 1), "fsyncs": fsyncs, "writes_per_fsync": round(writes / max(fsyncs, 1), 1)}
+
+
+async def bench_recovery(directory: str, bulbs: int, log_records: int) -> dict:
+    edge_link.light_bulbs.clear()
+    persistence = EdgeLinkPersistence(directory)
+    await persistence.start(edge_link.light_bulbs)
+
+    for i in range(bulbs):
+        edge_link.light_bulbs[f"bulb-{i}"] = {"ctx": {}, "status": "OFF"}
+    started = time.perf_counter()
+    await persistence.snapshot(edge_link.light_bulbs)
+    snapshot_elapsed = time.perf_counter() - started
+
+    for i in range(log_records):
+        persistence.log_status(f"bulb-{i % bulbs}", "ON")
+    await persistence.close()
+    edge_link.light_bulbs.clear()
+
+    recovered = {}
+    started = time.perf_counter()
+    EdgeLinkPersistence(directory).recover(recovered)
+    return {
+        "bulbs": len(recovered),
+        "log_records": log_records,
+        "snapshot_s": round(snapshot_elapsed, 3),
+        "recovery_s": round(time.perf_counter() - started, 3),
+    }
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as writes_dir, tempfile.TemporaryDirectory() as recovery_dir:
+        report = {
+            "writes": await bench_writes(writes_dir, args.writes, args.concurrency, args.commit_interval_ms),
+            "recovery": await bench_recovery(recovery_dir, args.bulbs, args.log_records),
+        }
+
+    print_report(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark edge link WAL and snapshot persistence")
+    parser.add_argument("--writes", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--commit-interval-ms", type=float, default=2.0)
+    parser.add_argument("--bulbs", type=int, default=1_000_000)
+    parser.add_argument("--log-records", type=int, default=100_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,67 @@
+"""Measure edge link throughput as the bulb ID space is partitioned across shard processes.
+
+Each shard process owns the IDs hashing to its index (see `src.sharding`) and runs the edge link request handling for
+an install/get/toggle workload over its partition. Aggregate throughput is reported per shard count; NATS transport is
+excluded so the numbers isolate the processing capacity that sharding scales. Scaling is bounded by available cores.
+
+    python -m benchmarks.edge_link_sharding --bulbs 50000 --rounds 4 --shards 1 2 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from src.sharding import shard_for
+from .common import print_report
+
+
+def _run_shard(shard_index: int, shard_count: int, bulbs: int, rounds: int, barrier, results):
+    from src.edge_link.main import get_response
+
+    requests = [json.dumps({"id": f"bulb-{i}"}) for i in range(bulbs) if shard_for(f"bulb-{i}", shard_count) == shard_index]
+    barrier.wait()
+
+    started = time.perf_counter()
+    for request in requests:
+        get_response("lightbulb.install", request)
+    for _ in range(rounds):
+        for request in requests:
+            get_response("lightbulb.get", request)
+            get_response("lightbulb.toggle", request)
+    results.put((len(requests) * (1 + 2 * rounds), time.perf_counter() - started))
+
+
+def bench_shard_count(shard_count: int, bulbs: int, rounds: int) -> dict:
+    barrier = multiprocessing.Barrier(shard_count)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_run_shard, args=(index, shard_count, bulbs, rounds, barrier, results))
+        for index in range(shard_count)
+    ]
+    for process in processes:
+        process.start()
+    shard_results = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    operations = sum(count for count, _ in shard_results)
+    elapsed = max(elapsed for _, elapsed in shard_results)
+    return {"shards": shard_count, "operations": operations, "elapsed_s": round(elapsed, 3), "msgs_per_sec": round(operations / elapsed, 1)}
+
+
+def main(args):
+    report = {"cpu_count": os.cpu_count(), "results": [bench_shard_count(n, args.bulbs, args.rounds) for n in args.shards]}
+    baseline = report["results"][0]["msgs_per_sec"]
+    for result in report["results"]:
+        result["speedup"] = round(result["msgs_per_sec"] / baseline, 2)
+
+    print_report(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark edge link throughput by shard count")
+    parser.add_argument("--bulbs", type=int, default=50000)
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    main(parser.parse_args())
@@ -0,0 +1,60 @@
+"""Compare per-call latency of `send_lightbulb_request` over NATS and the in-memory edge link transport.
+
+The in-memory transport is measured with JSON serialization ("memory_json") and with models handed over directly
+("memory_typed"). NATS is only measured when `--nats-url` points at a server with an edge link subscribed.
+
+    python -m benchmarks.embedded_transport --requests 20000 --concurrency 1 --nats-url nats://localhost:4222
+"""
+import argparse
+import asyncio
+import logging
+
+from src.edge_link import main as edge_link
+from src.worker.di import container
+from src.worker.services import InMemoryTransport, NATSClient
+from src.worker.utils import send_lightbulb_request
+from .common import print_report, run_closed_loop
+
+
+async def bench(client: NATSClient, args) -> dict:
+    ids = [f"bulb-{i}" for i in range(args.bulbs)]
+    with container.override.service(target=NATSClient, new=client):
+        for id in ids:
+            try:
+                await send_lightbulb_request(id, "lightbulb.install", {"room": "kitchen"})
+            except Exception:
+                # Already installed by an earlier run
+                pass
+
+        return await run_closed_loop(lambda i: send_lightbulb_request(ids[i % len(ids)], args.subject), args.requests, args.concurrency)
+
+
+async def main(args):
+    edge_link.light_bulbs.clear()
+    report = {
+        "memory_json": await bench(NATSClient("memory://", transport=InMemoryTransport(typed=False)), args),
+        "memory_typed": await bench(NATSClient("memory://", transport=InMemoryTransport(typed=True)), args),
+    }
+
+    if args.nats_url:
+        client = NATSClient(args.nats_url)
+        await client.connect()
+        try:
+            report["nats"] = await bench(client, args)
+        finally:
+            await client.close()
+
+    print_report(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark edge link transports")
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--bulbs", type=int, default=1000)
+    parser.add_argument("--subject", default="lightbulb.get", choices=("lightbulb.get", "lightbulb.toggle"))
+    parser.add_argument("--nats-url")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main(args))
@@ -0,0 +1,58 @@
+"""Benchmark `InstallationWorkflow` with its steps run as service calls vs inline in the workflow invocation.
+
+The workflow runs end to end against stand-ins: Restate is modelled by `RestateContext` with a per-journal-entry and
+per-invocation cost, and NATS requests are answered in-process by the edge link with a simulated round trip.
+
+    python -m benchmarks.installation_workflow --installs 2000 --concurrency 50 --invocation-ms 2 --journal-ms 0.5
+"""
+import argparse
+import asyncio
+
+from src.edge_link import main as edge_link
+from src.worker.di import container
+from src.worker.lightbulb_workflow import run
+from src.worker.models import InstallationInput
+from src.worker.services import NATSClient
+from .common import print_report, run_closed_loop
+from .standins import EdgeLinkNATSClient, RestateContext
+
+
+async def bench(mode: str, args) -> dict:
+    edge_link.light_bulbs.clear()
+    nats_client = EdgeLinkNATSClient(latency_ms=args.nats_ms)
+    invocations = 0
+
+    async def _install(i: int):
+        nonlocal invocations
+        ctx = RestateContext(args.journal_ms, args.invocation_ms, args.delay_scale)
+        await run(ctx, InstallationInput(id=f"{mode}-{i}", mode=mode))
+        invocations += ctx.invocations
+
+    with container.override.service(target=NATSClient, new=nats_client):
+        summary = await run_closed_loop(_install, args.installs, args.concurrency)
+
+    return {
+        "mode": mode,
+        "invocations_per_install": invocations / args.installs,
+        "nats_requests_per_install": nats_client.requests / args.installs,
+        **summary,
+    }
+
+
+async def main(args):
+    print_report({
+        "installs": args.installs,
+        "concurrency": args.concurrency,
+        "results": [await bench(mode, args) for mode in ("services", "inline")],
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark installation workflow step modes")
+    parser.add_argument("--installs", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--invocation-ms", type=float, default=2.0, help="Cost of starting an invocation for a service call")
+    parser.add_argument("--journal-ms", type=float, default=0.5, help="Cost of acknowledging a journal entry")
+    parser.add_argument("--nats-ms", type=float, default=0.5, help="Simulated NATS round trip")
+    parser.add_argument("--delay-scale", type=float, default=0.0, help="Multiplier applied to the 1-5s toggle delays")
+    asyncio.run(main(parser.parse_args()))
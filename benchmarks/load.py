@@ -0,0 +1,305 @@
+"""Generate load against the edge link, the Restate worker or the GraphQL API and report latencies as JSON.
+
+Targets:
+  edge     the edge link's request handling, in-process
+  nats     edge link requests over NATS (`--nats-url`), or an in-process stand-in
+  restate  `LightbulbManagementSvc` calls through the Restate ingress (`--restate-url`), or a stand-in ingress
+           running the worker's handlers in-process
+  graphql  GraphQL operations against the API (`--api-url`), or the API app served against the stand-in ingress
+
+Without URLs everything runs against local stand-ins, so runs can be compared between builds on one machine.
+
+    python -m benchmarks.load --target nats --loop closed --concurrency 32 --requests 20000
+    python -m benchmarks.load --target graphql --loop open --rate 500 --requests 5000 --distribution hot
+    python -m benchmarks.load --target restate --mix get=70,toggle=25,install=3,uninstall=2
+    python -m benchmarks.load --target nats --codec binary --compression-threshold 1024
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+import uuid
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable
+
+import httpx
+
+from src.api import graphql as api_graphql, restate_client as api_restate_client
+from src.api.main import app as api_app
+from src.api.restate_client import create_restate_client
+from src.codec import CODEC_NAMES, WireFormat, decode
+from src.edge_link import main as edge_link
+from src.models import LightbulbRequest, LightbulbResponse
+from src.sharding import route_subject
+from src.worker.di import container
+from src.worker.services import NATSClient
+from .common import print_report, standin_server, summarize
+from .standins import EdgeLinkNATSClient, worker_ingress_app
+
+OPERATIONS = ("install", "get", "toggle", "uninstall")
+Call = Callable[[str, str], Awaitable[bool]]
+
+GRAPHQL_OPERATIONS = {
+    "install": ("installLightbulb", "mutation ($id: String!) { installLightbulb(input: {id: $id}) { key } }"),
+    "get": ("lightbulb", "query ($id: String!) { lightbulb(id: $id) { id status } }"),
+    "toggle": ("toggleLightbulb", "mutation ($id: String!) { toggleLightbulb(id: $id) { key } }"),
+    "uninstall": ("uninstallLightbulb", "mutation ($id: String!) { uninstallLightbulb(id: $id) { key } }"),
+}
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    """Parse an operation mix such as `get=80,toggle=20` into weights"""
+    mix = {}
+    for part in text.split(","):
+        op, _, weight = part.partition("=")
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {op!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[op] = float(weight or 1)
+
+    return mix
+
+
+class KeyChooser:
+    """Picks bulb IDs uniformly, or with `hot_fraction` of picks going to the first `hot_keys` bulbs"""
+
+    def __init__(self, ids: list[str], distribution: str, hot_keys: int, hot_fraction: float, rng: random.Random):
+        self.ids = ids
+        self.distribution = distribution
+        self.hot_keys = max(1, min(hot_keys, len(ids)))
+        self.hot_fraction = hot_fraction
+        self.rng = rng
+
+    def choose(self) -> str:
+        if self.distribution == "hot" and self.rng.random() < self.hot_fraction:
+            return self.ids[self.rng.randrange(self.hot_keys)]
+
+        return self.ids[self.rng.randrange(len(self.ids))]
+
+
+@asynccontextmanager
+async def worker_standin(args) -> AsyncIterator[str]:
+    """Serve the worker's handlers behind a stand-in ingress, with NATS answered by the in-process edge link"""
+    with container.override.service(target=NATSClient, new=EdgeLinkNATSClient(args.nats_latency_ms)):
+        async with standin_server(worker_ingress_app(args.journal_ms, args.invocation_ms)) as url:
+            yield url
+
+
+def wire_format(args) -> WireFormat:
+    return WireFormat.named(args.codec, args.compression_threshold)
+
+
+@asynccontextmanager
+async def edge_target(args) -> AsyncIterator[Call]:
+    client_format = wire_format(args)
+    accept = client_format.accept_headers() or {}
+
+    async def call(op: str, id: str) -> bool:
+        payload, headers = client_format.encode(LightbulbRequest(id=id))
+        reply, reply_headers = edge_link.get_reply(f"lightbulb.{op}", payload, {**(headers or {}), **accept})
+        edge_link.take_events()
+        return decode(reply, reply_headers, LightbulbResponse).success
+
+    yield call
+
+
+@asynccontextmanager
+async def nats_target(args) -> AsyncIterator[Call]:
+    if args.nats_url:
+        client = NATSClient(args.nats_url, pool_size=args.nats_pool_size, max_in_flight=args.concurrency, default_timeout=args.timeout, wire_format=wire_format(args))
+        await client.connect()
+    else:
+        client = EdgeLinkNATSClient(args.nats_latency_ms, typed=False, wire_format=wire_format(args))
+
+    async def call(op: str, id: str) -> bool:
+        subject = route_subject(f"lightbulb.{op}", id, args.shards)
+        response = await client.request_model(subject, LightbulbRequest(id=id), LightbulbResponse)
+        return response.success
+
+    try:
+        yield call
+    finally:
+        if args.nats_url:
+            await client.close()
+
+
+@asynccontextmanager
+async def restate_target(args) -> AsyncIterator[Call]:
+    async with AsyncExitStack() as stack:
+        url = args.restate_url or await stack.enter_async_context(worker_standin(args))
+        client = await stack.enter_async_context(create_restate_client(
+            base_url=url, max_connections=args.concurrency, max_keepalive_connections=args.concurrency, timeout=args.timeout,
+        ))
+
+        async def call(op: str, id: str) -> bool:
+            response = await client.post(f"/LightbulbManagementSvc/{op}_lightbulb", json={"id": id})
+            return response.status_code == 200
+
+        yield call
+
+
+@asynccontextmanager
+async def graphql_target(args) -> AsyncIterator[Call]:
+    async with AsyncExitStack() as stack:
+        url = args.api_url
+        if not url:
+            # The API's lifespan creates its Restate client from this setting
+            api_restate_client.RESTATE_ENDPOINT = await stack.enter_async_context(worker_standin(args))
+            if not args.rate_limits:
+                # Every operation comes from this one client, which the per-client limit would throttle
+                api_graphql.admission.client_limiter.rate = 0
+                api_graphql.admission.bulb_limiter.rate = 0
+            url = await stack.enter_async_context(standin_server(api_app, lifespan="on"))
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        client = await stack.enter_async_context(httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout))
+
+        async def call(op: str, id: str) -> bool:
+            field, query = GRAPHQL_OPERATIONS[op]
+            response = await client.post("/graphql", json={"query": query, "variables": {"id": id}})
+            result = response.json()
+            return response.status_code == 200 and not result.get("errors") and result["data"][field] is not None
+
+        yield call
+
+
+TARGETS = {"edge": edge_target, "nats": nats_target, "restate": restate_target, "graphql": graphql_target}
+
+
+async def closed_loop(call: Call, plan: list[tuple[str, str]], concurrency: int) -> tuple[list[tuple[str, float, bool]], int]:
+    records = []
+    operations = iter(plan)
+
+    async def _worker():
+        for op, id in operations:
+            started = time.perf_counter()
+            try:
+                ok = await call(op, id)
+            except Exception:
+                ok = False
+            records.append((op, time.perf_counter() - started, ok))
+
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    return records, 0
+
+
+async def open_loop(call: Call, plan: list[tuple[str, str]], rate: float, max_outstanding: int) -> tuple[list[tuple[str, float, bool]], int]:
+    """Issue operations at a fixed `rate` regardless of completions.
+
+    Latency is measured from each operation's scheduled start, so a stalled target is not hidden by the generator
+    slowing down with it. Operations due while `max_outstanding` are in flight are dropped and counted.
+    """
+    records = []
+    outstanding = set()
+    dropped = 0
+
+    async def _issue(op: str, id: str, scheduled: float):
+        try:
+            ok = await call(op, id)
+        except Exception:
+            ok = False
+        records.append((op, time.perf_counter() - scheduled, ok))
+
+    started = time.perf_counter()
+    for i, (op, id) in enumerate(plan):
+        scheduled = started + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if len(outstanding) >= max_outstanding:
+            dropped += 1
+            continue
+
+        task = asyncio.create_task(_issue(op, id, scheduled))
+        outstanding.add(task)
+        task.add_done_callback(outstanding.discard)
+
+    if outstanding:
+        await asyncio.gather(*outstanding)
+    return records, dropped
+
+
+def report(records: list[tuple[str, float, bool]], elapsed: float, dropped: int) -> dict:
+    operations = {}
+    for op in OPERATIONS:
+        op_records = [record for record in records if record[0] == op]
+        if op_records:
+            operations[op] = {
+                **summarize([latency for _, latency, _ in op_records], elapsed),
+                "errors": sum(1 for _, _, ok in op_records if not ok),
+            }
+
+    return {
+        "overall": {**summarize([latency for _, latency, _ in records], elapsed), "errors": sum(1 for *_, ok in records if not ok)},
+        "dropped": dropped,
+        "operations": operations,
+    }
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    prefix = args.id_prefix or f"load-{uuid.uuid4().hex[:6]}"
+    ids = [f"{prefix}-{i}" for i in range(args.bulbs)]
+    chooser = KeyChooser(ids, args.distribution, args.hot_keys, args.hot_fraction, rng)
+    ops, weights = zip(*args.mix.items())
+    plan = [(op, chooser.choose()) for op in rng.choices(ops, weights, k=args.requests)]
+
+    async with TARGETS[args.target](args) as call:
+        if args.preinstall:
+            await closed_loop(call, [("install", id) for id in ids], args.concurrency)
+
+        started = time.perf_counter()
+        if args.loop == "open":
+            records, dropped = await open_loop(call, plan, args.rate, args.max_outstanding)
+        else:
+            records, dropped = await closed_loop(call, plan, args.concurrency)
+        elapsed = time.perf_counter() - started
+
+    print_report({
+        "target": args.target,
+        "loop": args.loop,
+        "concurrency": args.concurrency if args.loop == "closed" else None,
+        "rate": args.rate if args.loop == "open" else None,
+        "distribution": args.distribution,
+        "mix": args.mix,
+        "bulbs": args.bulbs,
+        "elapsed_s": round(elapsed, 3),
+        **report(records, elapsed, dropped),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the lightbulb system")
+    parser.add_argument("--target", choices=TARGETS, default="nats")
+    parser.add_argument("--loop", choices=("closed", "open"), default="closed")
+    parser.add_argument("--requests", type=int, default=10_000, help="Operations issued after the optional pre-install")
+    parser.add_argument("--concurrency", type=int, default=32, help="Closed loop workers (also sizes connection pools)")
+    parser.add_argument("--rate", type=float, default=1000, help="Open loop operations per second")
+    parser.add_argument("--max-outstanding", type=int, default=10_000, help="Open loop in-flight limit before dropping")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("get=80,toggle=20"), help="Operation weights, e.g. get=70,toggle=25,install=3,uninstall=2")
+    parser.add_argument("--bulbs", type=int, default=1000, help="Number of distinct bulb IDs")
+    parser.add_argument("--distribution", choices=("uniform", "hot"), default="uniform")
+    parser.add_argument("--hot-keys", type=int, default=10, help="Number of hot bulbs for the hot distribution")
+    parser.add_argument("--hot-fraction", type=float, default=0.9, help="Share of operations going to the hot bulbs")
+    parser.add_argument("--no-preinstall", dest="preinstall", action="store_false", help="Skip installing every bulb before measuring")
+    parser.add_argument("--id-prefix", help="Bulb ID prefix, random by default so runs against live systems do not collide")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=15)
+    parser.add_argument("--nats-url", help="NATS server for the nats target, in-process stand-in if omitted")
+    parser.add_argument("--nats-pool-size", type=int, default=1)
+    parser.add_argument("--shards", type=int, default=1, help="Edge link shard count for subject routing")
+    parser.add_argument("--codec", choices=CODEC_NAMES, default="json", help="Wire format of the edge and nats targets")
+    parser.add_argument("--compression-threshold", type=int, help="Compress edge and nats payloads of at least this many bytes")
+    parser.add_argument("--restate-url", help="Restate ingress for the restate target, stand-in if omitted")
+    parser.add_argument("--api-url", help="API base URL for the graphql target, stand-in if omitted")
+    parser.add_argument("--rate-limits", action="store_true", help="Keep the stand-in API's rate limits, which count rejections as errors")
+    parser.add_argument("--nats-latency-ms", type=float, default=0.0, help="Simulated NATS round trip of the stand-ins")
+    parser.add_argument("--journal-ms", type=float, default=0.0, help="Simulated journal entry cost of the stand-in ingress")
+    parser.add_argument("--invocation-ms", type=float, default=0.0, help="Simulated invocation cost of the stand-in ingress")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    asyncio.run(main(args))
@@ -0,0 +1,46 @@
+"""Compare `Query.lightbulb` read latency of the "output" (call + output fetch) and "direct" (single exchange) modes.
+
+Runs against a local stand-in ingress with a simulated per-request latency by default; pass `--endpoint` to target a
+real Restate server.
+
+    python -m benchmarks.read_path --requests 2000 --concurrency 16 --latency-ms 2
+"""
+import argparse
+import asyncio
+
+from src.api.graphql import fetch_lightbulb
+from src.api.restate_client import create_restate_client
+from .common import print_report, run_closed_loop, standin_server
+from .standins import restate_ingress_app
+
+
+async def bench_read_mode(endpoint: str, read_mode: str, dedup: bool, requests: int, concurrency: int) -> dict:
+    async with create_restate_client(base_url=endpoint, max_connections=concurrency, max_keepalive_connections=concurrency) as client:
+        return await run_closed_loop(lambda i: fetch_lightbulb(client, f"bulb-{i}", read_mode=read_mode, dedup=dedup), requests, concurrency)
+
+
+async def run_all(endpoint: str, args) -> dict:
+    return {
+        "output": await bench_read_mode(endpoint, "output", True, args.requests, args.concurrency),
+        "direct_dedup": await bench_read_mode(endpoint, "direct", True, args.requests, args.concurrency),
+        "direct": await bench_read_mode(endpoint, "direct", False, args.requests, args.concurrency),
+    }
+
+
+async def main(args):
+    if args.endpoint:
+        report = await run_all(args.endpoint, args)
+    else:
+        async with standin_server(restate_ingress_app(args.latency_ms)) as endpoint:
+            report = await run_all(endpoint, args)
+
+    print_report(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Query.lightbulb read modes")
+    parser.add_argument("--endpoint", type=str, default=None, help="Restate ingress URL; a local stand-in is used if omitted")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="Simulated per-request latency of the stand-in")
+    asyncio.run(main(parser.parse_args()))
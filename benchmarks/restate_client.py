@@ -0,0 +1,64 @@
+"""Compare Restate ingress latency for a fresh client per call against the shared, pooled client.
+
+Runs against a local stand-in ingress by default; pass `--endpoint` to target a real Restate server.
+
+    python -m benchmarks.restate_client --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+
+import httpx
+
+from src.api.graphql import call_restate, get_restate_output
+from src.api.restate_client import create_restate_client
+from .common import print_report, run_closed_loop, standin_server
+from .standins import restate_ingress_app
+
+
+async def _lightbulb_query(client: httpx.AsyncClient, bulb_id: str):
+    # Mirrors the "output" read mode of Query.lightbulb: one handler call and one output fetch
+    key = await call_restate(client, "LightbulbManagementSvc", "get_lightbulb", {"id": bulb_id})
+    await get_restate_output(client, key, "LightbulbManagementSvc", "get_lightbulb")
+
+
+async def bench_per_call_client(endpoint: str, requests: int, concurrency: int) -> dict:
+    async def _operation(i: int):
+        # Previous behavior: every ingress call opened its own client and connection
+        async with httpx.AsyncClient(base_url=endpoint, timeout=15) as client:
+            key = await call_restate(client, "LightbulbManagementSvc", "get_lightbulb", {"id": f"bulb-{i}"})
+        async with httpx.AsyncClient(base_url=endpoint) as client:
+            await get_restate_output(client, key, "LightbulbManagementSvc", "get_lightbulb")
+
+    return await run_closed_loop(_operation, requests, concurrency)
+
+
+async def bench_pooled_client(endpoint: str, requests: int, concurrency: int, http2: bool) -> dict:
+    async with create_restate_client(base_url=endpoint, max_connections=concurrency, max_keepalive_connections=concurrency, http2=http2) as client:
+        return await run_closed_loop(lambda i: _lightbulb_query(client, f"bulb-{i}"), requests, concurrency)
+
+
+async def main(args):
+    if args.endpoint:
+        endpoint = args.endpoint
+        report = {
+            "per_call_client": await bench_per_call_client(endpoint, args.requests, args.concurrency),
+            "pooled_client": await bench_pooled_client(endpoint, args.requests, args.concurrency, args.http2),
+        }
+    else:
+        async with standin_server(restate_ingress_app(args.latency_ms)) as endpoint:
+            report = {
+                "per_call_client": await bench_per_call_client(endpoint, args.requests, args.concurrency),
+                "pooled_client": await bench_pooled_client(endpoint, args.requests, args.concurrency, args.http2),
+            }
+
+    print_report(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-call vs pooled Restate ingress clients")
+    parser.add_argument("--endpoint", type=str, default=None, help="Restate ingress URL; a local stand-in is used if omitted")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated handler latency of the stand-in")
+    parser.add_argument("--http2", action="store_true", help="Use HTTP/2 prior knowledge (real Restate ingress only)")
+    asyncio.run(main(parser.parse_args()))
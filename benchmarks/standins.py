@@ -0,0 +1,200 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from restate.exceptions import TerminalError
+
+from src.codec import WireFormat
+from src.worker import lightbulb_service, lightbulb_workflow
+from src.worker.models import InstallationInput, LightbulbDataIo, LightbulbIdInput, LightbulbIdsInput
+from src.worker.services import InMemoryTransport, NATSClient
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+    return body
+
+
+async def _send_json(send, status: int, payload: bytes):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+def restate_ingress_app(latency_ms: float = 0.0):
+    """A minimal ASGI stand-in for the Restate ingress.
+
+    Every handler call returns a successful lightbulb response for the posted ID, and the invocation output endpoint
+    returns the same payload for any idempotency key.
+    """
+
+    async def _app(scope, receive, send):
+        assert scope["type"] == "http"
+        body = await _read_body(receive)
+
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+        request = json.loads(body) if body else {}
+        bulb_id = request.get("id", "standin")
+        payload = json.dumps({"success": True, "id": bulb_id, "data": {"ctx": {}, "status": "OFF"}}).encode()
+        await _send_json(send, 200, payload)
+
+    return _app
+
+
+def worker_ingress_app(journal_ms: float = 0.0, invocation_ms: float = 0.0, delay_scale: float = 0.0):
+    """An ASGI stand-in for the Restate ingress that runs the worker's handlers in-process.
+
+    `LightbulbManagementSvc` handlers and the `InstallationWorkflow` are invoked with a `RestateContext`, so requests
+    exercise the real handler code. Requires the worker container's `NATSClient` to be overridden, e.g. with
+    `EdgeLinkNATSClient`. `/send` calls run in the background and return immediately.
+    """
+    handlers = {
+        "install_lightbulb": (lightbulb_service.install_lightbulb, LightbulbDataIo),
+        "get_lightbulb": (lightbulb_service.get_lightbulb, LightbulbIdInput),
+        "get_lightbulbs": (lightbulb_service.get_lightbulbs, LightbulbIdsInput),
+        "toggle_lightbulb": (lightbulb_service.toggle_lightbulb, LightbulbIdInput),
+        "uninstall_lightbulb": (lightbulb_service.uninstall_lightbulb, LightbulbIdInput),
+    }
+    background = set()
+
+    def _resolve(path: list[str]):
+        match path:
+            case ["LightbulbManagementSvc", handler_name, *rest] if handler_name in handlers:
+                return *handlers[handler_name], rest
+            case ["InstallationWorkflow", _, "run", *rest]:
+                return lightbulb_workflow.run, InstallationInput, rest
+
+        return None
+
+    async def _app(scope, receive, send):
+        assert scope["type"] == "http"
+        body = await _read_body(receive)
+
+        resolved = _resolve(scope["path"].strip("/").split("/"))
+        if resolved is None:
+            await _send_json(send, 404, b'{"message": "Not found"}')
+            return
+
+        handler, input_model, rest = resolved
+        ctx = RestateContext(journal_ms, invocation_ms, delay_scale)
+        invocation = handler(ctx, input_model.model_validate_json(body or b"{}"))
+        if rest == ["send"]:
+            task = asyncio.ensure_future(invocation)
+            background.add(task)
+            task.add_done_callback(background.discard)
+            await _send_json(send, 200, b'{"invocationId": "standin", "status": "Accepted"}')
+            return
+
+        try:
+            result = await invocation
+        except TerminalError as e:
+            await _send_json(send, 500, json.dumps({"message": e.message}).encode())
+            return
+
+        payload = result.model_dump_json().encode() if hasattr(result, "model_dump_json") else json.dumps(result).encode()
+        await _send_json(send, 200, payload)
+
+    return _app
+
+
+class DelayedInMemoryTransport(InMemoryTransport):
+    """`InMemoryTransport` with `latency_ms` added to every request to simulate the NATS round trip"""
+
+    def __init__(self, latency_ms: float = 0.0, typed: bool = True):
+        super().__init__(typed)
+        self.latency_ms = latency_ms
+
+    async def request(self, subject: str, payload: bytes, timeout: float, headers: dict[str, str] | None = None) -> tuple[bytes, dict[str, str] | None]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return await super().request(subject, payload, timeout, headers)
+
+    async def request_model(self, subject: str, request):
+        await asyncio.sleep(self.latency_ms / 1000)
+        return await super().request_model(subject, request)
+
+
+class EdgeLinkNATSClient(NATSClient):
+    """The worker's `NATSClient` answered by the edge link in this process.
+
+    `latency_ms` simulates the NATS round trip; with `typed` models are exchanged without serialization, otherwise
+    they are encoded in `wire_format`.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, typed: bool = True, wire_format: WireFormat | None = None):
+        transport = DelayedInMemoryTransport(latency_ms, typed) if latency_ms else InMemoryTransport(typed)
+        super().__init__("memory://", max_in_flight=1 << 20, max_queue=1 << 20, transport=transport, wire_format=wire_format)
+
+    @property
+    def requests(self) -> int:
+        return self.stats.requests
+
+
+class RestateContext:
+    """Stand-in for a Restate handler context.
+
+    Every `ctx.run` entry costs `journal_ms` (the runtime acknowledging the journal entry) and every
+    `ctx.service_call` costs `invocation_ms` on top of running the handler in a fresh context, modelling the separate
+    invocation Restate starts for it. `ctx.sleep` waits the timer scaled by `delay_scale`.
+    """
+
+    def __init__(self, journal_ms: float = 0.0, invocation_ms: float = 0.0, delay_scale: float = 0.0, key: str | None = None):
+        self.journal_ms = journal_ms
+        self.invocation_ms = invocation_ms
+        self.delay_scale = delay_scale
+        self.state = {}
+        self.invocations = 1
+        self._key = key
+        self._background = set()
+
+    def key(self) -> str:
+        return self._key
+
+    def request(self) -> SimpleNamespace:
+        return SimpleNamespace(id="", headers={}, attempt_headers={}, body=b"")
+
+    async def run(self, name, action, serde=None, max_attempts=None):
+        result = action()
+        if asyncio.iscoroutine(result):
+            result = await result
+        if self.journal_ms:
+            await asyncio.sleep(self.journal_ms / 1000)
+        return result
+
+    async def sleep(self, delta):
+        await asyncio.sleep(delta.total_seconds() * self.delay_scale)
+
+    async def get(self, name):
+        return self.state.get(name)
+
+    def set(self, name, value):
+        self.state[name] = value
+
+    def clear(self, name):
+        self.state.pop(name, None)
+
+    def object_send(self, handler, key, arg):
+        """Run a one-way call in the background; object state is not kept between calls"""
+        child = RestateContext(self.journal_ms, self.invocation_ms, self.delay_scale, key)
+        task = asyncio.ensure_future(handler(child) if arg is None else handler(child, arg))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        self.invocations += 1
+
+    async def service_call(self, handler, arg):
+        if self.invocation_ms:
+            await asyncio.sleep(self.invocation_ms / 1000)
+        child = RestateContext(self.journal_ms, self.invocation_ms, self.delay_scale)
+        result = await handler(child, arg)
+        self.invocations += child.invocations
+        return result
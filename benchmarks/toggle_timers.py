@@ -0,0 +1,126 @@
+"""Load test how many concurrent `toggle_lightbulb` invocations one worker process sustains.
+
+A worker has a fixed number of invocation slots (`--capacity`, standing in for its concurrent stream limit). In
+"sleep" mode the toggle delay is spent inside the invocation, as with the previous `asyncio.sleep`, so every toggle
+holds its slot for the whole delay. In "timer" mode the delay is a durable timer: the invocation suspends, releases
+its slot and is re-invoked to replay its journal once the timer fires, like Restate does with `ctx.sleep`.
+
+Toggle delays (1-5s) are scaled by `--delay-scale` to keep runs short. NATS is served in-process by the edge link.
+
+    python -m benchmarks.toggle_timers --capacity 100 --toggles 200 1000 5000
+"""
+import argparse
+import asyncio
+import inspect
+import time
+from datetime import timedelta
+
+from src.edge_link import main as edge_link
+from src.worker.di import container
+from src.worker.lightbulb_service import toggle_lightbulb
+from src.worker.models import LightbulbIdInput
+from src.worker.services import NATSClient
+from .common import print_report
+from .standins import EdgeLinkNATSClient, RestateContext
+
+
+class Suspended(Exception):
+    def __init__(self, entry: int, delay: float):
+        self.entry = entry
+        self.delay = delay
+
+
+class StandInContext:
+    """Journals `ctx.run` results and emulates `ctx.sleep` either in-process or as a suspending durable timer"""
+
+    def __init__(self, mode: str, delay_scale: float):
+        self.mode = mode
+        self.delay_scale = delay_scale
+        self.journal = []
+        self.position = 0
+        self.fired_timers = set()
+
+    request = RestateContext.request
+
+    async def run(self, name, action, serde=None, max_attempts=None):
+        if self.position < len(self.journal):
+            value = self.journal[self.position]
+        else:
+            value = await action() if inspect.iscoroutinefunction(action) else action()
+            self.journal.append(value)
+        self.position += 1
+        return value
+
+    async def sleep(self, delta: timedelta):
+        entry = self.position
+        self.position += 1
+        delay = delta.total_seconds() * self.delay_scale
+        if self.mode == "sleep":
+            await asyncio.sleep(delay)
+        elif entry not in self.fired_timers:
+            raise Suspended(entry, delay)
+
+
+async def bench(mode: str, toggles: int, capacity: int, delay_scale: float) -> dict:
+    slots = asyncio.Semaphore(capacity)
+    in_progress = 0
+    peak_in_progress = 0
+    peak_slots = 0
+    used_slots = 0
+
+    async def _invoke(i: int):
+        nonlocal in_progress, peak_in_progress, used_slots, peak_slots
+        ctx = StandInContext(mode, delay_scale)
+        in_progress += 1
+        peak_in_progress = max(peak_in_progress, in_progress)
+        try:
+            while True:
+                async with slots:
+                    used_slots += 1
+                    peak_slots = max(peak_slots, used_slots)
+                    try:
+                        ctx.position = 0
+                        return await toggle_lightbulb(ctx, LightbulbIdInput(id=f"bulb-{i}"))
+                    except Suspended as e:
+                        suspended = e
+                    finally:
+                        used_slots -= 1
+                # The slot is free while the timer runs
+                await asyncio.sleep(suspended.delay)
+                ctx.fired_timers.add(suspended.entry)
+        finally:
+            in_progress -= 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_invoke(i) for i in range(toggles)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "mode": mode,
+        "toggles": toggles,
+        "elapsed_s": round(elapsed, 3),
+        "toggles_per_sec": round(toggles / elapsed, 1),
+        "peak_concurrent_toggles": peak_in_progress if mode == "timer" else peak_slots,
+        "peak_slots_used": peak_slots,
+    }
+
+
+async def main(args):
+    results = []
+    with container.override.service(target=NATSClient, new=EdgeLinkNATSClient()):
+        for toggles in args.toggles:
+            for mode in ("sleep", "timer"):
+                edge_link.light_bulbs.clear()
+                for i in range(toggles):
+                    edge_link.light_bulbs.install(f"bulb-{i}")
+                results.append(await bench(mode, toggles, args.capacity, args.delay_scale))
+
+    print_report({"capacity": args.capacity, "delay_scale": args.delay_scale, "results": results})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test toggles with in-handler sleeps vs durable timers")
+    parser.add_argument("--capacity", type=int, default=100, help="Concurrent invocations one worker process can hold")
+    parser.add_argument("--toggles", type=int, nargs="+", default=[200, 1000, 5000])
+    parser.add_argument("--delay-scale", type=float, default=0.01, help="Multiplier applied to the 1-5s toggle delays")
+    asyncio.run(main(parser.parse_args()))
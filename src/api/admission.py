@@ -0,0 +1,156 @@
+import math
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Iterable, Optional
+
+from graphql import GraphQLError
+
+from src import metrics
+
+REJECTED = metrics.counter("graphql_admission_rejected_total", "Operations rejected before calling Restate", ("reason",))
+
+
+class AdmissionError(GraphQLError):
+    """Returned as a GraphQL error whose `extensions` carry a `code` and, unless retrying cannot help, a `retryAfterMs`
+    hint for clients"""
+
+    def __init__(self, message: str, code: str, retry_after: Optional[float], **extensions):
+        if retry_after is not None:
+            extensions = {"retryAfterMs": math.ceil(retry_after * 1000), **extensions}
+        super().__init__(message, extensions={"code": code, **extensions})
+
+
+class RateLimiter:
+    """Token buckets per key, refilled at `rate` tokens per second up to `burst`.
+
+    At most `max_keys` buckets are kept. The least recently used one is evicted to make room, which only forgets that
+    key's spent tokens, so memory stays bounded however many bulb IDs or clients show up. A `rate` of 0 admits everything.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_keys = max_keys
+        self.clock = clock
+        # Per key: the tokens left and when they were counted
+        self.buckets: OrderedDict[str, list[float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+    def wait(self, key: str, tokens: float = 1) -> float:
+        """Return 0 if `key` has `tokens` available and otherwise the seconds until it will, without taking any"""
+        if self.rate <= 0:
+            return 0.0
+
+        now = self.clock()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [self.burst, now]
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        return 0.0 if bucket[0] >= tokens else (tokens - bucket[0]) / self.rate
+
+    def acquire(self, key: str, tokens: float = 1) -> float:
+        """Take `tokens` for `key`, returning 0 if they were available and otherwise the seconds until they will be"""
+        wait = self.wait(key, tokens)
+        if not wait and self.rate > 0:
+            self.buckets[key][0] -= tokens
+        return wait
+
+
+class LoadShedder:
+    """Sheds new work while too many Restate calls are in flight or Restate answers slowly.
+
+    Latency is a moving average over read-only calls only, since synchronous mutations include the durable timers
+    of their handlers. Reads keep being admitted, so the average recovers once Restate does; an average older than
+    `window` seconds is ignored either way. A limit of 0 disables that check.
+    """
+
+    def __init__(self, max_in_flight: int, max_latency: float, window: float = 10.0, alpha: float = 0.2, clock: Callable[[], float] = time.monotonic):
+        self.max_in_flight = max_in_flight
+        self.max_latency = max_latency
+        self.window = window
+        self.alpha = alpha
+        self.clock = clock
+        self.in_flight = 0
+        self.latency = 0.0
+        self.latency_updated = -math.inf
+
+    def started(self):
+        self.in_flight += 1
+
+    def finished(self, latency: Optional[float] = None):
+        self.in_flight -= 1
+        if latency is not None:
+            now = self.clock()
+            fresh = now - self.latency_updated <= self.window
+            self.latency = self.latency + self.alpha * (latency - self.latency) if fresh else latency
+            self.latency_updated = now
+
+    def overloaded(self) -> Optional[str]:
+        """The reason to shed new work, `None` if it can be admitted"""
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return "in_flight"
+        if self.max_latency and self.latency > self.max_latency and self.clock() - self.latency_updated <= self.window:
+            return "latency"
+        return None
+
+
+class AdmissionController:
+    """Decides whether an operation may call Restate, failing fast with an `AdmissionError` when it may not.
+
+    Single bulb operations take one token from the client's bucket. Bulk operations take one token per bulb from the
+    client's bucket in `bulk_limiter` instead, whose burst is the largest batch a client may submit.
+    """
+
+    def __init__(self, bulb_limiter: RateLimiter, client_limiter: RateLimiter, shedder: LoadShedder, shed_retry_after: float = 1.0, bulk_limiter: Optional[RateLimiter] = None):
+        self.bulb_limiter = bulb_limiter
+        self.client_limiter = client_limiter
+        self.shedder = shedder
+        self.shed_retry_after = shed_retry_after
+        # Without one, bulk operations are not limited per client
+        self.bulk_limiter = bulk_limiter if bulk_limiter is not None else RateLimiter(0, 1, 0)
+
+    def admit(self, client_id: str, bulb_ids: Iterable[str] = (), bulk: bool = False):
+        """Admit an operation on `bulb_ids`, charging each bulb a token and the client its cost.
+
+        Nothing is charged unless every limit admits the operation, so a rejected operation does not use up its
+        bulbs' tokens. A bulk operation larger than the bulk burst could never be admitted and is rejected outright.
+        """
+        reason = self.shedder.overloaded()
+        if reason is not None:
+            REJECTED.inc(reason)
+            raise AdmissionError("Service is overloaded, retry later", "OVERLOADED", self.shed_retry_after, reason=reason)
+
+        bulbs = Counter(bulb_ids)
+        if bulk:
+            client_limiter, cost, scope = self.bulk_limiter, max(1, sum(bulbs.values())), "bulk"
+        else:
+            client_limiter, cost, scope = self.client_limiter, 1, "client"
+        if client_limiter.rate > 0 and cost > client_limiter.burst:
+            REJECTED.inc("batch")
+            raise AdmissionError(
+                f"Too many lightbulbs in one request, at most {math.floor(client_limiter.burst)} are allowed",
+                "BATCH_TOO_LARGE", None, maxBatchSize=math.floor(client_limiter.burst),
+            )
+
+        for bulb_id, count in bulbs.items():
+            wait = self.bulb_limiter.wait(bulb_id, count)
+            if wait:
+                REJECTED.inc("bulb")
+                raise AdmissionError(f"Too many requests for lightbulb {bulb_id}", "RATE_LIMITED", wait, scope="bulb", id=bulb_id)
+
+        wait = client_limiter.wait(client_id, cost)
+        if wait:
+            REJECTED.inc(scope)
+            raise AdmissionError("Too many requests from this client", "RATE_LIMITED", wait, scope=scope)
+
+        for bulb_id, count in bulbs.items():
+            self.bulb_limiter.acquire(bulb_id, count)
+        client_limiter.acquire(client_id, cost)
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from typing import AsyncIterator
+
+from src.models import LightbulbEvent
+
+logger = logging.getLogger(__name__)
+
+
+class SlowConsumerError(Exception):
+    """Raised to a subscriber that fell `queue_size` events behind and was dropped"""
+
+
+class LightbulbSubscription:
+    def __init__(self, broadcaster: "LightbulbBroadcaster", ids: set[str], queue_size: int):
+        self.broadcaster = broadcaster
+        self.ids = ids
+        self.dropped = False
+        self.queue: asyncio.Queue[LightbulbEvent | None] = asyncio.Queue(queue_size)
+
+    def offer(self, event: LightbulbEvent) -> bool:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Free the buffered events and leave only the marker waking the consumer up to fail
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+
+        return True
+
+    async def __aiter__(self) -> AsyncIterator[LightbulbEvent]:
+        try:
+            while (event := await self.queue.get()) is not None:
+                yield event
+        finally:
+            self.broadcaster.unsubscribe(self)
+
+        raise SlowConsumerError("Dropped for not keeping up with lightbulb status updates")
+
+
+class LightbulbBroadcaster:
+    """Fans bulb state change events out to live subscribers.
+
+    Subscribers are indexed by bulb ID, so an event only touches the subscriptions watching that bulb. Each
+    subscription buffers at most `queue_size` events; publishing never waits on a subscriber, and one that falls
+    behind is dropped so the others keep receiving updates.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._subscriptions: dict[str, set[LightbulbSubscription]] = {}
+
+    def subscriber_count(self) -> int:
+        return len({subscription for subscriptions in self._subscriptions.values() for subscription in subscriptions})
+
+    def subscribe(self, ids: list[str]) -> LightbulbSubscription:
+        subscription = LightbulbSubscription(self, set(ids), self.queue_size)
+        for id in subscription.ids:
+            self._subscriptions.setdefault(id, set()).add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: LightbulbSubscription):
+        for id in subscription.ids:
+            subscriptions = self._subscriptions.get(id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[id]
+
+    def publish(self, event: LightbulbEvent):
+        for subscription in list(self._subscriptions.get(event.id, ())):
+            if not subscription.offer(event):
+                self.dropped += 1
+                logger.warning("Dropping a slow lightbulb status subscriber")
+                self.unsubscribe(subscription)
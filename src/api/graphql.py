@@ -1,19 +1,116 @@
+import asyncio
+import dataclasses
 import hashlib
+import inspect
 import json
 import logging
 import os
 import time
 import math
+import re
 
 import httpx
 import strawberry
+from strawberry.dataloader import DataLoader
+from strawberry.extensions import SchemaExtension
 from strawberry.scalars import JSON
 from enum import Enum
-from typing import Literal, Optional
+from typing import AsyncGenerator, Literal, Optional
+from urllib.parse import quote
+
+from src import metrics, tracing
+from .admission import AdmissionController, LoadShedder, RateLimiter
+from .broadcaster import LightbulbBroadcaster
+from .singleflight import SingleFlight
+from .status_view import LightbulbStatusView
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-RESTATE_ENDPOINT = os.getenv("RESTATE_ENDPOINT")
+
+# "direct" reads the handler result from the call response, "output" fetches it from the invocation output endpoint
+LIGHTBULB_READ_MODE = os.getenv("LIGHTBULB_READ_MODE", "direct")
+LIGHTBULB_READ_DEDUP = os.getenv("LIGHTBULB_READ_DEDUP", "true").lower() in ("1", "true", "yes")
+# Maximum number of IDs coalesced into one `get_lightbulbs` invocation
+LIGHTBULB_BATCH_SIZE = int(os.getenv("LIGHTBULB_BATCH_SIZE", "100"))
+# "services" runs each installation step as its own invocation, "inline" runs them inside the workflow invocation
+LIGHTBULB_INSTALL_MODE = os.getenv("LIGHTBULB_INSTALL_MODE", "services")
+# Default number of child installations a bulk installation runs at once
+LIGHTBULB_BULK_CONCURRENCY = int(os.getenv("LIGHTBULB_BULK_CONCURRENCY", "50"))
+# Most child installations a caller may ask a bulk installation to run at once
+LIGHTBULB_BULK_MAX_CONCURRENCY = int(os.getenv("LIGHTBULB_BULK_MAX_CONCURRENCY", "200"))
+# "service" calls the stateless LightbulbManagementSvc, "object" calls the bulb's keyed Lightbulb object, which
+# serves reads from its cached state
+LIGHTBULB_ROUTING = os.getenv("LIGHTBULB_ROUTING", "service")
+# Share one upstream call between identical concurrent calls to handlers whose policy allows it
+LIGHTBULB_COALESCE = os.getenv("LIGHTBULB_COALESCE", "true").lower() in ("1", "true", "yes")
+# Return from the single bulb mutations as soon as Restate has accepted the invocation instead of once it completed;
+# clients wait for the outcome with `invocationResult`
+LIGHTBULB_ASYNC_MUTATIONS = os.getenv("LIGHTBULB_ASYNC_MUTATIONS", "false").lower() in ("1", "true", "yes")
+# Longest an upstream attachment to an invocation is held open, which also caps `invocationResult`'s `timeoutMs`
+LIGHTBULB_ATTACH_TIMEOUT = float(os.getenv("LIGHTBULB_ATTACH_TIMEOUT", "30"))
+# Token buckets limiting mutations per bulb ID and per client, in operations per second; a rate of 0 disables a limit
+LIGHTBULB_BULB_RATE_LIMIT = float(os.getenv("LIGHTBULB_BULB_RATE_LIMIT", "2"))
+LIGHTBULB_BULB_RATE_BURST = float(os.getenv("LIGHTBULB_BULB_RATE_BURST", "5"))
+LIGHTBULB_CLIENT_RATE_LIMIT = float(os.getenv("LIGHTBULB_CLIENT_RATE_LIMIT", "100"))
+LIGHTBULB_CLIENT_RATE_BURST = float(os.getenv("LIGHTBULB_CLIENT_RATE_BURST", "200"))
+# Bulk installations are limited per client in bulbs per second; the burst is also the largest batch accepted
+LIGHTBULB_BULK_RATE_LIMIT = float(os.getenv("LIGHTBULB_BULK_RATE_LIMIT", "1000"))
+LIGHTBULB_BULK_RATE_BURST = float(os.getenv("LIGHTBULB_BULK_RATE_BURST", "100000"))
+# Buckets kept per limit before the least recently used are evicted
+LIGHTBULB_RATE_LIMIT_MAX_KEYS = int(os.getenv("LIGHTBULB_RATE_LIMIT_MAX_KEYS", "100000"))
+# Mutations are shed while this many Restate calls are in flight or reads average this latency; 0 disables a check
+LIGHTBULB_SHED_MAX_IN_FLIGHT = int(os.getenv("LIGHTBULB_SHED_MAX_IN_FLIGHT", "1000"))
+LIGHTBULB_SHED_MAX_LATENCY_MS = float(os.getenv("LIGHTBULB_SHED_MAX_LATENCY_MS", "2000"))
+
+
+@dataclasses.dataclass(frozen=True)
+class HandlerPolicy:
+    # Identical calls within the same window share an idempotency key
+    time_window_seconds: int = 30
+    # Whether identical concurrent calls share one upstream request. Calls to handlers that are not read-only are only
+    # coalesced when they carry the idempotency key, since Restate would deduplicate them anyway.
+    coalesce: bool = False
+    read_only: bool = False
+
+
+DEFAULT_HANDLER_POLICY = HandlerPolicy()
+# Keyed by `(service, handler)`; keyed services and workflows are listed by name, without their key
+HANDLER_POLICIES: dict[tuple[str, str], HandlerPolicy] = {
+    ("LightbulbManagementSvc", "get_lightbulb"): HandlerPolicy(time_window_seconds=5, coalesce=True, read_only=True),
+    ("Lightbulb", "get"): HandlerPolicy(time_window_seconds=5, coalesce=True, read_only=True),
+    ("LightbulbManagementSvc", "get_lightbulbs"): HandlerPolicy(coalesce=True, read_only=True),
+    ("LightbulbManagementSvc", "toggle_lightbulb"): HandlerPolicy(time_window_seconds=20, coalesce=True),
+    ("Lightbulb", "toggle"): HandlerPolicy(time_window_seconds=20, coalesce=True),
+    ("LightbulbManagementSvc", "uninstall_lightbulb"): HandlerPolicy(coalesce=True),
+    ("Lightbulb", "uninstall"): HandlerPolicy(coalesce=True),
+    ("BulkInstallationWorkflow", "get_progress"): HandlerPolicy(coalesce=True, read_only=True),
+    ("BulkInstallationWorkflow", "get_failures"): HandlerPolicy(coalesce=True, read_only=True),
+}
+
+
+def handler_policy(service_or_workflow_name: str, handler_name: str) -> HandlerPolicy:
+    return HANDLER_POLICIES.get((service_or_workflow_name.split("/")[0], handler_name), DEFAULT_HANDLER_POLICY)
+
+
+RESOLVER_DURATION = metrics.histogram("graphql_resolver_duration_seconds", "Duration of root field resolvers", ("type", "field"))
+RESOLVER_ERRORS = metrics.counter("graphql_resolver_errors_total", "Root field resolvers that raised", ("type", "field"))
+
+restate_calls = SingleFlight()
+load_shedder = LoadShedder(LIGHTBULB_SHED_MAX_IN_FLIGHT, LIGHTBULB_SHED_MAX_LATENCY_MS / 1000)
+admission = AdmissionController(
+    RateLimiter(LIGHTBULB_BULB_RATE_LIMIT, LIGHTBULB_BULB_RATE_BURST, LIGHTBULB_RATE_LIMIT_MAX_KEYS),
+    RateLimiter(LIGHTBULB_CLIENT_RATE_LIMIT, LIGHTBULB_CLIENT_RATE_BURST, LIGHTBULB_RATE_LIMIT_MAX_KEYS),
+    load_shedder,
+    bulk_limiter=RateLimiter(LIGHTBULB_BULK_RATE_LIMIT, LIGHTBULB_BULK_RATE_BURST, LIGHTBULB_RATE_LIMIT_MAX_KEYS),
+)
+metrics.gauge("restate_calls_in_flight", "Restate ingress calls awaiting a response", lambda: load_shedder.in_flight)
+# Every waiter for the same invocation shares one upstream attachment
+invocation_attachments = SingleFlight()
+
+# Result keys are the invocation's path below Restate's `/restate/` ingress API
+RESULT_KEY = re.compile(r"(invocation/[^/]+(/[^/]+){2,3}|workflow/[^/]+/[^/]+)")
+# Bulk installation keys are the hex SHA-256 idempotency keys `install_lightbulbs` generates
+BULK_INSTALLATION_KEY = re.compile(r"[0-9a-f]{64}")
 
 
 def generate_idempotency_key(service_name: str, handler_name: str, data: dict, time_window_seconds: Optional[int] = None) -> str:
@@ -31,19 +128,26 @@ def generate_idempotency_key(service_name: str, handler_name: str, data: dict, t
     return hashlib.sha256(str_to_hash.encode()).hexdigest()
 
 
-async def call_restate(service_or_workflow_name: str, handler_name: str, data: Optional[dict] = None, time_window_seconds: Optional[int] = None, call_type: Literal["send"] = None, include_idempotency_key: bool = True) -> str:
-    endpoint = f"{RESTATE_ENDPOINT}/{service_or_workflow_name}/{handler_name}{f'/{call_type}' if call_type else ''}"
-    
-    # Use a 30-second idempotency window if not specified
-    if handler_name == "toggle_lightbulb" and time_window_seconds is None:
-        time_window_seconds = 20
-    elif handler_name == "get_lightbulb" and time_window_seconds is None:
-        time_window_seconds = 5
-    else:
-        time_window_seconds = 30
+async def _post_restate(client: httpx.AsyncClient, service_or_workflow_name: str, handler_name: str, data: Optional[dict] = None, time_window_seconds: Optional[int] = None, call_type: Literal["send"] = None, include_idempotency_key: bool = True) -> tuple[str, httpx.Response]:
+    endpoint = f"/{service_or_workflow_name}/{handler_name}{f'/{call_type}' if call_type else ''}"
+    policy = handler_policy(service_or_workflow_name, handler_name)
+    if time_window_seconds is None:
+        time_window_seconds = policy.time_window_seconds
 
     key = generate_idempotency_key(service_or_workflow_name, handler_name, data or {}, time_window_seconds)
-        
+    if not (LIGHTBULB_COALESCE and policy.coalesce and (policy.read_only or include_idempotency_key)):
+        return key, await _send_restate(client, endpoint, service_or_workflow_name, handler_name, key, data, include_idempotency_key, policy.read_only)
+
+    # The idempotency key covers the service, handler and payload; the endpoint and header distinguish the rest
+    response = await restate_calls.do(
+        f"{endpoint}:{include_idempotency_key}:{key}",
+        lambda: _send_restate(client, endpoint, service_or_workflow_name, handler_name, key, data, include_idempotency_key, policy.read_only),
+        name=handler_name,
+    )
+    return key, response
+
+
+async def _send_restate(client: httpx.AsyncClient, endpoint: str, service_or_workflow_name: str, handler_name: str, key: str, data: Optional[dict], include_idempotency_key: bool, read_only: bool = False) -> httpx.Response:
     headers = {
         "Accept": "application/json",
         "Content-Type": "application/json",
@@ -53,29 +157,166 @@ async def call_restate(service_or_workflow_name: str, handler_name: str, data: O
 
     logger.info("Calling Restate service: %s, data: %s", endpoint, data)
     
-    try:
-        async with httpx.AsyncClient(timeout=15) as client:
-            response = await client.post(endpoint, headers=headers, json=data)
+    # Restate hands the ingress headers to the handler, which continues the trace from them
+    load_shedder.started()
+    started = time.perf_counter()
+    latency = None
+    # Spans are named per handler so `tracing.breakdown` reports one stage for all bulbs, the key is an attribute
+    service_name, _, object_key = service_or_workflow_name.partition("/")
+    with tracing.span(f"restate {service_name}/{handler_name}", "api") as span:
+        if object_key:
+            span.set_attribute("key", object_key)
+        try:
+            response = await client.post(endpoint, headers=tracing.inject(headers), json=data)
+            span.set_attribute("status_code", response.status_code)
+            # Only reads measure how quickly Restate serves calls, see `LoadShedder`
+            latency = time.perf_counter() - started if read_only else None
 
             response.raise_for_status()
-    except httpx.HTTPStatusError as e:
-        # TODO HANDLE 409 - return message
-        # TODO handle 500 - TerminalError
-        logger.error(f"Error calling Restate service: {e}: {e.response.text}")
+        except httpx.HTTPStatusError as e:
+            # TODO HANDLE 409 - return message
+            # TODO handle 500 - TerminalError
+            logger.error(f"Error calling Restate service: {e}: {e.response.text}")
+
+            raise e from None
+        finally:
+            load_shedder.finished(latency)
+
+    return response
 
-        raise e from None
 
+async def call_restate(client: httpx.AsyncClient, service_or_workflow_name: str, handler_name: str, data: Optional[dict] = None, time_window_seconds: Optional[int] = None, call_type: Literal["send"] = None, include_idempotency_key: bool = True) -> str:
+    key, _ = await _post_restate(client, service_or_workflow_name, handler_name, data, time_window_seconds, call_type, include_idempotency_key)
     return key
 
 
-async def get_restate_output(key: str, service_name: str, handler_name: str) -> dict:
-    endpoint = f"{RESTATE_ENDPOINT}/restate/invocation/{service_name}/{handler_name}/{key}/output"
+async def query_restate(client: httpx.AsyncClient, service_name: str, handler_name: str, data: Optional[dict] = None, time_window_seconds: Optional[int] = None, include_idempotency_key: bool = True) -> dict:
+    """Call a handler and return its output from the same request-response exchange.
+
+    When the idempotency key is included, Restate deduplicates the call and replies with the stored result of the
+    original invocation, so there is no need for a second request to the invocation output endpoint.
+    """
+    _, response = await _post_restate(client, service_name, handler_name, data, time_window_seconds, include_idempotency_key=include_idempotency_key)
+    return response.json()
+
+
+async def get_restate_output(client: httpx.AsyncClient, key: str, service_name: str, handler_name: str) -> dict:
+    endpoint = f"/restate/invocation/{service_name}/{handler_name}/{key}/output"
+
+    response = await client.get(endpoint)
+
+    response.raise_for_status()
+    return response.json()
+
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(endpoint)
+def invocation_key(service_name: str, handler_name: str, idempotency_key: str) -> str:
+    """Return the result key of an invocation made with an idempotency key; `service_name` includes the object key."""
+    return f"invocation/{service_name}/{handler_name}/{idempotency_key}"
 
+
+def workflow_key(workflow_name: str, workflow_id: str) -> str:
+    return f"workflow/{workflow_name}/{workflow_id}"
+
+
+def is_result_key(key: str) -> bool:
+    return RESULT_KEY.fullmatch(key) is not None and ".." not in key.split("/")
+
+
+async def attach_restate(client: httpx.AsyncClient, key: str) -> dict:
+    """Attach to an invocation or workflow and return its outcome once it completes.
+
+    The outcome is `{"output": ...}` for a successful invocation and `{"error": ...}` for a failed or unknown one.
+    Raises `httpx.TimeoutException` when it does not complete within `LIGHTBULB_ATTACH_TIMEOUT`.
+    """
+    # Segments hold caller-chosen bulb IDs, which may contain characters such as `?`, `#` or `%`
+    path = "/".join(quote(segment, safe="") for segment in key.split("/"))
+    response = await client.get(f"/restate/{path}/attach", timeout=LIGHTBULB_ATTACH_TIMEOUT)
+    if response.is_success:
+        return {"output": response.json() if response.content else None}
+
+    if response.status_code == 404:
+        return {"error": "Invocation not found"}
+
+    if response.status_code in (502, 503, 504):
+        # The ingress could not reach the invocation; this says nothing about its outcome
         response.raise_for_status()
-        return response.json()
+
+    try:
+        message = response.json().get("message")
+    except ValueError:
+        message = None
+
+    return {"error": message or response.text or f"Invocation failed with status {response.status_code}"}
+
+
+async def wait_for_result(client: httpx.AsyncClient, key: str, timeout: float) -> Optional[dict]:
+    """Wait up to `timeout` seconds for the outcome of an invocation, `None` if it has not completed by then.
+
+    Waiters only stop waiting when they time out; the shared attachment stays open for the others.
+    """
+    try:
+        return await asyncio.wait_for(invocation_attachments.do(key, lambda: attach_restate(client, key), name="attach"), timeout)
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        return None
+
+
+def lightbulb_target(id: str, action: str, routing: str = LIGHTBULB_ROUTING) -> tuple[str, str, Optional[dict]]:
+    """Return the `(service, handler, data)` Restate call performing `action` on a bulb under the given routing."""
+    if routing == "object":
+        return f"Lightbulb/{id}", action, None
+
+    return "LightbulbManagementSvc", f"{action}_lightbulb", {"id": id}
+
+
+async def fetch_lightbulb(client: httpx.AsyncClient, id: str, read_mode: str = LIGHTBULB_READ_MODE, dedup: bool = LIGHTBULB_READ_DEDUP, routing: str = LIGHTBULB_ROUTING) -> dict:
+    service_name, handler_name, data = lightbulb_target(id, "get", routing)
+    if read_mode == "output":
+        key = await call_restate(client, service_name, handler_name, data)
+        return await get_restate_output(client, key, service_name, handler_name)
+
+    return await query_restate(client, service_name, handler_name, data, include_idempotency_key=dedup)
+
+
+async def fetch_lightbulbs(client: httpx.AsyncClient, ids: list[str], routing: str = LIGHTBULB_ROUTING) -> list[Optional[dict]]:
+    """Fetch many bulbs with one `get_lightbulbs` invocation, returning results in the order of `ids`.
+
+    Bulb objects are keyed individually, so with object routing every bulb is read from its own object concurrently.
+    """
+    if routing == "object":
+        results = await asyncio.gather(*(fetch_lightbulb(client, id, routing=routing) for id in ids), return_exceptions=True)
+        return [result if isinstance(result, dict) and result.get("success") else None for result in results]
+
+    result = await query_restate(client, "LightbulbManagementSvc", "get_lightbulbs", {"ids": ids}, include_idempotency_key=LIGHTBULB_READ_DEDUP)
+    bulbs = {bulb["id"]: bulb for bulb in result["results"] if bulb["success"]}
+
+    return [bulbs.get(id) for id in ids]
+
+
+def create_lightbulb_loader(client: httpx.AsyncClient) -> DataLoader[str, Optional[dict]]:
+    """Create a per-request loader coalescing every bulb lookup of a GraphQL operation into batched invocations."""
+    return DataLoader(load_fn=lambda ids: fetch_lightbulbs(client, list(ids)), max_batch_size=LIGHTBULB_BATCH_SIZE)
+
+
+def get_restate_client(info: strawberry.Info) -> httpx.AsyncClient:
+    return info.context["restate_client"]
+
+
+def get_lightbulb_loader(info: strawberry.Info) -> DataLoader[str, Optional[dict]]:
+    return info.context["lightbulb_loader"]
+
+
+def admit(info: strawberry.Info, *bulb_ids: str, bulk: bool = False):
+    """Raise an `AdmissionError` if the operation must not call Restate. Call it outside the resolver's catch-all, so
+    the rejection reaches the client as a structured error instead of a `null` result."""
+    admission.admit(info.context.get("client_id", "anonymous"), bulb_ids, bulk)
+
+
+def get_status_view(info: strawberry.Info) -> Optional[LightbulbStatusView]:
+    return info.context.get("status_view")
+
+
+def get_broadcaster(info: strawberry.Info) -> Optional[LightbulbBroadcaster]:
+    return info.context.get("broadcaster")
 
 
 @strawberry.enum
@@ -96,56 +337,282 @@ class LightBulb:
     status: LightStatus
     
 
+@strawberry.type
+class LightBulbUpdate:
+    id: str
+    # `None` once the bulb is uninstalled
+    status: Optional[LightStatus]
+
+
 @strawberry.type
 class ActionSuccess:
     key: str
 
 
+@strawberry.type
+class InvocationResult:
+    key: str
+    # False when the invocation did not complete within the timeout
+    ready: bool
+    output: Optional[JSON] = None
+    error: Optional[str] = None
+
+
+def invocation_result(key: str, outcome: Optional[dict]) -> InvocationResult:
+    if outcome is None:
+        return InvocationResult(key=key, ready=False)
+
+    return InvocationResult(key=key, ready=True, output=outcome.get("output"), error=outcome.get("error"))
+
+
+@strawberry.type
+class InstallationProgress:
+    status: str
+    total: int
+    completed: int
+    succeeded: int
+    failed: int
+
+
+@strawberry.type
+class InstallationFailure:
+    id: str
+    error: str
+
+
+def mutation_call_type() -> Optional[Literal["send"]]:
+    return "send" if LIGHTBULB_ASYNC_MUTATIONS else None
+
+
+def is_bulk_installation_key(key: str) -> bool:
+    return BULK_INSTALLATION_KEY.fullmatch(key) is not None
+
+
+def bulk_installation_workflow(key: str) -> str:
+    return f"BulkInstallationWorkflow/{key}"
+
+
 @strawberry.type
 class Query:
     @strawberry.field
-    async def lightbulb(self, id: str) -> Optional[LightBulb]:
+    async def lightbulb(self, info: strawberry.Info, id: str) -> Optional[LightBulb]:
+        status_view = get_status_view(info)
+        if status_view:
+            fresh, bulb = status_view.get(id)
+            if fresh:
+                return LightBulb(id=id, status=LightStatus[bulb["status"]]) if bulb else None
+            since_version = status_view.version
+
         try:
-            key = await call_restate("LightbulbManagementSvc", "get_lightbulb", {"id": id})
-            result = await get_restate_output(key, "LightbulbManagementSvc", "get_lightbulb")
+            if status_view:
+                # A deduplicated read may replay a result from before events the view has applied since, so the
+                # view is only filled from reads that reach the bulb
+                result = await fetch_lightbulb(get_restate_client(info), id, read_mode="direct", dedup=False)
+                status_view.fill(id, result["data"], since_version)
+            else:
+                result = await fetch_lightbulb(get_restate_client(info), id)
 
             return LightBulb(id=result["id"], status=LightStatus[result["data"]["status"]])
         except Exception as e:
             logger.exception("Error fetching lightbulb status: %s", e)
             return None
 
+    @strawberry.field
+    async def lightbulbs(self, info: strawberry.Info, ids: list[str]) -> list[Optional[LightBulb]]:
+        try:
+            results = await get_lightbulb_loader(info).load_many(ids)
+        except Exception as e:
+            logger.exception("Error fetching lightbulb statuses: %s", e)
+            return [None] * len(ids)
+
+        return [
+            LightBulb(id=result["id"], status=LightStatus[result["data"]["status"]]) if result else None
+            for result in results
+        ]
+
+    @strawberry.field
+    async def invocation_result(self, info: strawberry.Info, key: str, timeout_ms: int = 10_000) -> Optional[InvocationResult]:
+        """Wait up to `timeoutMs` for the outcome of a mutation identified by its `ActionSuccess.key`."""
+        if not is_result_key(key):
+            raise Exception("Invalid invocation key")
+
+        timeout = min(max(timeout_ms, 0) / 1000, LIGHTBULB_ATTACH_TIMEOUT)
+        try:
+            return invocation_result(key, await wait_for_result(get_restate_client(info), key, timeout))
+        except Exception as e:
+            logger.exception("Error waiting for invocation result: %s", e)
+            return None
+
+    @strawberry.field
+    async def installation_progress(self, info: strawberry.Info, key: str) -> Optional[InstallationProgress]:
+        if not is_bulk_installation_key(key):
+            raise Exception("Invalid installation key")
+
+        try:
+            result = await query_restate(get_restate_client(info), bulk_installation_workflow(key), "get_progress", include_idempotency_key=False)
+            return InstallationProgress(**result)
+        except Exception as e:
+            logger.exception("Error fetching installation progress: %s", e)
+            return None
+
+    @strawberry.field
+    async def installation_failures(self, info: strawberry.Info, key: str, page: int = 0) -> Optional[list[InstallationFailure]]:
+        if not is_bulk_installation_key(key):
+            raise Exception("Invalid installation key")
+
+        try:
+            result = await query_restate(get_restate_client(info), bulk_installation_workflow(key), "get_failures", {"page": page}, include_idempotency_key=False)
+            return [InstallationFailure(**failure) for failure in result["failures"]]
+        except Exception as e:
+            logger.exception("Error fetching installation failures: %s", e)
+            return None
+
 
 @strawberry.type
 class Mutation:
     @strawberry.mutation
-    async def install_lightbulb(self, input: LightBulbInstallationInput) -> Optional[ActionSuccess]:
+    async def install_lightbulb(self, info: strawberry.Info, input: LightBulbInstallationInput) -> Optional[ActionSuccess]:
+        admit(info, input.id)
         try:
             logger.info("Installing lightbulb with id: %s", input.id)
-            key = await call_restate("InstallationWorkflow", input.id, call_type="run", data={"id": input.id, "data": input.data}, include_idempotency_key=False)
-            return ActionSuccess(key=key)
+            await call_restate(get_restate_client(info), f"InstallationWorkflow/{input.id}", "run", data={"id": input.id, "data": input.data, "mode": LIGHTBULB_INSTALL_MODE}, call_type=mutation_call_type(), include_idempotency_key=False)
+            return ActionSuccess(key=workflow_key("InstallationWorkflow", input.id))
         except Exception as e:
             logger.exception("Error installing lightbulb: %s", e)
             return None
 
     @strawberry.mutation
-    async def toggle_lightbulb(self, id: str) -> Optional[ActionSuccess]:
+    async def install_lightbulbs(self, info: strawberry.Info, inputs: list[LightBulbInstallationInput], concurrency: Optional[int] = None) -> Optional[ActionSuccess]:
+        """Start a bulk installation; the returned key identifies it for `installationProgress`."""
+        admit(info, *(input.id for input in inputs), bulk=True)
         try:
-            logger.info("Toggling lightbulb with id: %s", id)
-            key = await call_restate("LightbulbManagementSvc", "toggle_lightbulb", {"id": id})
+            logger.info("Installing %s lightbulbs", len(inputs))
+            data = {
+                "installs": [{"id": input.id, "data": input.data, "mode": LIGHTBULB_INSTALL_MODE} for input in inputs],
+                "concurrency": min(max(1, concurrency or LIGHTBULB_BULK_CONCURRENCY), LIGHTBULB_BULK_MAX_CONCURRENCY),
+            }
+            # The same rollout submitted again maps to the same workflow instead of installing everything twice
+            key = generate_idempotency_key("BulkInstallationWorkflow", "run", data)
+            await call_restate(get_restate_client(info), bulk_installation_workflow(key), "run", data, call_type="send", include_idempotency_key=False)
             return ActionSuccess(key=key)
+        except Exception as e:
+            logger.exception("Error installing lightbulbs: %s", e)
+            return None
+
+    @strawberry.mutation
+    async def toggle_lightbulb(self, info: strawberry.Info, id: str) -> Optional[ActionSuccess]:
+        admit(info, id)
+        try:
+            logger.info("Toggling lightbulb with id: %s", id)
+            service_name, handler_name, data = lightbulb_target(id, "toggle")
+            key = await call_restate(get_restate_client(info), service_name, handler_name, data, call_type=mutation_call_type())
+            return ActionSuccess(key=invocation_key(service_name, handler_name, key))
         except Exception as e:
             logger.exception("Error toggling lightbulb: %s", e)
             return None
         
     @strawberry.mutation
-    async def uninstall_lightbulb(self, id: str) -> Optional[ActionSuccess]:
+    async def uninstall_lightbulb(self, info: strawberry.Info, id: str) -> Optional[ActionSuccess]:
+        admit(info, id)
         try:
             logger.info("Uninstalling lightbulb with id: %s", id)
-            key = await call_restate("LightbulbManagementSvc", "uninstall_lightbulb", {"id": id})
-            return ActionSuccess(key=key)
+            service_name, handler_name, data = lightbulb_target(id, "uninstall")
+            key = await call_restate(get_restate_client(info), service_name, handler_name, data, call_type=mutation_call_type())
+            return ActionSuccess(key=invocation_key(service_name, handler_name, key))
         except Exception as e:
             logger.exception("Error uninstalling lightbulb: %s", e)
             return None
 
 
-schema = strawberry.Schema(query=Query, mutation=Mutation)
+@strawberry.type
+class Subscription:
+    @strawberry.subscription
+    async def lightbulb_status(self, info: strawberry.Info, ids: list[str]) -> AsyncGenerator[LightBulbUpdate, None]:
+        """Stream the current status of the bulbs followed by every change to them."""
+        broadcaster = get_broadcaster(info)
+        if broadcaster is None:
+            raise Exception("Live lightbulb status updates are not enabled")
+
+        # Subscribe before reading the current state so no change made in between is missed
+        subscription = broadcaster.subscribe(ids)
+        try:
+            try:
+                bulbs = await create_lightbulb_loader(get_restate_client(info)).load_many(ids)
+            except Exception as e:
+                logger.exception("Error fetching initial lightbulb statuses: %s", e)
+                bulbs = []
+
+            for id, bulb in zip(ids, bulbs):
+                yield LightBulbUpdate(id=id, status=LightStatus[bulb["data"]["status"]] if bulb else None)
+
+            async for event in subscription:
+                yield LightBulbUpdate(id=event.id, status=LightStatus[event.data["status"]] if event.data else None)
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    @strawberry.subscription
+    async def invocation_result(self, info: strawberry.Info, key: str, timeout_ms: Optional[int] = None) -> AsyncGenerator[InvocationResult, None]:
+        """Emit the outcome of a mutation once it completes, or a result that is not ready after `timeoutMs`."""
+        if not is_result_key(key):
+            raise Exception("Invalid invocation key")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(timeout_ms, 0) / 1000 if timeout_ms is not None else None
+        while True:
+            # Attachments are bounded, so waiting without a deadline re-attaches until the invocation completes
+            timeout = LIGHTBULB_ATTACH_TIMEOUT if deadline is None else min(deadline - loop.time(), LIGHTBULB_ATTACH_TIMEOUT)
+            outcome = await wait_for_result(get_restate_client(info), key, max(timeout, 0))
+            if outcome is not None or (deadline is not None and loop.time() >= deadline):
+                yield invocation_result(key, outcome)
+                return
+
+
+class TracingExtension(SchemaExtension):
+    """Starts the trace of every GraphQL operation, named after its root fields"""
+
+    def on_operation(self):
+        with tracing.span("graphql", "api") as span:
+            yield
+            document = self.execution_context.graphql_document
+            if document is not None:
+                fields = [
+                    selection.name.value
+                    for definition in document.definitions if hasattr(definition, "selection_set")
+                    for selection in definition.selection_set.selections if hasattr(selection, "name")
+                ]
+                span.name = f"graphql {','.join(fields)}"
+
+
+class MetricsExtension(SchemaExtension):
+    """Times the root field resolvers, which are the ones calling Restate; nested fields only read their parent"""
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        if info.path.prev is not None:
+            return _next(root, info, *args, **kwargs)
+
+        labels = (info.parent_type.name, info.field_name)
+        started = time.perf_counter()
+        try:
+            result = _next(root, info, *args, **kwargs)
+        except Exception:
+            RESOLVER_ERRORS.inc(*labels)
+            RESOLVER_DURATION.observe(time.perf_counter() - started, *labels)
+            raise
+        if not inspect.isawaitable(result):
+            # Subscriptions return their generator here, so only its creation is timed
+            RESOLVER_DURATION.observe(time.perf_counter() - started, *labels)
+            return result
+
+        async def timed():
+            try:
+                return await result
+            except Exception:
+                RESOLVER_ERRORS.inc(*labels)
+                raise
+            finally:
+                RESOLVER_DURATION.observe(time.perf_counter() - started, *labels)
+
+        return timed()
+
+
+schema = strawberry.Schema(query=Query, mutation=Mutation, subscription=Subscription, extensions=[TracingExtension, MetricsExtension])
@@ -1,16 +1,99 @@
-from fastapi import FastAPI
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
+from starlette.requests import HTTPConnection
 from strawberry.fastapi import GraphQLRouter
 
-from .graphql import schema
+from src import metrics
+
+from .graphql import create_lightbulb_loader, schema
+from .broadcaster import LightbulbBroadcaster
+from .restate_client import create_restate_client
+from .status_view import LightbulbEventSubscriber, LightbulbStatusView
+
+logger = logging.getLogger(__name__)
+
+# The status view is only maintained when the edge link's events can be subscribed to
+LIGHTBULB_VIEW_NATS_URL = os.getenv("LIGHTBULB_VIEW_NATS_URL")
+LIGHTBULB_VIEW_MAX_SIZE = int(os.getenv("LIGHTBULB_VIEW_MAX_SIZE", "100000"))
+LIGHTBULB_VIEW_TTL = float(os.getenv("LIGHTBULB_VIEW_TTL", "30"))
+# Updates buffered per live status subscription before the subscriber is dropped as too slow
+LIGHTBULB_SUBSCRIPTION_QUEUE_SIZE = int(os.getenv("LIGHTBULB_SUBSCRIPTION_QUEUE_SIZE", "100"))
+# Comma separated addresses of proxies whose `X-Client-Id` header names the client they forward for
+LIGHTBULB_TRUSTED_PROXIES = frozenset(filter(None, os.getenv("LIGHTBULB_TRUSTED_PROXIES", "").split(",")))
+
+
+async def start_status_view() -> LightbulbEventSubscriber | None:
+    if not LIGHTBULB_VIEW_NATS_URL:
+        return None
+
+    subscriber = LightbulbEventSubscriber(
+        LIGHTBULB_VIEW_NATS_URL,
+        LightbulbStatusView(LIGHTBULB_VIEW_MAX_SIZE, LIGHTBULB_VIEW_TTL),
+        LightbulbBroadcaster(LIGHTBULB_SUBSCRIPTION_QUEUE_SIZE),
+    )
+    try:
+        await subscriber.start()
+    except Exception as e:
+        # Reads still work without the view, they just all go to Restate
+        logger.exception("Could not subscribe to lightbulb events, serving reads without the status view: %s", e)
+        return None
+
+    return subscriber
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled Restate client is shared by every GraphQL request for the lifetime of the app
+    async with create_restate_client() as restate_client:
+        app.state.restate_client = restate_client
+        subscriber = await start_status_view()
+        app.state.status_view = subscriber.view if subscriber else None
+        app.state.broadcaster = subscriber.broadcaster if subscriber else None
+        try:
+            yield
+        finally:
+            if subscriber:
+                await subscriber.close()
+
+
+def get_client_id(connection: HTTPConnection) -> str:
+    """Identify the client rate limits apply to: its address, or the `X-Client-Id` a trusted proxy sends for it.
+
+    The header is ignored from anyone else, who could rotate it to get fresh buckets and evict other clients' buckets.
+    """
+    address = connection.client.host if connection.client else "anonymous"
+    if address in LIGHTBULB_TRUSTED_PROXIES:
+        return connection.headers.get("x-client-id") or address
+    return address
+
+
+async def get_context(connection: HTTPConnection) -> dict:
+    restate_client = connection.app.state.restate_client
+    return {
+        "restate_client": restate_client,
+        "client_id": get_client_id(connection),
+        "lightbulb_loader": create_lightbulb_loader(restate_client),
+        "status_view": connection.app.state.status_view,
+        "broadcaster": connection.app.state.broadcaster,
+    }
+
 
 # Create FastAPI app
-app = FastAPI(title="Light Bulb Tracking System")
+app = FastAPI(title="Light Bulb Tracking System", lifespan=lifespan)
 
 # Add GraphQL endpoint
-graphql_app = GraphQLRouter(schema)
+graphql_app = GraphQLRouter(schema, context_getter=get_context)
 app.include_router(graphql_app, prefix="/graphql")
 
 # Add a redirect from root to GraphQL UI
 @app.get("/")
 async def redirect_to_graphql():
     return {"message": "Welcome to Light Bulb Tracking System", "graphql_endpoint": "/graphql"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
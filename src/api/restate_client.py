@@ -0,0 +1,47 @@
+import logging
+import os
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+RESTATE_ENDPOINT = os.getenv("RESTATE_ENDPOINT")
+
+# Connection pool settings for the shared Restate ingress client
+RESTATE_MAX_CONNECTIONS = int(os.getenv("RESTATE_MAX_CONNECTIONS", "100"))
+RESTATE_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("RESTATE_MAX_KEEPALIVE_CONNECTIONS", "20"))
+RESTATE_KEEPALIVE_EXPIRY = float(os.getenv("RESTATE_KEEPALIVE_EXPIRY", "30"))
+RESTATE_TIMEOUT = float(os.getenv("RESTATE_TIMEOUT", "15"))
+# Restate's ingress speaks cleartext HTTP/2 (h2c), so HTTP/2 is used with prior knowledge. Requires the `h2` package.
+RESTATE_HTTP2 = os.getenv("RESTATE_HTTP2", "false").lower() in ("1", "true", "yes")
+
+
+def create_restate_client(
+    base_url: str | None = None,
+    max_connections: int = RESTATE_MAX_CONNECTIONS,
+    max_keepalive_connections: int = RESTATE_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = RESTATE_KEEPALIVE_EXPIRY,
+    timeout: float = RESTATE_TIMEOUT,
+    http2: bool = RESTATE_HTTP2,
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> httpx.AsyncClient:
+    """Create the connection-pooled client used for all Restate ingress calls.
+
+    One client is created per API process (see the lifespan in `main.py`) so connections are reused across requests.
+    """
+    base_url = base_url or RESTATE_ENDPOINT or ""
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    logger.info("Creating Restate client for %s (http2=%s, limits=%s)", base_url, http2, limits)
+
+    return httpx.AsyncClient(
+        base_url=base_url,
+        limits=limits,
+        timeout=timeout,
+        http1=not http2,
+        http2=http2,
+        transport=transport,
+    )
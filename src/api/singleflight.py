@@ -0,0 +1,44 @@
+import asyncio
+from collections import defaultdict
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one.
+
+    The first caller for a key starts the call; callers arriving while it is in flight await the same result (or
+    exception) instead of starting their own. The call runs as its own task, so a caller being cancelled does not
+    cancel it for the others. Hits and misses are counted per `name`.
+    """
+
+    def __init__(self):
+        self.hits: defaultdict[str, int] = defaultdict(int)
+        self.misses: defaultdict[str, int] = defaultdict(int)
+        self._calls: dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, call: Callable[[], Awaitable[T]], name: str = "") -> T:
+        task = self._calls.get(key)
+        if task is not None:
+            self.hits[name] += 1
+        else:
+            self.misses[name] += 1
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the exception so it is not reported as unhandled when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {name: {"hits": self.hits[name], "misses": self.misses[name]} for name in self.hits.keys() | self.misses.keys()}
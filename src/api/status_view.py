@@ -0,0 +1,106 @@
+import logging
+import time
+from collections import OrderedDict
+
+import nats
+
+from src.events import ALL_EVENTS_SUBJECT
+from src.models import LightbulbEvent
+from .broadcaster import LightbulbBroadcaster
+
+logger = logging.getLogger(__name__)
+
+# Marks a bulb known to be uninstalled
+UNINSTALLED = object()
+
+
+class LightbulbStatusView:
+    """In-memory view of bulb state maintained from the edge link's state change events.
+
+    Holds at most `max_size` bulbs, evicting the least recently used. An entry is fresh for `ttl` seconds after the
+    event or read that set it. Entries filled from a read only replace what an event wrote if no event for any bulb
+    was applied since that read started, so a slow read never overwrites a newer event.
+    """
+
+    def __init__(self, max_size: int = 100_000, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self._entries: OrderedDict[str, tuple[float, int, object]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, id: str) -> tuple[bool, dict | None]:
+        """Return `(fresh, bulb)`; `bulb` is `None` when the bulb is not installed."""
+        entry = self._entries.get(id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(id)
+        self.hits += 1
+        bulb = entry[2]
+        return True, None if bulb is UNINSTALLED else bulb
+
+    def _put(self, id: str, bulb: dict | None):
+        self._entries[id] = (time.monotonic(), self.version, UNINSTALLED if bulb is None else bulb)
+        self._entries.move_to_end(id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def apply(self, event: LightbulbEvent):
+        self.version += 1
+        self._put(event.id, event.data)
+
+    def fill(self, id: str, bulb: dict | None, since_version: int):
+        """Cache a bulb read that started when the view was at `since_version`"""
+        entry = self._entries.get(id)
+        if entry is not None and entry[1] > since_version:
+            return
+        self._put(id, bulb)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class LightbulbEventSubscriber:
+    """Keeps a `LightbulbStatusView` up to date from NATS and feeds live subscriptions through a broadcaster.
+
+    Events published while disconnected are lost, so the view is cleared whenever the connection drops.
+    """
+
+    def __init__(self, nats_url: str, view: LightbulbStatusView, broadcaster: LightbulbBroadcaster | None = None):
+        self.nats_url = nats_url
+        self.view = view
+        self.broadcaster = broadcaster
+        self.nc: nats.aio.client.Client | None = None
+
+    async def _on_event(self, msg):
+        try:
+            event = LightbulbEvent.model_validate_json(msg.data)
+        except ValueError as e:
+            logger.warning("Ignoring invalid lightbulb event on %s: %s", msg.subject, e)
+            return
+
+        self.view.apply(event)
+        if self.broadcaster:
+            self.broadcaster.publish(event)
+
+    async def _on_connection_change(self):
+        self.view.clear()
+
+    async def start(self):
+        self.nc = await nats.connect(
+            self.nats_url,
+            disconnected_cb=self._on_connection_change,
+            reconnected_cb=self._on_connection_change,
+        )
+        await self.nc.subscribe(ALL_EVENTS_SUBJECT, cb=self._on_event)
+        logger.info("Subscribed to lightbulb events at %s", self.nats_url)
+
+    async def close(self):
+        if self.nc:
+            await self.nc.drain()
@@ -0,0 +1,300 @@
+"""Wire formats for the lightbulb messages exchanged over NATS.
+
+Peers describe a payload with HTTP style `Content-Type` and `Content-Encoding` headers and ask for a reply format
+with `Accept` and `Accept-Encoding`. A message without headers is JSON, so peers that predate the headers keep
+working: they neither send nor ask for anything else.
+"""
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Any, Protocol, TypeVar
+
+from pydantic import BaseModel
+
+M = TypeVar("M", bound=BaseModel)
+
+CONTENT_TYPE = "Content-Type"
+CONTENT_ENCODING = "Content-Encoding"
+ACCEPT = "Accept"
+ACCEPT_ENCODING = "Accept-Encoding"
+
+JSON = "application/json"
+BINARY = "application/x-lightbulb"
+ZLIB = "zlib"
+ZLIB_LEVEL = 1
+# Refuse to inflate payloads beyond this size instead of exhausting memory on a malicious or corrupt message
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+
+class CodecError(ValueError):
+    """Raised when a payload cannot be decoded"""
+
+
+class Codec(Protocol):
+    content_type: str
+
+    def encode(self, model: BaseModel) -> bytes: ...
+
+    def decode(self, data: bytes, model: type[M]) -> M: ...
+
+
+class JSONCodec:
+    content_type = JSON
+
+    def encode(self, model: BaseModel) -> bytes:
+        return model.model_dump_json().encode()
+
+    def decode(self, data: bytes, model: type[M]) -> M:
+        return model.model_validate_json(data)
+
+
+# Binary format: a version byte followed by one tagged value. Integers and lengths are LEB128 varints, integers
+# zigzag encoded. Strings of up to `INTERN_MAX_LENGTH` bytes are added to a table on first use and referenced by index
+# afterwards, so the field names and statuses repeated across batch results are only sent once.
+BINARY_VERSION = 1
+INTERN_MAX_LENGTH = 32
+NONE, FALSE, TRUE, INT, FLOAT, STR, STR_REF, LIST, DICT = range(9)
+_DOUBLE = struct.Struct("<d")
+
+
+def _write_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def pack(value: Any) -> bytes:
+    out = bytearray([BINARY_VERSION])
+    append = out.append
+    table: dict[str, int] = {}
+
+    # A closure over locals, since this runs once per value and attribute and global lookups dominate its cost
+    def write(value: Any):
+        kind = type(value)
+        if kind is str or isinstance(value, str):
+            index = table.get(value)
+            if index is not None:
+                append(STR_REF)
+                if index < 0x80:
+                    append(index)
+                else:
+                    _write_varint(out, index)
+                return
+
+            encoded = value.encode()
+            length = len(encoded)
+            append(STR)
+            if length < 0x80:
+                append(length)
+            else:
+                _write_varint(out, length)
+            out.extend(encoded)
+            if length <= INTERN_MAX_LENGTH:
+                table[value] = len(table)
+        elif kind is dict:
+            append(DICT)
+            _write_varint(out, len(value))
+            for key, item in value.items():
+                write(key)
+                write(item)
+        elif value is None:
+            append(NONE)
+        elif value is True:
+            append(TRUE)
+        elif value is False:
+            append(FALSE)
+        elif isinstance(value, int):
+            append(INT)
+            _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            append(FLOAT)
+            out.extend(_DOUBLE.pack(value))
+        elif isinstance(value, (list, tuple)):
+            append(LIST)
+            _write_varint(out, len(value))
+            for item in value:
+                write(item)
+        elif isinstance(value, dict):
+            append(DICT)
+            _write_varint(out, len(value))
+            for key, item in value.items():
+                write(key)
+                write(item)
+        else:
+            raise TypeError(f"Cannot encode {type(value).__name__} values")
+
+    write(value)
+    return bytes(out)
+
+
+def unpack(data: bytes) -> Any:
+    if not data or data[0] != BINARY_VERSION:
+        raise CodecError("Unsupported binary format version")
+
+    size = len(data)
+    table: list[str] = []
+    pos = 1
+
+    def varint() -> int:
+        nonlocal pos
+        byte = data[pos]
+        pos += 1
+        if byte < 0x80:
+            return byte
+
+        result = byte & 0x7F
+        shift = 7
+        while True:
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def read() -> Any:
+        nonlocal pos
+        tag = data[pos]
+        pos += 1
+        if tag == STR_REF:
+            return table[varint()]
+        if tag == STR:
+            length = varint()
+            end = pos + length
+            if end > size:
+                raise CodecError("Truncated string")
+            value = data[pos:end].decode()
+            pos = end
+            if length <= INTERN_MAX_LENGTH:
+                table.append(value)
+            return value
+        if tag == DICT:
+            return {read(): read() for _ in range(varint())}
+        if tag == LIST:
+            return [read() for _ in range(varint())]
+        if tag == NONE:
+            return None
+        if tag == TRUE:
+            return True
+        if tag == FALSE:
+            return False
+        if tag == INT:
+            value = varint()
+            return value >> 1 if not value & 1 else -(value >> 1) - 1
+        if tag == FLOAT:
+            (value,) = _DOUBLE.unpack_from(data, pos)
+            pos += _DOUBLE.size
+            return value
+
+        raise CodecError(f"Unknown tag {tag}")
+
+    try:
+        value = read()
+    # TypeError is a list or dict used as a dict key
+    except (IndexError, RecursionError, struct.error, TypeError, UnicodeDecodeError) as e:
+        raise CodecError(f"Malformed binary payload: {e}") from None
+    if pos != size:
+        raise CodecError("Trailing bytes after binary payload")
+
+    return value
+
+
+class BinaryCodec:
+    content_type = BINARY
+
+    def encode(self, model: BaseModel) -> bytes:
+        # Defaults are restored on validation, so they need not be sent
+        return pack(model.model_dump(exclude_defaults=True))
+
+    def decode(self, data: bytes, model: type[M]) -> M:
+        return model.model_validate(unpack(data))
+
+
+CODECS: dict[str, Codec] = {codec.content_type: codec for codec in (JSONCodec(), BinaryCodec())}
+# Configuration names of the codecs
+CODEC_NAMES = {"json": JSON, "binary": BINARY}
+
+
+def _decompress(data: bytes) -> bytes:
+    decompressor = zlib.decompressobj()
+    try:
+        inflated = decompressor.decompress(data, MAX_DECOMPRESSED_SIZE)
+    except zlib.error as e:
+        raise CodecError(f"Malformed compressed payload: {e}") from None
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise CodecError("Compressed payload is truncated or too large")
+
+    return inflated
+
+
+def is_plain_json(headers: dict[str, str] | None) -> bool:
+    return not headers or (headers.get(CONTENT_TYPE, JSON) == JSON and CONTENT_ENCODING not in headers)
+
+
+def decode(data: bytes, headers: dict[str, str] | None, model: type[M]) -> M:
+    """Decode a payload according to its `Content-Type` and `Content-Encoding` headers"""
+    if is_plain_json(headers):
+        return model.model_validate_json(data)
+
+    encoding = headers.get(CONTENT_ENCODING)
+    if encoding == ZLIB:
+        data = _decompress(data)
+    elif encoding is not None:
+        raise CodecError(f"Unsupported content encoding {encoding!r}")
+
+    codec = CODECS.get(headers.get(CONTENT_TYPE, JSON))
+    if codec is None:
+        raise CodecError(f"Unsupported content type {headers[CONTENT_TYPE]!r}")
+
+    return codec.decode(data, model)
+
+
+@dataclass(frozen=True)
+class WireFormat:
+    """The format a peer encodes payloads in"""
+
+    content_type: str = JSON
+    # Payloads of at least this many bytes are zlib compressed, `None` never compresses
+    compression_threshold: int | None = None
+
+    @classmethod
+    def named(cls, name: str, compression_threshold: int | None = None) -> "WireFormat":
+        if name not in CODEC_NAMES:
+            raise ValueError(f"Unknown codec {name!r}, expected one of {', '.join(CODEC_NAMES)}")
+
+        return cls(CODEC_NAMES[name], compression_threshold)
+
+    def encode(self, model: BaseModel) -> tuple[bytes, dict[str, str] | None]:
+        """Encode a model, returning the payload and the headers describing it (`None` for plain JSON)"""
+        payload = CODECS[self.content_type].encode(model)
+        headers = {}
+        if self.content_type != JSON:
+            headers[CONTENT_TYPE] = self.content_type
+        if self.compression_threshold is not None and len(payload) >= self.compression_threshold:
+            payload = zlib.compress(payload, ZLIB_LEVEL)
+            headers[CONTENT_ENCODING] = ZLIB
+
+        return payload, headers or None
+
+    def accept_headers(self) -> dict[str, str] | None:
+        """Headers asking a peer to reply in this format, `None` for plain JSON"""
+        headers = {}
+        if self.content_type != JSON:
+            headers[ACCEPT] = self.content_type
+        if self.compression_threshold is not None:
+            headers[ACCEPT_ENCODING] = ZLIB
+
+        return headers or None
+
+
+def reply_format(headers: dict[str, str] | None, compression_threshold: int | None) -> WireFormat:
+    """The format to reply in: the first supported type of the request's `Accept` header, JSON by default"""
+    if not headers:
+        return WireFormat()
+
+    accepted = [content_type.strip() for content_type in headers.get(ACCEPT, "").split(",")]
+    content_type = next((content_type for content_type in accepted if content_type in CODECS), JSON)
+    encodings = [encoding.strip() for encoding in headers.get(ACCEPT_ENCODING, "").split(",")]
+
+    return WireFormat(content_type, compression_threshold if ZLIB in encodings else None)
@@ -1,115 +1,479 @@
 import asyncio
 import logging
-import random
+import os
+import time
 import typing
 from pydantic import ValidationError
-from src.models import LightbulbRequest, LightbulbResponse
+from src import metrics, tracing
+from src.codec import CodecError, decode, reply_format
+from src.events import event_subject
+from src.sharding import base_subject, shard_subject
+from src.models import LightbulbBatchRequest, LightbulbBatchResponse, LightbulbEvent, LightbulbRequest, LightbulbResponse
+from .persistence import EdgeLinkPersistence, PersistenceError
+from .store import LightbulbStore
 
 import nats
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Dictionary to track light bulb states
-light_bulbs = {}
+NATS_URL = os.getenv("NATS_URL", "nats://nats:4222")
+# In sharded mode each process owns the bulb IDs hashing to its shard index, see `src.sharding`
+SHARD_COUNT = int(os.getenv("EDGE_LINK_SHARD_COUNT", "1"))
+SHARD_INDEX = int(os.getenv("EDGE_LINK_SHARD_INDEX", "0"))
+# State is only persisted when a data directory is configured
+DATA_DIR = os.getenv("EDGE_LINK_DATA_DIR")
+COMMIT_INTERVAL_MS = float(os.getenv("EDGE_LINK_COMMIT_INTERVAL_MS", "2"))
+SNAPSHOT_INTERVAL = float(os.getenv("EDGE_LINK_SNAPSHOT_INTERVAL", "60"))
+# "serial" handles one message per callback, "batch" drains all pending messages per event loop tick and "lanes"
+# processes messages on per-bulb ordered lanes
+PROCESSING_MODE = os.getenv("EDGE_LINK_PROCESSING", "serial")
+MAX_BATCH_SIZE = int(os.getenv("EDGE_LINK_MAX_BATCH_SIZE", "512"))
+LANE_COUNT = int(os.getenv("EDGE_LINK_LANES", "16"))
+LANE_QUEUE_SIZE = int(os.getenv("EDGE_LINK_LANE_QUEUE_SIZE", "1024"))
+# Seconds between lane depth log lines, 0 to disable
+LANE_STATS_INTERVAL = float(os.getenv("EDGE_LINK_LANE_STATS_INTERVAL", "60"))
+# Dumping the whole registry on every message is expensive, so it is opt-in debug output
+LOG_STATE = os.getenv("EDGE_LINK_LOG_STATE", "false").lower() in ("1", "true", "yes")
+# Publish a `lightbulb.events.<id>` message after every install, toggle and uninstall
+PUBLISH_EVENTS = os.getenv("EDGE_LINK_PUBLISH_EVENTS", "true").lower() in ("1", "true", "yes")
+# Replies of at least this many bytes are compressed for requesters accepting it, 0 never compresses
+COMPRESSION_THRESHOLD = int(os.getenv("EDGE_LINK_COMPRESSION_THRESHOLD", "4096")) or None
+# Port serving `GET /metrics`, 0 to disable
+METRICS_PORT = int(os.getenv("EDGE_LINK_METRICS_PORT", "9091"))
+SUBJECTS = ["lightbulb.install", "lightbulb.get", "lightbulb.get_batch", "lightbulb.toggle", "lightbulb.uninstall"]
+
+# Registry of light bulb states
+light_bulbs = LightbulbStore()
+persistence: EdgeLinkPersistence | None = None
+# State change events recorded while handling requests, published once the replies are sent
+pending_events: list[LightbulbEvent] = []
+
+REQUEST_DURATION = metrics.histogram("edge_link_request_duration_seconds", "Time spent handling decoded requests", ("subject",))
+REQUEST_FAILURES = metrics.counter("edge_link_request_failures_total", "Requests answered with an unsuccessful response", ("subject",))
+metrics.gauge("edge_link_lightbulbs", "Installed light bulbs", lambda: len(light_bulbs))
+
+
+NOT_DURABLE_ERROR = "Could not persist the change"
 
 
 def return_validation_error_response(e: ValidationError) -> LightbulbResponse:
     return LightbulbResponse(success=False, error_message=str(e))
 
 
+LightbulbMessage = LightbulbRequest | LightbulbBatchRequest
+REQUEST_MODELS: dict[str, type[LightbulbMessage]] = {subject: LightbulbRequest for subject in SUBJECTS} | {
+    "lightbulb.get_batch": LightbulbBatchRequest,
+}
+
+
+def record_event(id: str, data: dict | None):
+    if PUBLISH_EVENTS:
+        pending_events.append(LightbulbEvent(id=id, data=data))
+
+
+def take_events() -> list[LightbulbEvent]:
+    events = pending_events.copy()
+    pending_events.clear()
+    return events
+
+
+async def publish_events(nc: nats.aio.client.Client, events: list[LightbulbEvent]):
+    for event in events:
+        subject = event_subject(event.id)
+        if subject:
+            await nc.publish(subject, event.model_dump_json().encode())
+
+
+def encode_reply(response: LightbulbResponse | LightbulbBatchResponse, request_headers: dict[str, str] | None) -> tuple[bytes, dict[str, str] | None]:
+    """Encode a response in the format the requester asked for"""
+    return reply_format(request_headers, COMPRESSION_THRESHOLD).encode(response)
+
+
+async def publish_reply(nc: nats.aio.client.Client, reply: str, payload: bytes, headers: dict[str, str] | None):
+    # Plain JSON replies carry no headers, exactly as before formats could be negotiated
+    if headers:
+        await nc.publish(reply, payload, headers=headers)
+    else:
+        await nc.publish(reply, payload)
+
+
+async def is_durable(sync: typing.Awaitable) -> bool:
+    """Wait for a `persistence.sync()`, returning False once changes can no longer be persisted"""
+    try:
+        await sync
+    except PersistenceError as e:
+        logger.error(f"Replying with an error since changes are not durable: {e}")
+        return False
+
+    return True
+
+
+def get_error_response(sub: str, error_message: str) -> LightbulbResponse | LightbulbBatchResponse:
+    if sub == "lightbulb.get_batch":
+        return LightbulbBatchResponse(success=False, error_message=error_message)
+
+    return LightbulbResponse(success=False, error_message=error_message)
+
+
+def handle_request(sub: str, request: LightbulbMessage) -> LightbulbResponse | LightbulbBatchResponse:
+    started = time.perf_counter()
+    match sub:
+        case "lightbulb.install":
+            if request.id in light_bulbs:
+                response = LightbulbResponse(success=False, error_message="Lightbulb ID already exists")
+            else:
+                bulb = light_bulbs.install(request.id, request.data)
+                if persistence:
+                    persistence.log_install(request.id, bulb["ctx"])
+                record_event(request.id, bulb)
+                response = LightbulbResponse(id=request.id, data=bulb, success=True)
+        case "lightbulb.get":
+            if request.id not in light_bulbs:
+                response = LightbulbResponse(success=False, error_message="Lightbulb ID not found")
+            else:
+                response = LightbulbResponse(id=request.id, data=light_bulbs.get(request.id), success=True)
+        case "lightbulb.get_batch":
+            response = LightbulbBatchResponse(
+                success=True,
+                results=[
+                    LightbulbResponse(id=id, data=bulb, success=True)
+                    if (bulb := light_bulbs.get(id)) is not None
+                    else LightbulbResponse(id=id, success=False, error_message="Lightbulb ID not found")
+                    for id in request.ids
+                ],
+            )
+        case "lightbulb.toggle":
+            if request.id not in light_bulbs:
+                response = LightbulbResponse(success=False, error_message="Lightbulb ID not found")
+            else:
+                bulb = light_bulbs.toggle(request.id)
+                if persistence:
+                    persistence.log_status(request.id, bulb["status"])
+                record_event(request.id, bulb)
+                response = LightbulbResponse(id=request.id, data=bulb, success=True)
+        case "lightbulb.uninstall":
+            if request.id not in light_bulbs:
+                response = LightbulbResponse(success=False, error_message="Lightbulb ID not found")
+            else:
+                light_bulbs.uninstall(request.id)
+                if persistence:
+                    persistence.log_uninstall(request.id)
+                record_event(request.id, None)
+                response = LightbulbResponse(id=request.id, success=True)
+        case _:
+            response = LightbulbResponse(success=False, error_message="Unknown subject")
+
+    REQUEST_DURATION.observe(time.perf_counter() - started, sub)
+    if not response.success:
+        REQUEST_FAILURES.inc(sub)
+
+    return response
+
+
+def get_response(sub: str, data: str | bytes, headers: dict[str, str] | None = None) -> LightbulbResponse | LightbulbBatchResponse:
+    if sub not in REQUEST_MODELS:
+        return LightbulbResponse(success=False, error_message="Unknown subject")
+
+    try:
+        request = decode(data, headers, REQUEST_MODELS[sub])
+    except (ValidationError, CodecError) as e:
+        return get_error_response(sub, str(e))
+
+    return handle_request(sub, request)
+
+
+def get_reply(sub: str, data: bytes, headers: dict[str, str] | None = None) -> tuple[bytes, dict[str, str] | None]:
+    """Handle a request and encode the response as the requester asked"""
+    return encode_reply(get_response(sub, data, headers), headers)
+
+
+def get_responses(messages: list[tuple[str, bytes]], headers: list[dict[str, str] | None] | None = None) -> list[LightbulbResponse | LightbulbBatchResponse]:
+    """Process a batch of `(subject, data)` messages in order, decoded according to their `headers`.
+
+    Every payload is validated on its own: they come from different requesters, and parsing them together would let
+    one payload change how its neighbours are read.
+    """
+    headers = headers or [None] * len(messages)
+    responses = []
+    for (sub, data), message_headers in zip(messages, headers):
+        try:
+            responses.append(get_response(sub, data, message_headers))
+        except Exception as e:
+            logger.error(f"Unhandled processing error: {e}")
+            responses.append(LightbulbResponse(success=False, error_message="We encountered an unexpected error"))
+
+    return responses
+
+
 def construct_handler(nc: nats.aio.client.Client) -> typing.Coroutine:
-    def _get_response(sub: str, data: str) -> LightbulbResponse:
-        match sub:
-            case "lightbulb.install":
-                try:
-                    request = LightbulbRequest.model_validate_json(data)
-                except ValidationError as e:
-                    response = return_validation_error_response(e)
-                else:
-                    if request.id in light_bulbs:
-                        response = LightbulbResponse(success=False, error_message="Lightbulb ID already exists")
-                    else:
-                        light_bulbs[request.id] = {
-                            "ctx": request.data or {},
-                            "status": "OFF",
-                        }
-                        response = LightbulbResponse(id=request.id, data=light_bulbs[request.id], success=True)
-            case "lightbulb.get":
-                try:
-                    request = LightbulbRequest.model_validate_json(data)
-                except ValidationError as e:
-                    response = return_validation_error_response(e)
-                else:
-                    if request.id not in light_bulbs:
-                        response = LightbulbResponse(success=False, error_message="Lightbulb ID not found")
-                    else:
-                        response = LightbulbResponse(id=request.id, data=light_bulbs[request.id], success=True)
-            case "lightbulb.toggle":
-                try:
-                    request = LightbulbRequest.model_validate_json(data)
-                except ValidationError as e:
-                    response = return_validation_error_response(e)
-                else:
-                    if request.id not in light_bulbs:
-                        response = LightbulbResponse(success=False, error_message="Lightbulb ID not found")
-                    else:
-                        light_bulbs[request.id]["status"] = "OFF" if light_bulbs[request.id]["status"] == "ON" else "ON"
-                        response = LightbulbResponse(id=request.id, data=light_bulbs[request.id], success=True)
-            case "lightbulb.uninstall":
-                try:
-                    request = LightbulbRequest.model_validate_json(data)
-                except ValidationError as e:
-                    response = return_validation_error_response(e)
-                else:
-                    if request.id not in light_bulbs:
-                        response = LightbulbResponse(success=False, error_message="Lightbulb ID not found")
-                    else:
-                        del light_bulbs[request.id]
-                        response = LightbulbResponse(id=request.id, success=True)
-            case _:
-                response = LightbulbResponse(success=False, error_message="Unknown subject")
-
-        return response
+    pending_replies = set()
+
+    async def _publish_when_durable(durable: asyncio.Future, msg, response: LightbulbResponse | LightbulbBatchResponse, events: list[LightbulbEvent], span: tracing.Span):
+        if not await is_durable(durable):
+            response = get_error_response(base_subject(msg.subject), NOT_DURABLE_ERROR)
+        await publish_reply(nc, msg.reply, *encode_reply(response, msg.headers))
+        span.end()
+        await publish_events(nc, events)
 
     async def _handler(msg):
         subject = msg.subject
         reply = msg.reply
-        recv_data = msg.data.decode()
-        logger.info(f"Received a message on '{subject} {reply}': {recv_data}")
-        logger.info("State of light bulbs: %s", light_bulbs)
+        # Payloads are parsed straight from bytes, and may not be text at all
+        logger.info("Received a message on '%s %s' (%s bytes, headers %s)", subject, reply, len(msg.data), msg.headers)
+        if LOG_STATE:
+            logger.debug("State of light bulbs: %s", light_bulbs)
 
+        sub = base_subject(subject)
+        # Continues the requester's trace; ends once the reply is published
+        span = tracing.start_span(f"edge_link {sub}", "edge_link", tracing.extract(msg.headers))
         try:
-            response = _get_response(subject, recv_data)
+            response = get_response(sub, msg.data, msg.headers)
         except Exception as e:
             logger.error(f"Unhandled processing error: {e}")
             response = LightbulbResponse(success=False, error_message="We encountered an unexpected error")
 
-        reply_data = response.model_dump_json().encode()
-        logger.info(f"Sending response: {reply_data}")
+        events = take_events()
+        logger.info("Sending response: %s", response)
 
-        await nc.publish(reply, reply_data)
+        if persistence:
+            # Reply once the state change is durable without blocking the subscription, so the messages arriving
+            # meanwhile join the same group commit
+            task = asyncio.create_task(_publish_when_durable(persistence.sync(), msg, response, events, span))
+            pending_replies.add(task)
+            task.add_done_callback(pending_replies.discard)
+        else:
+            await publish_reply(nc, reply, *encode_reply(response, msg.headers))
+            span.end()
+            await publish_events(nc, events)
 
     return _handler
 
 
+class BatchProcessor:
+    """Processes edge link messages in micro-batches.
+
+    The subscription callback only queues the message. A single processing task drains everything queued since its
+    last run, validates and handles the batch, waits for one group commit when persistence is enabled and then
+    publishes all replies, which the NATS client writes to the socket in one flush.
+    """
+
+    def __init__(self, nc: nats.aio.client.Client, max_batch_size: int = MAX_BATCH_SIZE):
+        self.nc = nc
+        self.max_batch_size = max_batch_size
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    async def enqueue(self, msg):
+        self.queue.put_nowait(msg)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop processing after replying to the messages already queued"""
+        if self._task:
+            self.queue.put_nowait(None)
+            await self._task
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            # `None` is the stop marker queued by `stop`
+            messages = [msg for msg in batch if msg is not None]
+            if messages:
+                try:
+                    await self.process(messages)
+                except Exception as e:
+                    # Keep processing, messages queued after this batch would otherwise never be answered
+                    logger.error(f"Failed to reply to a batch of {len(messages)} messages: {e}")
+            if len(messages) != len(batch):
+                return
+
+    async def process(self, batch: list):
+        spans = [tracing.start_span(f"edge_link {base_subject(msg.subject)}", "edge_link", tracing.extract(msg.headers), batch_size=len(batch)) for msg in batch]
+        responses = get_responses([(base_subject(msg.subject), msg.data) for msg in batch], [msg.headers for msg in batch])
+        events = take_events()
+        logger.debug("Processed a batch of %s messages", len(batch))
+        if LOG_STATE:
+            logger.debug("State of light bulbs: %s", light_bulbs)
+
+        if persistence and not await is_durable(persistence.sync()):
+            responses = [get_error_response(base_subject(msg.subject), NOT_DURABLE_ERROR) for msg in batch]
+
+        for msg, response, span in zip(batch, responses, spans):
+            try:
+                await publish_reply(self.nc, msg.reply, *encode_reply(response, msg.headers))
+            except Exception as e:
+                # The rest of the batch is still replied to, a failed reply only leaves its own caller to time out
+                logger.error(f"Failed to reply to {msg.subject}: {e}")
+                span.end(e)
+            else:
+                span.end()
+        await publish_events(self.nc, events)
+
+
+class LaneScheduler:
+    """Processes edge link messages on `lane_count` lanes keyed by bulb ID.
+
+    Messages for the same bulb always land on the same lane, where they are handled, made durable and replied to
+    strictly one after another. Lanes run concurrently, so a lane waiting on a group commit or a slow reply does not
+    hold up bulbs on other lanes. Each lane queues at most `queue_size` messages; once a lane is full the subscription
+    callback waits for room, pushing back on the NATS client instead of buffering without bound. `get_batch` requests
+    are placed by their first ID and invalid messages on the first lane.
+    """
+
+    def __init__(self, nc: nats.aio.client.Client, lane_count: int = LANE_COUNT, queue_size: int = LANE_QUEUE_SIZE):
+        self.nc = nc
+        self.queues: list[asyncio.Queue] = [asyncio.Queue(queue_size) for _ in range(lane_count)]
+        self.max_depths = [0] * lane_count
+        self.processed = [0] * lane_count
+        self._tasks: list[asyncio.Task] = []
+
+    def lane_for(self, request: LightbulbMessage | None) -> int:
+        if isinstance(request, LightbulbBatchRequest):
+            key = request.ids[0] if request.ids else ""
+        else:
+            key = request.id if request else ""
+
+        # Not `shard_for`: a sharded process only sees IDs with one CRC32 residue, which would leave lanes idle
+        return hash(key) % len(self.queues)
+
+    async def enqueue(self, msg):
+        sub = base_subject(msg.subject)
+        try:
+            request = decode(msg.data, msg.headers, REQUEST_MODELS[sub]) if sub in REQUEST_MODELS else None
+        except (ValidationError, CodecError):
+            # Parsed again on the lane to build the error response
+            request = None
+
+        lane = self.lane_for(request)
+        queue = self.queues[lane]
+        # Started here so the span includes the wait on the lane
+        span = tracing.start_span(f"edge_link {sub}", "edge_link", tracing.extract(msg.headers), lane=lane)
+        await queue.put((msg, sub, request, span))
+        self.max_depths[lane] = max(self.max_depths[lane], queue.qsize())
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run(lane)) for lane in range(len(self.queues))]
+
+    async def stop(self):
+        """Stop processing after replying to the messages already queued"""
+        for queue in self.queues:
+            await queue.put(None)
+        await asyncio.gather(*self._tasks)
+
+    def depths(self) -> dict[tuple[str], int]:
+        return {(str(lane),): queue.qsize() for lane, queue in enumerate(self.queues)}
+
+    def stats(self) -> list[dict[str, int]]:
+        return [
+            {"lane": lane, "depth": queue.qsize(), "max_depth": self.max_depths[lane], "processed": self.processed[lane]}
+            for lane, queue in enumerate(self.queues)
+        ]
+
+    async def log_stats(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            stats = self.stats()
+            logger.info(
+                "Lane depths %s, max %s, processed %s",
+                [lane["depth"] for lane in stats], [lane["max_depth"] for lane in stats], sum(lane["processed"] for lane in stats),
+            )
+
+    async def _run(self, lane: int):
+        queue = self.queues[lane]
+        while (item := await queue.get()) is not None:
+            msg, sub, request, span = item
+            try:
+                await self.process(msg, sub, request, span)
+            except Exception as e:
+                # Keep the lane alive, its other bulbs would otherwise never be served again
+                logger.error(f"Failed to reply on lane {lane}: {e}")
+            self.processed[lane] += 1
+
+    async def process(self, msg, sub: str, request: LightbulbMessage | None, span: tracing.Span):
+        try:
+            response = get_response(sub, msg.data, msg.headers) if request is None else handle_request(sub, request)
+        except Exception as e:
+            logger.error(f"Unhandled processing error: {e}")
+            response = LightbulbResponse(success=False, error_message="We encountered an unexpected error")
+
+        # Nothing is awaited between handling and taking the events, so they all belong to this message
+        events = take_events()
+        if LOG_STATE:
+            logger.debug("State of light bulbs: %s", light_bulbs)
+
+        if persistence and not await is_durable(persistence.sync()):
+            response = get_error_response(sub, NOT_DURABLE_ERROR)
+
+        await publish_reply(self.nc, msg.reply, *encode_reply(response, msg.headers))
+        span.end()
+        await publish_events(self.nc, events)
+
+
+async def open_persistence():
+    """Recover the bulb registry and start persisting changes, if a data directory is configured"""
+    global persistence
+
+    if DATA_DIR:
+        persistence = EdgeLinkPersistence(DATA_DIR, commit_interval=COMMIT_INTERVAL_MS / 1000, snapshot_interval=SNAPSHOT_INTERVAL)
+        await persistence.start(light_bulbs)
+
+
+async def close_persistence():
+    global persistence
+
+    if persistence:
+        await persistence.close()
+        persistence = None
+
+
 async def main():
-    nc = await nats.connect("nats://nats:4222")
-    message_handler = construct_handler(nc)
+    await open_persistence()
+
+    nc = await nats.connect(NATS_URL)
+    processor = None
+    stats_task = None
+    metrics_server = await metrics.start_http_server(METRICS_PORT) if METRICS_PORT else None
+    if PROCESSING_MODE == "batch":
+        processor = BatchProcessor(nc)
+        processor.start()
+        message_handler = processor.enqueue
+    elif PROCESSING_MODE == "lanes":
+        processor = LaneScheduler(nc)
+        processor.start()
+        message_handler = processor.enqueue
+        if LANE_STATS_INTERVAL > 0:
+            stats_task = asyncio.create_task(processor.log_stats(LANE_STATS_INTERVAL))
+        metrics.gauge("edge_link_lane_depth", "Messages queued per lane", processor.depths, ("lane",))
+    else:
+        message_handler = construct_handler(nc)
+
+    for subject in SUBJECTS:
+        if SHARD_COUNT > 1:
+            subject = shard_subject(subject, SHARD_INDEX)
 
-    await nc.subscribe("lightbulb.install", cb=message_handler)
-    await nc.subscribe("lightbulb.get", cb=message_handler)
-    await nc.subscribe("lightbulb.toggle", cb=message_handler)
-    await nc.subscribe("lightbulb.uninstall", cb=message_handler)
+        await nc.subscribe(subject, cb=message_handler)
 
     try:
         while True:
             await asyncio.sleep(1)
     except asyncio.CancelledError:
         logger.info("Shutting down NATS edge link simulator")
+        if stats_task:
+            stats_task.cancel()
+        if metrics_server:
+            metrics_server.close()
+        if processor:
+            await processor.stop()
         await nc.drain()
+        await close_persistence()
 
 
 if __name__ == '__main__':
-    logger.info("Starting NATS edge link simulator")
+    logger.info("Starting NATS edge link simulator (shard %s of %s, %s processing)", SHARD_INDEX, SHARD_COUNT, PROCESSING_MODE)
     asyncio.run(main())
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import time
+from pathlib import Path
+from typing import Callable, Iterable, TypeVar
+
+from .store import LightbulbStore
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+WAL_PREFIX = "wal-"
+SNAPSHOT_PREFIX = "snapshot-"
+# Snapshot rows are written as JSON arrays of this many rows per line, which parses much faster than a line per row
+SNAPSHOT_CHUNK_ROWS = 10_000
+
+
+class PersistenceError(Exception):
+    """Raised from `sync` once the write-ahead log failed to write, since later changes can no longer be made durable"""
+
+
+def _segment_path(directory: Path, prefix: str, seq: int, suffix: str) -> Path:
+    return directory / f"{prefix}{seq:08d}{suffix}"
+
+
+def _list_segments(directory: Path, prefix: str, suffix: str) -> list[tuple[int, Path]]:
+    segments = []
+    for path in directory.glob(f"{prefix}*{suffix}"):
+        try:
+            segments.append((int(path.name[len(prefix):-len(suffix)]), path))
+        except ValueError:
+            continue
+
+    return sorted(segments)
+
+
+def _encode(record: list) -> bytes:
+    return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+
+def _read_lines(path: Path) -> Iterable[bytes]:
+    """Yield the lines of a file through a read-only memory map, skipping a torn trailing line."""
+    if path.stat().st_size == 0:
+        return
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line in iter(mm.readline, b""):
+            if not line.endswith(b"\n"):
+                logger.warning("Ignoring incomplete record at the end of %s", path)
+                return
+            yield line
+
+
+class WriteAheadLog:
+    """Append-only log of state changes with group-commit fsync.
+
+    `append` only buffers the record in memory; a background task writes and fsyncs everything buffered at most every
+    `commit_interval` seconds (sooner once `max_batch_bytes` is reached), so the fsync cost is shared by every message
+    in the group. `sync` waits until all records appended before it are durable.
+
+    A failed write (a full disk, an I/O or fsync error) may leave a partial record behind, and the log cannot tell
+    which changes survived. It stops writing and every pending and later `sync` raises `PersistenceError` until the
+    process is restarted and recovers from what is on disk.
+    """
+
+    def __init__(self, directory: Path, seq: int, commit_interval: float = 0.002, max_batch_bytes: int = 1 << 20):
+        self.directory = directory
+        self.seq = seq
+        self.commit_interval = commit_interval
+        self.max_batch_bytes = max_batch_bytes
+        self.records_since_rotation = 0
+
+        self._fd = self._open_segment(seq)
+        self._buffer = bytearray()
+        self._waiters: list[asyncio.Future] = []
+        self._wakeup = asyncio.Event()
+        self._io_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self.error: OSError | None = None
+
+    def _open_segment(self, seq: int) -> int:
+        return os.open(_segment_path(self.directory, WAL_PREFIX, seq, ".log"), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def append(self, record: list):
+        self._buffer += _encode(record)
+        self.records_since_rotation += 1
+        self._wakeup.set()
+
+    def sync(self) -> asyncio.Future:
+        waiter = asyncio.get_running_loop().create_future()
+        if self.error is not None:
+            waiter.set_exception(self._failure())
+        elif not self._buffer and not self._io_lock.locked():
+            waiter.set_result(None)
+        else:
+            self._waiters.append(waiter)
+            self._wakeup.set()
+
+        return waiter
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            if len(self._buffer) < self.max_batch_bytes:
+                # Let more records join this group before paying for the fsync
+                await asyncio.sleep(self.commit_interval)
+            self._wakeup.clear()
+            await self._commit()
+
+    def _failure(self) -> PersistenceError:
+        return PersistenceError(f"Write-ahead log segment {self.seq} failed: {self.error}")
+
+    async def _write_buffer(self, fd: int, buffer: bytearray):
+        if not buffer or self.error is not None:
+            return
+        try:
+            await asyncio.to_thread(self._write, fd, bytes(buffer))
+        except OSError as e:
+            logger.error("Failed to write the write-ahead log, no further changes will be durable: %s", e)
+            self.error = e
+
+    def _resolve(self, waiters: list[asyncio.Future]):
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if self.error is not None:
+                waiter.set_exception(self._failure())
+            else:
+                waiter.set_result(None)
+
+    async def _commit(self):
+        async with self._io_lock:
+            buffer, self._buffer = self._buffer, bytearray()
+            waiters, self._waiters = self._waiters, []
+            await self._write_buffer(self._fd, buffer)
+
+        self._resolve(waiters)
+
+    @staticmethod
+    def _write(fd: int, data: bytes):
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        os.fsync(fd)
+
+    async def rotate(self, capture: Callable[[], T]) -> tuple[int, T]:
+        """Continue in a new segment, returning its sequence number and the result of `capture`.
+
+        `capture` runs in the same event loop step as the switch, so it observes exactly the changes logged before the
+        new segment starts. Records buffered for the old segment are committed to it before returning.
+        """
+        async with self._io_lock:
+            buffer, self._buffer = self._buffer, bytearray()
+            waiters, self._waiters = self._waiters, []
+            old_fd = self._fd
+            self.seq += 1
+            self._fd = self._open_segment(self.seq)
+            self.records_since_rotation = 0
+            captured = capture()
+
+            await self._write_buffer(old_fd, buffer)
+            os.close(old_fd)
+
+        self._resolve(waiters)
+        if self.error is not None:
+            raise self._failure()
+
+        return self.seq, captured
+
+    async def close(self):
+        # Let the commit task finish its current group rather than cancelling it halfway through a write
+        self._closing = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+        await self._commit()
+        os.close(self._fd)
+
+
+class EdgeLinkPersistence:
+    """Durable storage for the edge link's bulb state.
+
+    Every state change is appended to the write-ahead log. Periodically the full state is written to a compacted
+    snapshot, after which older log segments are deleted. A snapshot with sequence number N holds the state as of the
+    start of log segment N, so recovery loads the newest snapshot and replays segments N and later.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        commit_interval: float = 0.002,
+        snapshot_interval: float = 60,
+        snapshot_min_records: int = 100_000,
+    ):
+        self.directory = Path(directory)
+        self.commit_interval = commit_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_min_records = snapshot_min_records
+        self.wal: WriteAheadLog | None = None
+        self._snapshot_task: asyncio.Task | None = None
+
+    def recover(self, light_bulbs: LightbulbStore) -> int:
+        """Load the newest snapshot and replay the log into `light_bulbs`. Returns the next log sequence number."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+
+        snapshots = _list_segments(self.directory, SNAPSHOT_PREFIX, ".dat")
+        seq = 0
+        if snapshots:
+            seq, path = snapshots[-1]
+            for line in _read_lines(path):
+                for id, status, ctx in json.loads(line):
+                    light_bulbs.install(id, ctx, status)
+
+        replayed = 0
+        for segment_seq, path in _list_segments(self.directory, WAL_PREFIX, ".log"):
+            if segment_seq < seq:
+                continue
+            for line in _read_lines(path):
+                self._apply(light_bulbs, json.loads(line))
+                replayed += 1
+            seq = segment_seq + 1
+
+        logger.info("Recovered %s lightbulbs (%s log records replayed) in %.3fs", len(light_bulbs), replayed, time.perf_counter() - started)
+        return seq
+
+    @staticmethod
+    def _apply(light_bulbs: LightbulbStore, record: list):
+        match record:
+            case ["install", id, ctx]:
+                light_bulbs.uninstall(id)
+                light_bulbs.install(id, ctx)
+            case ["status", id, status]:
+                light_bulbs.set_status(id, status)
+            case ["uninstall", id]:
+                light_bulbs.uninstall(id)
+
+    async def start(self, light_bulbs: LightbulbStore):
+        seq = self.recover(light_bulbs)
+        # Always write into a fresh segment so a torn tail from a crash is never appended to
+        self.wal = WriteAheadLog(self.directory, seq, self.commit_interval)
+        self.wal.start()
+        self._snapshot_task = asyncio.create_task(self._snapshot_periodically(light_bulbs))
+
+    def log_install(self, id: str, ctx: dict):
+        self.wal.append(["install", id, ctx])
+
+    def log_status(self, id: str, status: str):
+        self.wal.append(["status", id, status])
+
+    def log_uninstall(self, id: str):
+        self.wal.append(["uninstall", id])
+
+    def sync(self) -> asyncio.Future:
+        return self.wal.sync()
+
+    async def _snapshot_periodically(self, light_bulbs: LightbulbStore):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if self.wal.records_since_rotation >= self.snapshot_min_records:
+                try:
+                    await self.snapshot(light_bulbs)
+                except Exception as e:
+                    logger.exception("Failed to write snapshot: %s", e)
+
+    async def snapshot(self, light_bulbs: LightbulbStore):
+        seq, rows = await self.wal.rotate(lambda: list(light_bulbs.rows()))
+        await asyncio.to_thread(self._write_snapshot, seq, rows)
+
+        for segment_seq, path in _list_segments(self.directory, WAL_PREFIX, ".log"):
+            if segment_seq < seq:
+                path.unlink()
+        for snapshot_seq, path in _list_segments(self.directory, SNAPSHOT_PREFIX, ".dat"):
+            if snapshot_seq < seq:
+                path.unlink()
+
+    def _write_snapshot(self, seq: int, rows: list[tuple]):
+        started = time.perf_counter()
+        path = _segment_path(self.directory, SNAPSHOT_PREFIX, seq, ".dat")
+        tmp_path = path.with_suffix(".tmp")
+
+        with open(tmp_path, "wb", buffering=1 << 20) as f:
+            for start in range(0, len(rows), SNAPSHOT_CHUNK_ROWS):
+                f.write(_encode(rows[start:start + SNAPSHOT_CHUNK_ROWS]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+        logger.info("Wrote snapshot %s with %s lightbulbs in %.3fs", path.name, len(rows), time.perf_counter() - started)
+
+    async def close(self):
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+        if self.wal:
+            await self.wal.close()
@@ -0,0 +1,97 @@
+from typing import Iterator
+
+
+class LightbulbStore:
+    """Compact registry of light bulbs.
+
+    Each bulb ID maps to an integer slot, statuses are kept as bits of a bytearray (1 = ON) and `ctx`
+    payloads are only stored for bulbs that have one. Bulbs are rendered as `{"ctx": ..., "status": ...}` dicts on
+    access, matching the shape returned to the worker.
+    """
+
+    def __init__(self):
+        self._slots: dict[str, int] = {}
+        self._status = bytearray()
+        self._ctx: dict[int, dict] = {}
+        self._free_slots: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self._slots
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def _is_on(self, slot: int) -> bool:
+        return bool(self._status[slot >> 3] & (1 << (slot & 7)))
+
+    def _set_on(self, slot: int, on: bool):
+        if on:
+            self._status[slot >> 3] |= 1 << (slot & 7)
+        else:
+            self._status[slot >> 3] &= ~(1 << (slot & 7)) & 0xFF
+
+    def _render(self, slot: int) -> dict:
+        return {"ctx": self._ctx.get(slot, {}), "status": "ON" if self._is_on(slot) else "OFF"}
+
+    def install(self, id: str, ctx: dict | None = None, status: str = "OFF") -> dict:
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._slots)
+            if slot >> 3 >= len(self._status):
+                self._status.append(0)
+
+        self._slots[id] = slot
+        self._set_on(slot, status == "ON")
+        if ctx:
+            self._ctx[slot] = ctx
+
+        return self._render(slot)
+
+    def get(self, id: str) -> dict | None:
+        slot = self._slots.get(id)
+        return None if slot is None else self._render(slot)
+
+    def set_status(self, id: str, status: str) -> dict | None:
+        slot = self._slots.get(id)
+        if slot is None:
+            return None
+
+        self._set_on(slot, status == "ON")
+        return self._render(slot)
+
+    def toggle(self, id: str) -> dict | None:
+        slot = self._slots.get(id)
+        if slot is None:
+            return None
+
+        self._set_on(slot, not self._is_on(slot))
+        return self._render(slot)
+
+    def uninstall(self, id: str) -> bool:
+        slot = self._slots.pop(id, None)
+        if slot is None:
+            return False
+
+        self._set_on(slot, False)
+        self._ctx.pop(slot, None)
+        self._free_slots.append(slot)
+        return True
+
+    def clear(self):
+        self._slots.clear()
+        self._status.clear()
+        self._ctx.clear()
+        self._free_slots.clear()
+
+    def rows(self) -> Iterator[tuple[str, str, dict]]:
+        """Iterate over `(id, status, ctx)` without building per-bulb dicts"""
+        for id, slot in self._slots.items():
+            yield id, "ON" if self._is_on(slot) else "OFF", self._ctx.get(slot, {})
+
+    def items(self) -> Iterator[tuple[str, dict]]:
+        for id, slot in self._slots.items():
+            yield id, self._render(slot)
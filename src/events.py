@@ -0,0 +1,12 @@
+EVENTS_SUBJECT = "lightbulb.events"
+# Wildcard subscription covering the events of every bulb
+ALL_EVENTS_SUBJECT = f"{EVENTS_SUBJECT}.>"
+
+
+def event_subject(bulb_id: str) -> str | None:
+    """Subject of a bulb's state change events, or `None` if the bulb ID cannot be used in a NATS subject."""
+    tokens = bulb_id.split(".")
+    if any(not token or token in ("*", ">") or any(c.isspace() for c in token) for token in tokens):
+        return None
+
+    return f"{EVENTS_SUBJECT}.{bulb_id}"
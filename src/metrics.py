@@ -0,0 +1,217 @@
+"""Low-overhead metrics for the API, the Restate worker and the edge link, scraped in the Prometheus text format.
+
+Recording a value is a dict lookup and a couple of additions. There are no locks, since every process records from
+its event loop thread, and no label objects: label values are passed positionally in the order the metric declares
+them. Gauges are read from a callback when scraped, so nothing is recorded for them on the hot path.
+
+    REQUESTS = metrics.counter("requests_total", "Requests handled", ("subject",))
+    REQUESTS.inc("lightbulb.get")
+"""
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, from a fast edge link lookup up to a request that ran into a timeout
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Sample = tuple[str, tuple[str, ...], tuple[str, ...], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_sample(name: str, label_names: tuple[str, ...], label_values: tuple[str, ...], value: float) -> str:
+    if label_names:
+        labels = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in zip(label_names, label_values))
+        name = f"{name}{{{labels}}}"
+    if value == float("inf"):
+        return f"{name} +Inf"
+
+    return f"{name} {value}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        values = self.values
+        values[labels] = values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def samples(self) -> Iterator[Sample]:
+        for label_values, value in list(self.values.items()):
+            yield self.name, self.labels, label_values, value
+
+
+class Histogram:
+    """Counts observations into cumulative `le` buckets, as Prometheus expects them"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: the count of each bucket, of the implicit +Inf bucket, and the sum of all observations last
+        self.series: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """Observe how long the block takes"""
+        return _Timer(self, labels)
+
+    def count(self, *labels: str) -> int:
+        series = self.series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self) -> Iterator[Sample]:
+        bucket_labels = (*self.labels, "le")
+        bounds = [repr(bound) for bound in self.buckets] + ["+Inf"]
+        for label_values, series in list(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, series):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", bucket_labels, (*label_values, bound), cumulative
+            yield f"{self.name}_count", self.labels, label_values, cumulative
+            yield f"{self.name}_sum", self.labels, label_values, series[-1]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Gauge:
+    """A value read when scraped. The callback returns a number, or for labelled gauges a dict keyed by label values."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float | dict[tuple[str, ...], float]], labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.fn = fn
+
+    def samples(self) -> Iterator[Sample]:
+        value = self.fn()
+        if isinstance(value, dict):
+            for label_values, label_value in value.items():
+                yield self.name, self.labels, label_values, label_value
+        else:
+            yield self.name, self.labels, (), value
+
+
+Metric = Counter | Histogram | Gauge
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, replacing any earlier one of the same name, such as the gauges of a restarted component"""
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # A failing gauge callback must not take the whole scrape down
+                logger.warning(f"Could not collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(_format_sample(*sample) for sample in samples)
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def histogram(name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+def gauge(name: str, help: str, fn: Callable[[], float | dict[tuple[str, ...], float]], labels: tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, fn, labels))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+async def asgi_app(scope, receive, send):
+    """Serve the scrape as an ASGI response, for mounting next to another ASGI app"""
+    body = render().encode()
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", CONTENT_TYPE.encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        # Skip the request headers
+        while await reader.readline() not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, content_type, body = "200 OK", CONTENT_TYPE, render().encode()
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"Not Found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except (ConnectionError, UnicodeDecodeError) as e:
+        logger.debug(f"Metrics connection failed: {e}")
+    finally:
+        writer.close()
+
+
+async def start_http_server(port: int, host: str = "0.0.0.0") -> asyncio.Server:
+    """Serve `GET /metrics` for processes without a web framework, such as the edge link"""
+    server = await asyncio.start_server(_serve_connection, host, port)
+    logger.info(f"Serving metrics on {host}:{port}/metrics")
+    return server
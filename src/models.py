@@ -24,5 +24,19 @@ class LightbulbResponse(BaseModel):
     data: dict | None = None
     error_message: str | None = None
 
+class LightbulbBatchRequest(BaseModel):
+    ids: list[str]
+
+class LightbulbBatchResponse(BaseModel):
+    success: bool
+
+    results: list[LightbulbResponse] = []
+    error_message: str | None = None
+
 class ToggleLightbulbResponse(LightbulbRequest):
     run_time: int
+
+class LightbulbEvent(BaseModel):
+    id: str
+    # The bulb after the change, `None` once it is uninstalled
+    data: dict | None = None
@@ -0,0 +1,28 @@
+import zlib
+
+
+def shard_for(bulb_id: str, shard_count: int) -> int:
+    """Map a bulb ID to its edge link shard. Uses CRC32 since it is stable across processes, unlike `hash()`."""
+    return zlib.crc32(bulb_id.encode()) % shard_count
+
+
+def shard_subject(subject: str, shard: int) -> str:
+    """Turn a subject such as `lightbulb.install` into its shard-aware form `lightbulb.<shard>.install`."""
+    prefix, _, action = subject.partition(".")
+    return f"{prefix}.{shard}.{action}"
+
+
+def base_subject(subject: str) -> str:
+    """Strip the shard token from a shard-aware subject, leaving unsharded subjects unchanged."""
+    parts = subject.split(".")
+    if len(parts) == 3 and parts[1].isdigit():
+        return f"{parts[0]}.{parts[2]}"
+
+    return subject
+
+
+def route_subject(subject: str, bulb_id: str, shard_count: int) -> str:
+    if shard_count <= 1:
+        return subject
+
+    return shard_subject(subject, shard_for(bulb_id, shard_count))
@@ -0,0 +1,252 @@
+"""Lightweight distributed tracing across the API, the Restate worker and the edge link.
+
+Trace context travels as a W3C `traceparent` header: on Restate ingress calls, into handlers through
+`ctx.request().headers`, and on NATS requests to the edge link. Finished spans go to a local exporter, either kept in
+memory or appended as JSON lines to a file, and `breakdown` turns them into per-stage latencies. No collector needed:
+
+    TRACING_EXPORTER=file TRACING_FILE=traces/api.jsonl ...
+    python -m src.tracing traces/*.jsonl
+"""
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, Mapping, Protocol
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT = "traceparent"
+# "none" disables tracing, "memory" keeps the last `TRACING_MAX_SPANS` spans, "file" appends them to `TRACING_FILE`
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_MAX_SPANS = int(os.getenv("TRACING_MAX_SPANS", "10000"))
+# Share of new traces that are recorded; spans continuing a trace follow the caller's decision
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "1"))
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: str | None) -> SpanContext | None:
+    """Parse a `traceparent` header, `None` if it is missing or malformed"""
+    parts = value.strip().split("-") if value else []
+    if len(parts) < 4 or parts[0] == "ff" or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+
+class Exporter(Protocol):
+    def export(self, span: dict): ...
+
+
+class InMemoryExporter:
+    def __init__(self, max_spans: int = TRACING_MAX_SPANS):
+        self.spans: deque[dict] = deque(maxlen=max_spans)
+
+    def export(self, span: dict):
+        self.spans.append(span)
+
+    def breakdown(self) -> dict:
+        return breakdown(self.spans)
+
+
+class FileExporter:
+    """Appends spans as JSON lines. Each process should write its own file; `breakdown` joins them by trace ID."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "a", buffering=1)
+
+    def export(self, span: dict):
+        self.file.write(json.dumps(span) + "\n")
+
+
+def exporter_from_env() -> Exporter | None:
+    match TRACING_EXPORTER:
+        case "memory":
+            return InMemoryExporter()
+        case "file":
+            return FileExporter(TRACING_FILE)
+        case _:
+            return None
+
+
+exporter: Exporter | None = exporter_from_env()
+current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+def set_exporter(new_exporter: Exporter | None):
+    global exporter
+    exporter = new_exporter
+
+
+class Span:
+    """A timed operation. Spans without a context belong to no trace and are neither propagated nor exported."""
+
+    __slots__ = ("name", "service", "context", "parent_id", "attributes", "start_time", "_started", "_ended")
+
+    def __init__(self, name: str, service: str, context: SpanContext | None, parent_id: str | None, attributes: dict[str, Any]):
+        self.name = name
+        self.service = service
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self._ended = False
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, error: BaseException | None = None):
+        if self._ended:
+            return
+        self._ended = True
+        if self.context is None or not self.context.sampled or exporter is None:
+            return
+
+        if error is not None:
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+        try:
+            exporter.export({
+                "trace_id": self.context.trace_id,
+                "span_id": self.context.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "service": self.service,
+                "start": self.start_time,
+                "duration_ms": round((time.perf_counter() - self._started) * 1000, 3),
+                "attributes": self.attributes,
+            })
+        except Exception as e:
+            logger.warning(f"Could not export span {self.name}: {e}")
+
+
+def start_span(name: str, service: str, parent: SpanContext | None = None, **attributes: Any) -> Span:
+    """Start a span as a child of `parent`, or of the current span, or as the root of a new trace.
+
+    New traces are only started while an exporter is configured, so untraced processes add no headers.
+    """
+    if parent is None and (active := current_span.get()) is not None:
+        parent = active.context
+
+    if parent is not None:
+        context = SpanContext(parent.trace_id, random.getrandbits(64).to_bytes(8).hex(), parent.sampled)
+    elif exporter is not None:
+        context = SpanContext(random.getrandbits(128).to_bytes(16).hex(), random.getrandbits(64).to_bytes(8).hex(), random.random() < TRACING_SAMPLE_RATE)
+    else:
+        context = None
+
+    return Span(name, service, context, parent.span_id if parent else None, attributes)
+
+
+@contextmanager
+def span(name: str, service: str, parent: SpanContext | None = None, **attributes: Any) -> Iterator[Span]:
+    """Run the block in a new span, which becomes the current span for everything the block starts"""
+    new_span = start_span(name, service, parent, **attributes)
+    token = current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.end(e)
+        raise
+    else:
+        new_span.end()
+    finally:
+        current_span.reset(token)
+
+
+def inject(headers: dict[str, str] | None = None) -> dict[str, str] | None:
+    """Add the current trace context to `headers`, returning them unchanged when there is no trace"""
+    active = current_span.get()
+    if active is None or active.context is None:
+        return headers
+
+    return {**(headers or {}), TRACEPARENT: active.context.traceparent}
+
+
+def extract(headers: Mapping[str, str] | None) -> SpanContext | None:
+    """Read the trace context from headers, ignoring their case"""
+    if not isinstance(headers, Mapping):
+        return None
+
+    value = headers.get(TRACEPARENT)
+    if value is None:
+        value = next((v for k, v in headers.items() if k.lower() == TRACEPARENT), None)
+
+    return parse_traceparent(value)
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    return round(sorted_values[min(len(sorted_values) - 1, int(pct / 100 * len(sorted_values)))], 3)
+
+
+def breakdown(spans: Iterable[dict]) -> dict:
+    """Summarize spans by stage (span name): latency percentiles and self time, the part not spent in child spans.
+
+    A parent's self time covers whatever happens between it and its children, such as Restate queuing an invocation
+    before the worker starts on it.
+    """
+    spans = list(spans)
+    child_time: dict[tuple[str, str], float] = {}
+    for span_ in spans:
+        if span_["parent_id"]:
+            key = (span_["trace_id"], span_["parent_id"])
+            child_time[key] = child_time.get(key, 0.0) + span_["duration_ms"]
+
+    stages: dict[str, dict[str, list[float]]] = {}
+    for span_ in spans:
+        stage = stages.setdefault(span_["name"], {"durations": [], "self": []})
+        stage["durations"].append(span_["duration_ms"])
+        stage["self"].append(max(0.0, span_["duration_ms"] - child_time.get((span_["trace_id"], span_["span_id"]), 0.0)))
+
+    report = {}
+    for name, stage in sorted(stages.items(), key=lambda item: -sum(item[1]["self"])):
+        durations, self_times = sorted(stage["durations"]), sorted(stage["self"])
+        report[name] = {
+            "count": len(durations),
+            "p50_ms": _percentile(durations, 50),
+            "p95_ms": _percentile(durations, 95),
+            "p99_ms": _percentile(durations, 99),
+            "self_p50_ms": _percentile(self_times, 50),
+            "self_p95_ms": _percentile(self_times, 95),
+            "self_total_ms": round(sum(self_times), 3),
+        }
+
+    return report
+
+
+def read_spans(paths: Iterable[str]) -> Iterator[dict]:
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+if __name__ == "__main__":
+    print(json.dumps(breakdown(read_spans(sys.argv[1:])), indent=2))
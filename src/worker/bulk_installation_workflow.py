@@ -0,0 +1,90 @@
+from collections import deque
+
+from restate import Workflow, WorkflowContext, WorkflowSharedContext
+from restate.exceptions import TerminalError
+
+from . import lightbulb_workflow
+from .models import BulkInstallationInput, FailurePageInput, InstallationFailure, InstallationFailurePage, InstallationProgress
+
+# Failures are stored in pages so recording one only rewrites its page rather than every failure so far
+FAILURE_PAGE_SIZE = 100
+# Upper bound on `concurrency`, whatever the caller asked for
+MAX_CONCURRENCY = 200
+# Progress is written every this many completions rather than after each one, so the journal does not gain a state
+# entry per child on top of the child's own call
+PROGRESS_INTERVAL = 50
+
+bulk_installation_workflow = Workflow("BulkInstallationWorkflow")
+
+
+def failure_page_key(page: int) -> str:
+    return f"failures.{page}"
+
+
+@bulk_installation_workflow.main()
+async def run(ctx: WorkflowContext, req: BulkInstallationInput) -> InstallationProgress:
+    """Install many bulbs, running at most `req.concurrency` (capped at `MAX_CONCURRENCY`) child
+    `InstallationWorkflow`s at a time.
+
+    Child calls are started ahead of awaiting them and awaited oldest first; each completion starts the next child,
+    so the window stays full except behind a slow child. Progress and failures are written to workflow state every
+    `PROGRESS_INTERVAL` completions and once done, and can be read while the rollout runs with `get_progress` and
+    `get_failures`.
+    """
+    progress = InstallationProgress(total=len(req.installs))
+    failure_page: list[dict] = []
+    # Whether the current failure page has failures not yet written
+    failures_pending = False
+    installs = iter(req.installs)
+    window = deque()
+
+    def _start_next():
+        install = next(installs, None)
+        if install is not None:
+            window.append((install.id, ctx.workflow_call(lightbulb_workflow.run, key=install.id, arg=install)))
+
+    def _save_failures():
+        nonlocal failures_pending
+        if failures_pending:
+            ctx.set(failure_page_key((progress.failed - 1) // FAILURE_PAGE_SIZE), failure_page)
+            failures_pending = False
+
+    for _ in range(min(max(1, req.concurrency), MAX_CONCURRENCY)):
+        _start_next()
+    ctx.set("progress", progress.model_dump())
+
+    while window:
+        id, call = window.popleft()
+        try:
+            await call
+            progress.succeeded += 1
+        except TerminalError as e:
+            progress.failed += 1
+            failure_page.append(InstallationFailure(id=id, error=str(e)).model_dump())
+            failures_pending = True
+            if len(failure_page) == FAILURE_PAGE_SIZE:
+                _save_failures()
+                failure_page = []
+
+        progress.completed += 1
+        _start_next()
+        if not window:
+            progress.status = "completed"
+        if not window or progress.completed % PROGRESS_INTERVAL == 0:
+            # Failures first, so progress never counts a failure that `get_failures` cannot return yet
+            _save_failures()
+            ctx.set("progress", progress.model_dump())
+
+    return progress
+
+
+@bulk_installation_workflow.handler()
+async def get_progress(ctx: WorkflowSharedContext) -> InstallationProgress:
+    progress = await ctx.get("progress")
+    return InstallationProgress(**progress) if progress else InstallationProgress()
+
+
+@bulk_installation_workflow.handler()
+async def get_failures(ctx: WorkflowSharedContext, input_: FailurePageInput) -> InstallationFailurePage:
+    failures = await ctx.get(failure_page_key(input_.page))
+    return InstallationFailurePage(page=input_.page, failures=failures or [])
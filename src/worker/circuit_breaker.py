@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from src import metrics
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+# Gauge values, ordered by severity
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_TRANSITIONS = metrics.counter("circuit_breaker_transitions_total", "Circuit state changes, by the state entered", ("circuit", "state"))
+CIRCUIT_REJECTED = metrics.counter("circuit_breaker_rejected_total", "Calls failed fast without being sent", ("circuit",))
+RETRIES = metrics.counter("circuit_breaker_retries_total", "Failed calls retried in-process", ("circuit",))
+RETRIES_DENIED = metrics.counter("circuit_breaker_retries_denied_total", "Failed calls not retried because the retry budget was spent", ("circuit",))
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling while a circuit is open, or while its half-open probes are still running"""
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter, so callers that failed together do not retry together"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RetryBudget:
+    """Caps retries at a share of requests, as a token bucket: each request deposits `ratio` tokens and each retry
+    takes one. When the dependency is down every request fails, and the budget keeps retries from multiplying load."""
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """Fails calls fast while the callee looks down.
+
+    Closed, calls go through and `failure_threshold` consecutive failures open the circuit. Open, calls raise
+    `CircuitOpenError` until the reset timeout has passed; it doubles with every reopening up to `max_reset_timeout`
+    and is jittered so the workers sharing an edge link do not probe in lockstep. Half-open, up to
+    `half_open_max_calls` probes go through: a successful one closes the circuit, a failed one opens it again. Only
+    `failures` count against the callee; other exceptions, such as the caller shedding load, leave the state as is.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failures: tuple[type[BaseException], ...],
+        failure_threshold: int = 5,
+        reset_timeout: float = 1.0,
+        max_reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failures = failures
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+
+        self._state = CLOSED
+        self.consecutive_failures = 0
+        # Times opened since the circuit was last closed, which sets the next reset timeout
+        self.reopenings = 0
+        self.open_until = 0.0
+        self.probes = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self.clock() >= self.open_until:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state: str):
+        logger.info(f"Circuit {self.name} is {state.replace('_', '-')}")
+        self._state = state
+        CIRCUIT_TRANSITIONS.inc(self.name, state)
+
+    def _open(self):
+        timeout = min(self.max_reset_timeout, self.reset_timeout * 2 ** self.reopenings)
+        self.open_until = self.clock() + random.uniform(timeout / 2, timeout)
+        self.reopenings += 1
+        self._transition(OPEN)
+
+    def _allow(self) -> bool:
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and self.probes < self.half_open_max_calls:
+            self.probes += 1
+            return True
+        return False
+
+    # Only probes move a half-open circuit; calls let through while it was closed may finish after it left that state
+    def record_success(self, probe: bool = False):
+        self.consecutive_failures = 0
+        if probe and self._state == HALF_OPEN:
+            self.reopenings = 0
+            self._transition(CLOSED)
+
+    def record_failure(self, probe: bool = False):
+        self.consecutive_failures += 1
+        if (probe and self._state == HALF_OPEN) or (self._state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self._open()
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        if not self._allow():
+            CIRCUIT_REJECTED.inc(self.name)
+            raise CircuitOpenError(f"Circuit {self.name} is open")
+
+        probe = self._state == HALF_OPEN
+        try:
+            result = await fn()
+        except self.failures:
+            self.record_failure(probe)
+            raise
+        else:
+            self.record_success(probe)
+            return result
+        finally:
+            if probe:
+                self.probes -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "reopenings": self.reopenings,
+            "retry_in": round(max(0.0, self.open_until - self.clock()), 3) if self._state == OPEN else 0.0,
+        }
+
+
+async def call_with_retries(
+    breaker: CircuitBreaker,
+    budget: RetryBudget,
+    fn: Callable[[], Awaitable[T]],
+    retry_on: tuple[type[BaseException], ...],
+    max_retries: int,
+    base_delay: float,
+    max_delay: float,
+) -> T:
+    """Call through the breaker, retrying `retry_on` failures after a jittered backoff while the budget allows.
+
+    Open circuits are never retried here; that is left to the caller's own, slower retries.
+    """
+    budget.deposit()
+    attempt = 0
+    while True:
+        try:
+            return await breaker.call(fn)
+        except retry_on:
+            if attempt >= max_retries:
+                raise
+            if not budget.withdraw():
+                RETRIES_DENIED.inc(breaker.name)
+                raise
+        attempt += 1
+        RETRIES.inc(breaker.name)
+        await asyncio.sleep(backoff(attempt, base_delay, max_delay))
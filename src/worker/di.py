@@ -1,10 +1,37 @@
+import json
+import os
+
 import wireup
 
 from . import services
 
 container = wireup.create_container(
     parameters={
-        "nats_url": "nats://nats:4222",
+        "nats_url": os.getenv("NATS_URL", "nats://nats:4222"),
+        "nats_pool_size": int(os.getenv("NATS_POOL_SIZE", "1")),
+        "nats_max_in_flight": int(os.getenv("NATS_MAX_IN_FLIGHT", "256")),
+        "nats_max_queue": int(os.getenv("NATS_MAX_QUEUE", "1024")),
+        "nats_timeout": float(os.getenv("NATS_TIMEOUT", "1")),
+        # JSON object of per-subject timeouts in seconds, e.g. {"lightbulb.get_batch": 3}
+        "nats_subject_timeouts": json.loads(os.getenv("NATS_SUBJECT_TIMEOUTS", "{}")),
+        # "nats" or "memory" to embed the edge link in the worker process
+        "nats_transport": os.getenv("NATS_TRANSPORT", "nats"),
+        # "json" or "binary"; binary requests need edge links that understand it, replies are negotiated either way
+        "nats_codec": os.getenv("NATS_CODEC", "json"),
+        # Payloads of at least this many bytes are compressed, in both directions; 0 never compresses
+        "nats_compression_threshold": int(os.getenv("NATS_COMPRESSION_THRESHOLD", "4096")),
+        "edge_link_shards": int(os.getenv("EDGE_LINK_SHARD_COUNT", "1")),
+        # Consecutive unreachable or timed out requests that open a shard's circuit
+        "edge_link_breaker_failure_threshold": int(os.getenv("EDGE_LINK_BREAKER_FAILURE_THRESHOLD", "5")),
+        # Seconds an opened circuit fails fast before probing, doubled on every reopening up to the maximum
+        "edge_link_breaker_reset_timeout": float(os.getenv("EDGE_LINK_BREAKER_RESET_TIMEOUT", "1")),
+        "edge_link_breaker_max_reset_timeout": float(os.getenv("EDGE_LINK_BREAKER_MAX_RESET_TIMEOUT", "30")),
+        # In-process retries per ctx.run attempt, before Restate's own retries take over
+        "edge_link_max_retries": int(os.getenv("EDGE_LINK_MAX_RETRIES", "2")),
+        "edge_link_retry_base_delay": float(os.getenv("EDGE_LINK_RETRY_BASE_DELAY", "0.05")),
+        "edge_link_retry_max_delay": float(os.getenv("EDGE_LINK_RETRY_MAX_DELAY", "1")),
+        # Retries allowed per request on average, so a down edge link is not hit with a multiple of the usual load
+        "edge_link_retry_budget_ratio": float(os.getenv("EDGE_LINK_RETRY_BUDGET_RATIO", "0.2")),
     },
     service_modules=[services]
 )
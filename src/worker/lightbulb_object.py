@@ -0,0 +1,66 @@
+from restate import ObjectContext, ObjectSharedContext, VirtualObject
+from restate.exceptions import TerminalError
+
+from src.models import LightbulbResponse
+from . import lightbulb_service
+from .models import LightbulbDataInput, LightbulbDataIo, LightbulbIdInput, ToggleLightbulbResponse
+from .utils import run_step, send_lightbulb_request
+
+# Keyed by bulb ID. The bulb's last known `{"ctx", "status"}` is kept in the "bulb" state key, so reads are served by
+# Restate without a NATS request, and exclusive handlers serialize every change to the same bulb.
+lightbulb_object = VirtualObject("Lightbulb")
+
+
+@lightbulb_object.handler()
+async def install(ctx: ObjectContext, input_: LightbulbDataInput) -> LightbulbResponse:
+    """Install the light bulb and cache its state"""
+    result = await lightbulb_service.install_lightbulb(ctx, LightbulbDataIo(id=ctx.key(), data=input_.data))
+    ctx.set("bulb", result.data)
+
+    return result
+
+
+@lightbulb_object.handler(kind="shared")
+async def get(ctx: ObjectSharedContext) -> LightbulbResponse:
+    """Get the light bulb from cached state, falling back to the edge link when it is not cached yet"""
+    bulb = await ctx.get("bulb")
+    if bulb is not None:
+        return LightbulbResponse(id=ctx.key(), data=bulb, success=True)
+
+    result = await lightbulb_service.get_lightbulb(ctx, LightbulbIdInput(id=ctx.key()))
+    # Shared handlers cannot write state; `refresh` re-reads the bulb under the exclusive lock so a change made
+    # meanwhile is not overwritten with this read
+    ctx.object_send(refresh, key=ctx.key(), arg=None)
+
+    return result
+
+
+@lightbulb_object.handler()
+async def toggle(ctx: ObjectContext) -> ToggleLightbulbResponse:
+    """Toggle the light bulb, one toggle per bulb at a time"""
+    result = await lightbulb_service.toggle_lightbulb(ctx, LightbulbIdInput(id=ctx.key()))
+    ctx.set("bulb", result.data)
+
+    return result
+
+
+@lightbulb_object.handler()
+async def uninstall(ctx: ObjectContext) -> bool:
+    """Uninstall the light bulb and drop its cached state"""
+    result = await lightbulb_service.uninstall_lightbulb(ctx, LightbulbIdInput(id=ctx.key()))
+    ctx.clear("bulb")
+
+    return result
+
+
+@lightbulb_object.handler()
+async def refresh(ctx: ObjectContext) -> None:
+    """Replace the cached state with the edge link's, e.g. after the bulb was changed outside this object"""
+    try:
+        result = await run_step(ctx, "fetching lightbulb status", lightbulb_service.wrap_async_call(send_lightbulb_request, ctx.key(), "lightbulb.get"), serde=lightbulb_service.lightbulb_response_serde, max_attempts=3)
+    except TerminalError:
+        # Not installed (anymore)
+        ctx.clear("bulb")
+        return
+
+    ctx.set("bulb", result.data)
@@ -1,14 +1,20 @@
-import asyncio
+from datetime import timedelta
 
 from restate import Service, Context
 from restate.exceptions import TerminalError
+from restate.serde import PydanticJsonSerde
 
-from .models import LightbulbIdInput, LightbulbDataIo, ToggleLightbulbResponse
-from .utils import send_lightbulb_request, get_random_delay
-from src.models import LightbulbResponse, ToggleLightbulbResponse
+from .models import LightbulbIdInput, LightbulbIdsInput, LightbulbDataIo, ToggleLightbulbResponse
+from .utils import send_lightbulb_request, send_lightbulb_batch_request, get_random_delay, instrumented_handler, run_step
+from src.models import LightbulbBatchResponse, LightbulbResponse, ToggleLightbulbResponse
 
 lightbulb_service = Service("LightbulbManagementSvc")
 
+# Edge link responses are journaled as typed models: the NATS reply is parsed once in `send_lightbulb_request` and
+# only parsed again when the journal is replayed
+lightbulb_response_serde = PydanticJsonSerde(LightbulbResponse)
+lightbulb_batch_response_serde = PydanticJsonSerde(LightbulbBatchResponse)
+
 
 def wrap_async_call(coro_fn, *args, **kwargs):
     async def wrapped():
@@ -18,57 +24,70 @@ def wrap_async_call(coro_fn, *args, **kwargs):
 
 
 @lightbulb_service.handler()
+@instrumented_handler("LightbulbManagementSvc")
 async def install_lightbulb(ctx: Context, input_: LightbulbDataIo) -> LightbulbResponse:
     """Install a new light bulb by its ID"""
 
     try:
-        result = await ctx.run("installing new lightbulb", wrap_async_call(send_lightbulb_request, input_.id, "lightbulb.install", input_.data), max_attempts=5)
+        result = await run_step(ctx, "installing new lightbulb", wrap_async_call(send_lightbulb_request, input_.id, "lightbulb.install", input_.data), serde=lightbulb_response_serde, max_attempts=5)
     except TerminalError as e:
         raise e
     
-    return LightbulbResponse.model_validate_json(result)
+    return result
 
 
 @lightbulb_service.handler()
+@instrumented_handler("LightbulbManagementSvc")
 async def get_lightbulb(ctx: Context, input_: LightbulbIdInput) -> LightbulbResponse:
     """Get a light bulb by its ID"""
 
     try:
-        result = await ctx.run("fetching lightbulb status", wrap_async_call(send_lightbulb_request, input_.id, "lightbulb.get"), max_attempts=3)
+        result = await run_step(ctx, "fetching lightbulb status", wrap_async_call(send_lightbulb_request, input_.id, "lightbulb.get"), serde=lightbulb_response_serde, max_attempts=3)
     except TerminalError as e:
         # TODO ensure returned error message is useful
         raise e
 
-    return LightbulbResponse.model_validate_json(result)
+    return result
 
 
 @lightbulb_service.handler()
+@instrumented_handler("LightbulbManagementSvc")
+async def get_lightbulbs(ctx: Context, input_: LightbulbIdsInput) -> LightbulbBatchResponse:
+    """Get many light bulbs by their IDs with a single edge link request"""
+
+    try:
+        result = await run_step(ctx, "fetching lightbulb statuses", wrap_async_call(send_lightbulb_batch_request, input_.ids), serde=lightbulb_batch_response_serde, max_attempts=3)
+    except TerminalError as e:
+        raise e
+
+    return result
+
+
+@lightbulb_service.handler()
+@instrumented_handler("LightbulbManagementSvc")
 async def toggle_lightbulb(ctx: Context, input_: LightbulbIdInput) -> ToggleLightbulbResponse:
     """Toggle a light bulb's status between ON and OFF"""
 
     try:
-        result = await ctx.run("toggling lightbulb status", wrap_async_call(send_lightbulb_request, input_.id, "lightbulb.toggle"), max_attempts=3)
+        result = await run_step(ctx, "toggling lightbulb status", wrap_async_call(send_lightbulb_request, input_.id, "lightbulb.toggle"), serde=lightbulb_response_serde, max_attempts=3)
     except TerminalError as e:
         raise e
     
-    # Simulate some delay for toggling
-    delay = await ctx.run("getting random delay", lambda: get_random_delay(), max_attempts=3)
-    await asyncio.sleep(delay)
-
-    result = LightbulbResponse.model_validate_json(result)
+    # Simulate some delay for toggling. A durable timer lets the invocation suspend and free the worker while waiting
+    delay = await run_step(ctx, "getting random delay", lambda: get_random_delay(), max_attempts=3)
+    await ctx.sleep(timedelta(seconds=delay))
 
     return ToggleLightbulbResponse(id=result.id, data=result.data, run_time=delay)
 
 
 @lightbulb_service.handler()
+@instrumented_handler("LightbulbManagementSvc")
 async def uninstall_lightbulb(ctx: Context, input_: LightbulbIdInput) -> bool:
     """Install a new light bulb by its ID"""
 
     try:
-        result = await ctx.run("uninstalling lightbulb", wrap_async_call(send_lightbulb_request, input_.id, "lightbulb.uninstall"), max_attempts=5)
+        result = await run_step(ctx, "uninstalling lightbulb", wrap_async_call(send_lightbulb_request, input_.id, "lightbulb.uninstall"), serde=lightbulb_response_serde, max_attempts=5)
     except TerminalError as e:
         raise e
-    
-    result = LightbulbResponse.model_validate_json(result)
 
     return result.success
@@ -1,32 +1,51 @@
 from restate import Workflow, WorkflowContext
 from restate.exceptions import TerminalError
 
-from . import lightbulb_service
-from .models import LightbulbDataIo, LightbulbIdInput
+from . import lightbulb_object, lightbulb_service
+from .models import InstallationInput, LightbulbDataIo, LightbulbIdInput
 
 
 installation_workflow = Workflow("InstallationWorkflow")
 
 
+def step_caller(ctx: WorkflowContext, mode: str):
+    """Returns a function calling a LightbulbManagementSvc handler as a service call or inline.
+
+    Inline steps run the handler in the workflow's own context, so its `ctx.run` and `ctx.sleep` entries are journaled
+    by the workflow with the same retries and failures but without a separate invocation per step.
+    """
+    async def call(handler, arg):
+        if mode == "inline":
+            return await handler(ctx, arg)
+        return await ctx.service_call(handler, arg=arg)
+
+    return call
+
+
 @installation_workflow.main()
-async def run(ctx: WorkflowContext, req: LightbulbDataIo):
+async def run(ctx: WorkflowContext, req: InstallationInput):
+    step = step_caller(ctx, req.mode)
+
     # Install bulb
-    await ctx.service_call(lightbulb_service.install_lightbulb, arg=req)
+    await step(lightbulb_service.install_lightbulb, LightbulbDataIo(id=req.id, data=req.data))
     ctx.set("installation_status", "installed")
 
     # Get bulb status
-    status_result = await ctx.service_call(lightbulb_service.get_lightbulb, arg=LightbulbIdInput(id=req.id))
+    status_result = await step(lightbulb_service.get_lightbulb, LightbulbIdInput(id=req.id))
     ctx.set("installation_status", "status_fetched")
 
     # Toggle bulb
-    toggle_result = await ctx.service_call(lightbulb_service.toggle_lightbulb, arg=LightbulbIdInput(id=req.id))
+    toggle_result = await step(lightbulb_service.toggle_lightbulb, LightbulbIdInput(id=req.id))
     ctx.set("installation_status", "toggled")
 
     # Ensure the toggle operation changed the status
     if status_result.data["status"] == toggle_result.data["status"]:
-        await ctx.service_call(lightbulb_service.uninstall_lightbulb, arg=LightbulbIdInput(id=req.id))
+        await step(lightbulb_service.uninstall_lightbulb, LightbulbIdInput(id=req.id))
+        ctx.object_send(lightbulb_object.refresh, key=req.id, arg=None)
         raise TerminalError("Toggle operation did not change the lightbulb status as expected. Try installing.")
     
     # Toggle back to original state
-    await ctx.service_call(lightbulb_service.toggle_lightbulb, arg=LightbulbIdInput(id=req.id))
+    await step(lightbulb_service.toggle_lightbulb, LightbulbIdInput(id=req.id))
+    # The steps bypass the bulb's `Lightbulb` object, so have it re-read any state it cached meanwhile
+    ctx.object_send(lightbulb_object.refresh, key=req.id, arg=None)
     ctx.set("installation_status", "completed")
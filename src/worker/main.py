@@ -2,7 +2,11 @@ import logging
 
 import restate
 
+from src import metrics
+
+from .bulk_installation_workflow import bulk_installation_workflow
 from .di import container
+from .lightbulb_object import lightbulb_object
 from .lightbulb_service import lightbulb_service
 from .lightbulb_workflow import installation_workflow
 
@@ -12,7 +16,7 @@ logger = logging.getLogger(__name__)
 
 def create_app():
     logger.info("Creating Restate app w/ lifespan")
-    _restate_app = restate.app([installation_workflow, lightbulb_service])
+    _restate_app = restate.app([installation_workflow, bulk_installation_workflow, lightbulb_service, lightbulb_object])
 
     async def _app(scope, receive, send):
         if scope['type'] == 'lifespan':
@@ -26,6 +30,9 @@ def create_app():
                     await container.aclose()
                     await send({'type': 'lifespan.shutdown.complete'})
                     return
+        elif scope['type'] == 'http' and scope['path'] == '/metrics':
+            # Prometheus scrapes the worker on the port Restate invokes it on
+            return await metrics.asgi_app(scope, receive, send)
         else:
             logger.info("Handling non-lifespan request")
             return await _restate_app(scope, receive, send)
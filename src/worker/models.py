@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 
@@ -5,9 +7,50 @@ class LightbulbIdInput(BaseModel):
     id: str
 
 
+class LightbulbIdsInput(BaseModel):
+    ids: list[str]
+
+
 class LightbulbDataIo(LightbulbIdInput):
     data: dict | None = None
 
 
 class ToggleLightbulbResponse(LightbulbDataIo):
     run_time: int
+
+
+class InstallationInput(LightbulbDataIo):
+    # "services" runs every step as its own LightbulbManagementSvc invocation, "inline" runs the steps' journaled
+    # edge link requests directly in the workflow invocation
+    mode: Literal["services", "inline"] = "services"
+
+
+class BulkInstallationInput(BaseModel):
+    installs: list[InstallationInput]
+    # Maximum number of child installation workflows running at once
+    concurrency: int = 50
+
+
+class InstallationFailure(BaseModel):
+    id: str
+    error: str
+
+
+class InstallationProgress(BaseModel):
+    status: Literal["running", "completed"] = "running"
+    total: int = 0
+    completed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+
+
+class FailurePageInput(BaseModel):
+    page: int = 0
+
+
+class InstallationFailurePage(FailurePageInput):
+    failures: list[InstallationFailure] = []
+
+
+class LightbulbDataInput(BaseModel):
+    data: dict | None = None
@@ -1,40 +1,378 @@
+import asyncio
+import copy
 import logging
-from typing import Annotated, AsyncGenerator
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Annotated, AsyncGenerator, Awaitable, Callable, Protocol, TypeVar
 
 from nats.aio.client import Client as NATS
-from nats.errors import NoRespondersError
+from nats.errors import ConnectionClosedError, NoRespondersError, NoServersError, StaleConnectionError, TimeoutError as NATSTimeoutError
+from pydantic import BaseModel
 from wireup import Inject, service
 
+from src import metrics, tracing
+from src.codec import WireFormat, decode
+from src.edge_link import main as edge_link
+from src.models import LightbulbBatchResponse, LightbulbResponse
+from src.sharding import base_subject, route_subject
+from .circuit_breaker import STATE_VALUES, CircuitBreaker, RetryBudget, call_with_retries
+
 logger = logging.getLogger(__name__)
+T = TypeVar("T")
+M = TypeVar("M", bound=BaseModel)
+
+NATS_REQUEST_DURATION = metrics.histogram("nats_request_duration_seconds", "Duration of edge link requests, including failed ones", ("subject",))
+NATS_REQUEST_ERRORS = metrics.counter("nats_request_errors_total", "Edge link requests that timed out or found no responders", ("subject", "error"))
+NATS_REQUESTS_REJECTED = metrics.counter("nats_requests_rejected_total", "Edge link requests shed because the queue was full", ("subject",))
+
+
+class NATSClientOverloadedError(Exception):
+    """Raised without sending when the client already has `max_queue` requests waiting for an in-flight slot"""
+
+
+@dataclass
+class NATSClientStats:
+    requests: int = 0
+    timeouts: int = 0
+    no_responders: int = 0
+    rejected: int = 0
+    in_flight: int = 0
+    queued: int = 0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=1024))
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def _percentile(pct: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(pct / 100 * len(latencies)))] * 1000, 3)
+
+        return {
+            "requests": self.requests,
+            "timeouts": self.timeouts,
+            "no_responders": self.no_responders,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "latency_p50_ms": _percentile(50),
+            "latency_p99_ms": _percentile(99),
+        }
+
+
+class NATSTransport(Protocol):
+    """How `NATSClient` delivers requests to the edge link"""
+
+    async def connect(self): ...
+
+    async def close(self): ...
+
+    async def request(self, subject: str, payload: bytes, timeout: float, headers: dict[str, str] | None = None) -> tuple[bytes, dict[str, str] | None]:
+        """Send a request and return the reply's payload and headers"""
+        ...
+
+
+class NATSConnectionPool:
+    """Sends requests over NATS, spread round-robin over `pool_size` connections"""
+
+    def __init__(self, nats_url: str, pool_size: int = 1):
+        self.nats_url = nats_url
+        self.connections = [NATS() for _ in range(max(1, pool_size))]
+        self._next_connection = 0
+
+    async def connect(self):
+        for nc in self.connections:
+            await nc.connect(self.nats_url)
+        logger.info(f"Connected to NATS at {self.nats_url} with {len(self.connections)} connection(s)")
+
+    async def close(self):
+        for nc in self.connections:
+            await nc.drain()
+
+    def _connection(self) -> NATS:
+        nc = self.connections[self._next_connection]
+        self._next_connection = (self._next_connection + 1) % len(self.connections)
+        return nc
+
+    async def request(self, subject: str, payload: bytes, timeout: float, headers: dict[str, str] | None = None) -> tuple[bytes, dict[str, str] | None]:
+        response = await self._connection().request(subject, payload, timeout=timeout, headers=headers)
+        return response.data, response.headers
+
+
+class InMemoryTransport:
+    """Serves requests with the edge link's request handling in this process, for single-process deployments.
+
+    With `typed`, `request_model` hands request and response models over directly instead of serializing them.
+    Payload dicts are copied on the way in and out so neither side can change the other's state through a shared
+    dict. Replies are only returned once the change is durable when edge link persistence is configured. State change
+    events are not published, since there is no NATS connection to publish them on.
+    """
+
+    def __init__(self, typed: bool = True):
+        self.typed = typed
+
+    async def connect(self):
+        await edge_link.open_persistence()
+        logger.info("Serving edge link requests in-process")
+
+    async def close(self):
+        await edge_link.close_persistence()
+
+    async def request(self, subject: str, payload: bytes, timeout: float, headers: dict[str, str] | None = None) -> tuple[bytes, dict[str, str] | None]:
+        sub = base_subject(subject)
+        with tracing.span(f"edge_link {sub}", "edge_link"):
+            reply = edge_link.get_reply(sub, payload, headers)
+            await self._settle()
+        return reply
+
+    async def request_model(self, subject: str, request: BaseModel) -> LightbulbResponse | LightbulbBatchResponse:
+        sub = base_subject(subject)
+        if type(request) is not edge_link.REQUEST_MODELS.get(sub):
+            return edge_link.get_response(sub, request.model_dump_json())
+
+        if getattr(request, "data", None):
+            request = request.model_copy(update={"data": copy.deepcopy(request.data)})
+        with tracing.span(f"edge_link {sub}", "edge_link"):
+            try:
+                response = edge_link.handle_request(sub, request)
+            except Exception as e:
+                logger.error(f"Unhandled processing error: {e}")
+                response = LightbulbResponse(success=False, error_message="We encountered an unexpected error")
+            await self._settle()
+
+        return _detach(response)
+
+    async def _settle(self):
+        edge_link.take_events()
+        if edge_link.persistence:
+            await edge_link.persistence.sync()
+
+
+def _detach(response: LightbulbResponse | LightbulbBatchResponse) -> LightbulbResponse | LightbulbBatchResponse:
+    """Copy the `ctx` dicts a response shares with the edge link's registry"""
+    if isinstance(response, LightbulbBatchResponse):
+        response.results = [_detach(result) for result in response.results]
+    elif response.data and response.data.get("ctx"):
+        response.data = {**response.data, "ctx": copy.deepcopy(response.data["ctx"])}
+
+    return response
 
 
 class NATSClient:
-    def __init__(self, nats_url: str):
-        self.nc = NATS()
+    """Request client for the edge link.
+
+    At most `max_in_flight` requests are outstanding at once; further requests wait for a slot, and once `max_queue`
+    requests are already waiting new ones are rejected with `NATSClientOverloadedError` so load is shed instead of
+    piling up until everything times out. Requests go through `transport`, by default a pool of `pool_size` NATS
+    connections. Models are sent in `wire_format`, which is also the format replies are asked for in.
+    """
+
+    transport: NATSTransport | None = None
+    wire_format = WireFormat()
+
+    def __init__(
+        self,
+        nats_url: str,
+        pool_size: int = 1,
+        max_in_flight: int = 256,
+        max_queue: int = 1024,
+        default_timeout: float = 1.0,
+        subject_timeouts: dict[str, float] | None = None,
+        transport: NATSTransport | None = None,
+        wire_format: WireFormat | None = None,
+    ):
         self.nats_url = nats_url
+        self.wire_format = wire_format or WireFormat()
+        self.transport = transport or NATSConnectionPool(nats_url, pool_size)
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.subject_timeouts = subject_timeouts or {}
+        self.stats = NATSClientStats()
+
+        self._slots = asyncio.Semaphore(max_in_flight)
 
     async def connect(self):
-        await self.nc.connect(self.nats_url)
-        logger.info(f"Connected to NATS at {self.nats_url}")
+        await self.transport.connect()
 
-    async def request(self, subject: str, data: str) -> str:
-        logger.info("Sending request to subject: %s with data: %s", subject, data)
+    async def close(self):
+        await self.transport.close()
 
+    def timeout_for(self, subject: str) -> float:
+        return self.subject_timeouts.get(base_subject(subject), self.default_timeout)
+
+    async def _send(self, subject: str, send: Callable[[float], Awaitable[T]]) -> T:
+        sub = base_subject(subject)
+        if self._slots.locked() and self.stats.queued >= self.max_queue:
+            self.stats.rejected += 1
+            NATS_REQUESTS_REJECTED.inc(sub)
+            raise NATSClientOverloadedError(f"Too many queued requests ({self.stats.queued}) for subject: {subject}")
+
+        self.stats.queued += 1
         try:
-            response = await self.nc.request(subject, data.encode(), timeout=1)
+            await self._slots.acquire()
+        finally:
+            self.stats.queued -= 1
+
+        self.stats.in_flight += 1
+        self.stats.requests += 1
+        started = time.perf_counter()
+        try:
+            # Senders add the span's context to the request headers, the edge link continues the trace from them
+            with tracing.span(f"nats {sub}", "worker"):
+                return await send(self.timeout_for(subject))
         except NoRespondersError as e:
+            self.stats.no_responders += 1
+            NATS_REQUEST_ERRORS.inc(sub, "no_responders")
             logger.error(f"No responders for subject: {subject}")
             raise e from None
+        except NATSTimeoutError:
+            self.stats.timeouts += 1
+            NATS_REQUEST_ERRORS.inc(sub, "timeout")
+            logger.error(f"Timed out waiting for a response on subject: {subject}")
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats.in_flight -= 1
+            self.stats.latencies.append(elapsed)
+            NATS_REQUEST_DURATION.observe(elapsed, sub)
+            self._slots.release()
+
+    async def request(self, subject: str, data: str) -> str:
+        logger.info("Sending request to subject: %s with data: %s", subject, data)
+
+        response, _ = await self._send(subject, lambda timeout: self.transport.request(subject, data.encode(), timeout, tracing.inject()))
+        return response.decode()
+
+    async def request_model(self, subject: str, request: BaseModel, response_model: type[M]) -> M:
+        """Send a request model and parse the reply into `response_model`.
+
+        Transports in the same process exchange the models directly, skipping serialization altogether.
+        """
+        if getattr(self.transport, "typed", False):
+            logger.debug("Sending request to subject: %s with data: %s", subject, request)
+            return await self._send(subject, lambda timeout: self.transport.request_model(subject, request))
 
-        return response.data.decode()
+        accept = self.wire_format.accept_headers()
+        if accept is None:
+            # Plain JSON in both directions, as spoken by edge links that predate format negotiation
+            return response_model.model_validate_json(await self.request(subject, request.model_dump_json()))
+
+        logger.info("Sending request to subject: %s with data: %s", subject, request)
+        payload, headers = self.wire_format.encode(request)
+        headers = {**(headers or {}), **accept}
+
+        response, response_headers = await self._send(subject, lambda timeout: self.transport.request(subject, payload, timeout, tracing.inject(headers)))
+        return decode(response, response_headers, response_model)
 
 
 @service
-async def nats_client_factory(nats_url: Annotated[str, Inject(param="nats_url")]) -> AsyncGenerator[NATSClient]:
-    client = NATSClient(nats_url)
+class ShardRouter:
+    """Routes edge link requests to the shard owning a bulb ID"""
+
+    def __init__(self, shard_count: Annotated[int, Inject(param="edge_link_shards")]):
+        self.shard_count = shard_count
+
+    def subject_for(self, subject: str, bulb_id: str) -> str:
+        return route_subject(subject, bulb_id, self.shard_count)
+
+    def partition(self, subject: str, bulb_ids: list[str]) -> dict[str, list[str]]:
+        """Group bulb IDs by the shard-aware subject that serves them"""
+        if self.shard_count <= 1:
+            return {subject: bulb_ids}
+
+        partitions: dict[str, list[str]] = {}
+        for bulb_id in bulb_ids:
+            partitions.setdefault(self.subject_for(subject, bulb_id), []).append(bulb_id)
+
+        return partitions
+
+
+# Failures that say the edge link is unreachable or unresponsive, as opposed to the request being bad
+EDGE_LINK_FAILURES = (NATSTimeoutError, NoRespondersError, ConnectionClosedError, NoServersError, StaleConnectionError)
+# Failures where the request never reached an edge link, so sending it again cannot apply a change twice
+UNDELIVERED_FAILURES = (NoRespondersError, NoServersError)
+# Requests that change nothing, which are also retried after timeouts
+READ_ONLY_SUBJECTS = {"lightbulb.get", "lightbulb.get_batch"}
+
+
+@service
+class EdgeLinkCircuitBreaker:
+    """Circuit breakers and in-process retries for edge link requests, shared by every invocation in the worker.
+
+    There is one circuit per subject prefix, i.e. per edge link shard, so an unreachable shard does not fail requests
+    for bulbs on the others. Retries draw from one budget for the whole process.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: Annotated[int, Inject(param="edge_link_breaker_failure_threshold")],
+        reset_timeout: Annotated[float, Inject(param="edge_link_breaker_reset_timeout")],
+        max_reset_timeout: Annotated[float, Inject(param="edge_link_breaker_max_reset_timeout")],
+        max_retries: Annotated[int, Inject(param="edge_link_max_retries")],
+        retry_base_delay: Annotated[float, Inject(param="edge_link_retry_base_delay")],
+        retry_max_delay: Annotated[float, Inject(param="edge_link_retry_max_delay")],
+        retry_budget_ratio: Annotated[float, Inject(param="edge_link_retry_budget_ratio")],
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.budget = RetryBudget(retry_budget_ratio)
+        self.circuits: dict[str, CircuitBreaker] = {}
+
+        metrics.gauge("circuit_breaker_state", "Circuit state: 0 closed, 1 half-open, 2 open", self.states, ("circuit",))
+        metrics.gauge("circuit_breaker_retry_budget_tokens", "Retries the budget currently allows", lambda: self.budget.tokens)
+
+    def circuit_for(self, subject: str) -> CircuitBreaker:
+        name = subject.rpartition(".")[0]
+        circuit = self.circuits.get(name)
+        if circuit is None:
+            circuit = self.circuits[name] = CircuitBreaker(
+                name, EDGE_LINK_FAILURES, self.failure_threshold, self.reset_timeout, self.max_reset_timeout,
+            )
+
+        return circuit
+
+    async def call(self, subject: str, fn: Callable[[], Awaitable[T]]) -> T:
+        retry_on = EDGE_LINK_FAILURES if base_subject(subject) in READ_ONLY_SUBJECTS else UNDELIVERED_FAILURES
+        return await call_with_retries(
+            self.circuit_for(subject), self.budget, fn, retry_on, self.max_retries, self.retry_base_delay, self.retry_max_delay,
+        )
+
+    def states(self) -> dict[tuple[str], int]:
+        return {(name,): STATE_VALUES[circuit.state] for name, circuit in list(self.circuits.items())}
+
+    def snapshot(self) -> dict:
+        return {
+            "circuits": {name: circuit.snapshot() for name, circuit in self.circuits.items()},
+            "retry_budget_tokens": round(self.budget.tokens, 3),
+        }
+
+
+@service
+async def nats_client_factory(
+    nats_url: Annotated[str, Inject(param="nats_url")],
+    pool_size: Annotated[int, Inject(param="nats_pool_size")],
+    max_in_flight: Annotated[int, Inject(param="nats_max_in_flight")],
+    max_queue: Annotated[int, Inject(param="nats_max_queue")],
+    default_timeout: Annotated[float, Inject(param="nats_timeout")],
+    subject_timeouts: Annotated[dict, Inject(param="nats_subject_timeouts")],
+    transport: Annotated[str, Inject(param="nats_transport")],
+    codec: Annotated[str, Inject(param="nats_codec")],
+    compression_threshold: Annotated[int, Inject(param="nats_compression_threshold")],
+) -> AsyncGenerator[NATSClient]:
+    # "memory" runs the edge link in this process instead of reaching it over NATS
+    edge_link_transport = InMemoryTransport() if transport == "memory" else NATSConnectionPool(nats_url, pool_size)
+    wire_format = WireFormat.named(codec, compression_threshold or None)
+    client = NATSClient(nats_url, pool_size, max_in_flight, max_queue, default_timeout, subject_timeouts, edge_link_transport, wire_format)
     await client.connect()
-    
+    metrics.gauge("nats_requests_in_flight", "Edge link requests awaiting a reply", lambda: client.stats.in_flight)
+    metrics.gauge("nats_requests_queued", "Edge link requests waiting for an in-flight slot", lambda: client.stats.queued)
+
     logger.info("Yielding NATSClient")
     yield client
 
-    await client.nc.drain()
+    await client.close()
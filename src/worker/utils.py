@@ -1,28 +1,123 @@
+import asyncio
+import functools
+import inspect
 import logging
 import random
+import time
 
 from restate.exceptions import TerminalError
 
-from src.models import LightbulbRequest, LightbulbResponse
+from src import metrics, tracing
+from src.models import LightbulbBatchRequest, LightbulbBatchResponse, LightbulbRequest, LightbulbResponse
 from . import services
 from .di import container
 
 logger = logging.getLogger(__name__)
 
+HANDLER_DURATION = metrics.histogram("restate_handler_duration_seconds", "Duration of handler attempts", ("service", "handler"))
+HANDLER_ERRORS = metrics.counter("restate_handler_errors_total", "Handler attempts that raised, by exception type", ("service", "handler", "error"))
+STEP_DURATION = metrics.histogram("restate_step_duration_seconds", "Duration of executed ctx.run steps", ("step",))
+STEP_ERRORS = metrics.counter("restate_step_errors_total", "Executed ctx.run steps that raised, by exception type", ("step", "error"))
 
-async def send_lightbulb_request(id: str, subject: str, data: dict | None = None) -> str:
+
+async def send_lightbulb_request(id: str, subject: str, data: dict | None = None) -> LightbulbResponse:
     nats_client = await container.aget(services.NATSClient)
+    router = await container.aget(services.ShardRouter)
+    breaker = await container.aget(services.EdgeLinkCircuitBreaker)
+    subject = router.subject_for(subject, id)
     request = LightbulbRequest(id=id, data=data)
     logger.info(f"Sending request for lightbulb {id} to subject {subject}: {request}")
     
-    response = await nats_client.request(subject, request.model_dump_json())
-    logger.info(f"Received response for lightbulb {id}: {response}")
-    result = LightbulbResponse.model_validate_json(response)
+    result = await breaker.call(subject, lambda: nats_client.request_model(subject, request, LightbulbResponse))
+    logger.info(f"Received response for lightbulb {id}: {result}")
 
     if not result.success:
         raise TerminalError(result.error_message)
     else:
-        return response
+        return result
+
+
+async def send_lightbulb_batch_request(ids: list[str], subject: str = "lightbulb.get_batch") -> LightbulbBatchResponse:
+    nats_client = await container.aget(services.NATSClient)
+    router = await container.aget(services.ShardRouter)
+    breaker = await container.aget(services.EdgeLinkCircuitBreaker)
+
+    async def _request_partition(shard_subject: str, shard_ids: list[str]) -> LightbulbBatchResponse:
+        logger.info(f"Sending batch request for {len(shard_ids)} lightbulbs to subject {shard_subject}")
+        request = LightbulbBatchRequest(ids=shard_ids)
+        return await breaker.call(shard_subject, lambda: nats_client.request_model(shard_subject, request, LightbulbBatchResponse))
+
+    # One request per shard, issued concurrently; results are returned in the order of `ids`
+    partitions = router.partition(subject, ids)
+    results = await asyncio.gather(*(_request_partition(s, shard_ids) for s, shard_ids in partitions.items()))
+
+    by_id = {}
+    for result in results:
+        if not result.success:
+            raise TerminalError(result.error_message)
+        by_id.update((bulb.id, bulb) for bulb in result.results)
+
+    return LightbulbBatchResponse(success=True, results=[by_id[id] for id in ids])
+
+
+def instrumented_handler(service_name: str):
+    """Time a handler and run it in a span continuing the trace of the ingress request that invoked it.
+
+    Handlers called inline by another handler continue the caller's span instead. Every attempt of an invocation,
+    including replays after it suspended, gets its own span and observation; a suspension is counted as a
+    `SuspendedException` error.
+    """
+    def decorator(fn):
+        handler_name = fn.__name__
+
+        @functools.wraps(fn)
+        async def instrumented(ctx, *args):
+            parent = None if tracing.current_span.get() else tracing.extract(ctx.request().headers)
+            started = time.perf_counter()
+            try:
+                with tracing.span(f"worker {service_name}/{handler_name}", "worker", parent):
+                    return await fn(ctx, *args)
+            except BaseException as e:
+                HANDLER_ERRORS.inc(service_name, handler_name, type(e).__name__)
+                raise
+            finally:
+                HANDLER_DURATION.observe(time.perf_counter() - started, service_name, handler_name)
+
+        return instrumented
+
+    return decorator
+
+
+def timed_step(name: str, action):
+    """Wrap a `ctx.run` action to record its duration. Journaled results are replayed without calling the action, so
+    only executions are observed."""
+    if inspect.iscoroutinefunction(action):
+        async def timed():
+            started = time.perf_counter()
+            try:
+                return await action()
+            except Exception as e:
+                STEP_ERRORS.inc(name, type(e).__name__)
+                raise
+            finally:
+                STEP_DURATION.observe(time.perf_counter() - started, name)
+    else:
+        def timed():
+            started = time.perf_counter()
+            try:
+                return action()
+            except Exception as e:
+                STEP_ERRORS.inc(name, type(e).__name__)
+                raise
+            finally:
+                STEP_DURATION.observe(time.perf_counter() - started, name)
+
+    return timed
+
+
+def run_step(ctx, name: str, action, **options):
+    """`ctx.run` with the step's execution time recorded"""
+    return ctx.run(name, timed_step(name, action), **options)
 
 
 def get_random_delay() -> int:
@@ -1,9 +1,11 @@
+import pytest
 import pytest_asyncio
 import json
 from typing import Dict, Any
 from unittest.mock import AsyncMock
 
 # Import after adjusting path
+from src.api import graphql
 from src.worker.services import NATSClient
 
 class MockNATSClient(NATSClient):
@@ -43,3 +45,12 @@ def mock_nats_client():
     def _create_mock_client(responses=None):
         return MockNATSClient(responses)
     return _create_mock_client
+
+
+@pytest.fixture(autouse=True)
+def reset_admission():
+    """Start every test with full rate limit buckets, since the API's admission state is module-level"""
+    yield
+    graphql.admission.bulb_limiter.buckets.clear()
+    graphql.admission.client_limiter.buckets.clear()
+    graphql.admission.bulk_limiter.buckets.clear()
@@ -0,0 +1,153 @@
+import httpx
+import pytest
+from starlette.requests import HTTPConnection
+from src.api import graphql
+from src.api.admission import LoadShedder, RateLimiter
+from src.api.graphql import schema
+from src.api.restate_client import create_restate_client
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_rate_limiter_refills_and_evicts_least_recently_used():
+    clock = FakeClock()
+    limiter = RateLimiter(rate=2, burst=3, max_keys=2, clock=clock)
+
+    assert [limiter.acquire("bulb_1") for _ in range(4)] == [0, 0, 0, 0.5]
+    clock.now = 0.5
+    assert limiter.acquire("bulb_1") == 0
+    assert limiter.acquire("bulb_1") == 0.5
+
+    limiter.acquire("bulb_2")
+    limiter.acquire("bulb_1")
+    limiter.acquire("bulb_3")
+    assert len(limiter) == 2
+    assert list(limiter.buckets) == ["bulb_1", "bulb_3"]
+
+
+def test_load_shedder_checks_in_flight_and_recent_read_latency():
+    clock = FakeClock()
+    shedder = LoadShedder(max_in_flight=2, max_latency=1.0, window=10, alpha=0.5, clock=clock)
+
+    shedder.started()
+    shedder.started()
+    assert shedder.overloaded() == "in_flight"
+    shedder.finished(3.0)
+    shedder.finished()
+    assert shedder.overloaded() == "latency"
+
+    shedder.started()
+    shedder.finished(0.2)
+    assert shedder.latency == pytest.approx(1.6)
+    # A stale average is not held against new work
+    clock.now = 11
+    assert shedder.overloaded() is None
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_mutations_fail_fast_with_a_structured_error(monkeypatch):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"success": True})
+
+    monkeypatch.setattr(graphql.admission.bulb_limiter, "burst", 2)
+    async with create_restate_client(base_url="http://restate:8080", transport=httpx.MockTransport(handler)) as client:
+        results = [
+            await schema.execute('mutation { toggleLightbulb(id: "hot_bulb") { key } }', context_value={"restate_client": client, "client_id": "client_1"})
+            for _ in range(3)
+        ]
+        other = await schema.execute('mutation { toggleLightbulb(id: "other_bulb") { key } }', context_value={"restate_client": client, "client_id": "client_1"})
+
+    assert [result.errors is None for result in results] == [True, True, False]
+    assert results[2].data == {"toggleLightbulb": None}
+    assert results[2].errors[0].extensions["code"] == "RATE_LIMITED"
+    assert results[2].errors[0].extensions["scope"] == "bulb"
+    assert results[2].errors[0].extensions["retryAfterMs"] > 0
+    assert other.errors is None
+    assert len(requests) == 3
+
+
+@pytest.mark.asyncio
+async def test_bulk_installs_are_charged_per_bulb(monkeypatch):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"invocationId": "inv_1", "status": "Accepted"})
+
+    # Frozen, so no tokens come back between requests
+    clock = FakeClock()
+    monkeypatch.setattr(graphql.admission.bulb_limiter, "clock", clock)
+    monkeypatch.setattr(graphql.admission.bulk_limiter, "clock", clock)
+    monkeypatch.setattr(graphql.admission.bulk_limiter, "burst", 4)
+    install = 'mutation ($inputs: [LightBulbInstallationInput!]!) { installLightbulbs(inputs: $inputs) { key } }'
+    async with create_restate_client(base_url="http://restate:8080", transport=httpx.MockTransport(handler)) as client:
+        context = {"restate_client": client, "client_id": "client_1"}
+        too_large = await schema.execute(install, variable_values={"inputs": [{"id": f"bulb_{i}"} for i in range(5)]}, context_value=context)
+        for i in range(5):
+            await schema.execute('mutation { toggleLightbulb(id: "hot_bulb") { key } }', context_value={"restate_client": client, "client_id": f"other_{i}"})
+        hot = await schema.execute(install, variable_values={"inputs": [{"id": "bulb_1"}, {"id": "hot_bulb"}]}, context_value=context)
+        admitted = await schema.execute(install, variable_values={"inputs": [{"id": "bulb_1"}, {"id": "bulb_2"}, {"id": "bulb_3"}]}, context_value=context)
+        over_client = await schema.execute(install, variable_values={"inputs": [{"id": "bulb_4"}, {"id": "bulb_5"}]}, context_value=context)
+        # Bulk installs leave the client's bucket for single bulb mutations alone
+        toggle = await schema.execute('mutation { toggleLightbulb(id: "bulb_6") { key } }', context_value=context)
+
+    assert too_large.errors[0].extensions == {"code": "BATCH_TOO_LARGE", "maxBatchSize": 4}
+    assert hot.errors[0].extensions["scope"] == "bulb"
+    assert hot.errors[0].extensions["id"] == "hot_bulb"
+    # The rejected batches charged nothing, so three of the client's four tokens were still there
+    assert admitted.errors is None
+    assert over_client.errors[0].extensions["scope"] == "bulk"
+    assert toggle.errors is None
+    assert len([request for request in requests if "BulkInstallationWorkflow" in request.url.path]) == 1
+
+
+@pytest.mark.asyncio
+async def test_large_bulk_installs_are_admitted_by_default():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"invocationId": "inv_1", "status": "Accepted"})
+
+    inputs = [{"id": f"bulb_{i}"} for i in range(5000)]
+    async with create_restate_client(base_url="http://restate:8080", transport=httpx.MockTransport(handler)) as client:
+        result = await schema.execute(
+            'mutation ($inputs: [LightBulbInstallationInput!]!) { installLightbulbs(inputs: $inputs) { key } }',
+            variable_values={"inputs": inputs},
+            context_value={"restate_client": client, "client_id": "client_1"},
+        )
+
+    assert result.errors is None
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_mutations_are_shed_while_restate_is_overloaded(monkeypatch):
+    monkeypatch.setattr(graphql.load_shedder, "in_flight", graphql.load_shedder.max_in_flight)
+
+    result = await schema.execute('mutation { uninstallLightbulb(id: "bulb_1") { key } }', context_value={"restate_client": None})
+
+    assert result.errors[0].message == "Service is overloaded, retry later"
+    assert result.errors[0].extensions == {"code": "OVERLOADED", "retryAfterMs": 1000, "reason": "in_flight"}
+
+
+def test_client_id_is_only_taken_from_trusted_proxies(monkeypatch):
+    from src.api import main
+
+    monkeypatch.setattr(main, "LIGHTBULB_TRUSTED_PROXIES", frozenset({"10.0.0.1"}))
+
+    def connection(host: str, headers: list[tuple[bytes, bytes]]) -> HTTPConnection:
+        return HTTPConnection({"type": "http", "client": (host, 1234), "headers": headers})
+
+    assert main.get_client_id(connection("10.0.0.1", [(b"x-client-id", b"client_1")])) == "client_1"
+    assert main.get_client_id(connection("10.0.0.1", [])) == "10.0.0.1"
+    assert main.get_client_id(connection("203.0.113.7", [(b"x-client-id", b"client_1")])) == "203.0.113.7"
@@ -0,0 +1,89 @@
+import asyncio
+import httpx
+import pytest
+from src.api.broadcaster import LightbulbBroadcaster, SlowConsumerError
+from src.api.graphql import schema
+from src.models import LightbulbEvent
+from .test_graphql import make_restate_client
+
+
+def event(id: str, status: str | None) -> LightbulbEvent:
+    return LightbulbEvent(id=id, data={"ctx": {}, "status": status} if status else None)
+
+
+async def take(subscription, count: int) -> list[LightbulbEvent]:
+    events = []
+    async for received in subscription:
+        events.append(received)
+        if len(events) == count:
+            break
+    return events
+
+
+@pytest.mark.asyncio
+async def test_publish_only_reaches_subscribers_of_the_bulb():
+    broadcaster = LightbulbBroadcaster()
+    watch_a = broadcaster.subscribe(["a"])
+    watch_ab = broadcaster.subscribe(["a", "b"])
+
+    broadcaster.publish(event("a", "ON"))
+    broadcaster.publish(event("b", "ON"))
+    broadcaster.publish(event("c", "ON"))
+
+    assert [e.id for e in await take(watch_a, 1)] == ["a"]
+    assert [e.id for e in await take(watch_ab, 2)] == ["a", "b"]
+    assert watch_a.queue.empty() and watch_ab.queue.empty()
+
+    broadcaster.unsubscribe(watch_a)
+    broadcaster.unsubscribe(watch_ab)
+    assert broadcaster.subscriber_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_is_dropped_without_affecting_others():
+    broadcaster = LightbulbBroadcaster(queue_size=2)
+    slow = broadcaster.subscribe(["a"])
+    fast = broadcaster.subscribe(["a"])
+
+    for status in ("ON", "OFF", "ON"):
+        broadcaster.publish(event("a", status))
+        await take(fast, 1)
+
+    assert slow.dropped and not fast.dropped
+    assert broadcaster.dropped == 1
+    assert broadcaster.subscriber_count() == 1
+    with pytest.raises(SlowConsumerError):
+        await take(slow, 1)
+
+
+@pytest.mark.asyncio
+async def test_lightbulb_status_subscription():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"success": True, "results": [
+            {"success": True, "id": "a", "data": {"ctx": {}, "status": "OFF"}},
+        ]})
+
+    broadcaster = LightbulbBroadcaster()
+
+    async with make_restate_client(handler) as client:
+        stream = await schema.subscribe(
+            'subscription { lightbulbStatus(ids: ["a", "b"]) { id status } }',
+            context_value={"restate_client": client, "broadcaster": broadcaster},
+        )
+        initial = [(await anext(stream)).data for _ in range(2)]
+        broadcaster.publish(event("a", "ON"))
+        broadcaster.publish(event("a", None))
+        updates = [(await anext(stream)).data for _ in range(2)]
+        await stream.aclose()
+
+    assert initial == [
+        {"lightbulbStatus": {"id": "a", "status": "OFF"}},
+        {"lightbulbStatus": {"id": "b", "status": None}},
+    ]
+    assert updates == [
+        {"lightbulbStatus": {"id": "a", "status": "ON"}},
+        {"lightbulbStatus": {"id": "a", "status": None}},
+    ]
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert broadcaster.subscriber_count() == 0
@@ -0,0 +1,97 @@
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
+from restate.exceptions import TerminalError
+from src.worker import bulk_installation_workflow
+from src.worker.bulk_installation_workflow import get_failures, get_progress, run
+from src.worker.models import BulkInstallationInput, FailurePageInput, InstallationInput
+
+
+@pytest_asyncio.fixture
+def mock_context():
+    context = AsyncMock()
+    state = {}
+    context.set = MagicMock(side_effect=state.__setitem__)
+    context.get = AsyncMock(side_effect=state.get)
+    context.state = state
+    return context
+
+
+def make_installs(count):
+    return [InstallationInput(id=f"bulb-{i}") for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_run_bounds_concurrent_installs(mock_context):
+    started = []
+    finished = []
+    max_in_flight = 0
+
+    def workflow_call(handler, key, arg):
+        nonlocal max_in_flight
+        started.append(key)
+        max_in_flight = max(max_in_flight, len(started) - len(finished))
+
+        async def _result():
+            finished.append(key)
+            if key == "bulb-3":
+                raise TerminalError("Lightbulb ID already exists")
+
+        return _result()
+
+    mock_context.workflow_call = MagicMock(side_effect=workflow_call)
+
+    progress = await run(mock_context, BulkInstallationInput(installs=make_installs(7), concurrency=3))
+
+    assert started == [f"bulb-{i}" for i in range(7)]
+    assert max_in_flight == 3
+    assert progress.model_dump() == {"status": "completed", "total": 7, "completed": 7, "succeeded": 6, "failed": 1}
+    assert (await get_progress(mock_context)) == progress
+    failures = await get_failures(mock_context, FailurePageInput(page=0))
+    assert [(failure.id, failure.error) for failure in failures.failures] == [("bulb-3", "Lightbulb ID already exists")]
+
+
+@pytest.mark.asyncio
+async def test_run_pages_failures(mock_context, monkeypatch):
+    monkeypatch.setattr(bulk_installation_workflow, "FAILURE_PAGE_SIZE", 2)
+
+    async def _fail():
+        raise TerminalError("Toggle failed")
+
+    mock_context.workflow_call = MagicMock(side_effect=lambda handler, key, arg: _fail())
+
+    progress = await run(mock_context, BulkInstallationInput(installs=make_installs(5), concurrency=2))
+
+    assert progress.failed == 5
+    pages = [await get_failures(mock_context, FailurePageInput(page=page)) for page in range(4)]
+    assert [[failure.id for failure in page.failures] for page in pages] == [
+        ["bulb-0", "bulb-1"], ["bulb-2", "bulb-3"], ["bulb-4"], [],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_run_caps_concurrency_and_batches_progress(mock_context, monkeypatch):
+    monkeypatch.setattr(bulk_installation_workflow, "MAX_CONCURRENCY", 4)
+    monkeypatch.setattr(bulk_installation_workflow, "PROGRESS_INTERVAL", 3)
+    in_flight = []
+    max_in_flight = 0
+
+    def workflow_call(handler, key, arg):
+        nonlocal max_in_flight
+        in_flight.append(key)
+        max_in_flight = max(max_in_flight, len(in_flight))
+
+        async def _result():
+            in_flight.remove(key)
+
+        return _result()
+
+    mock_context.workflow_call = MagicMock(side_effect=workflow_call)
+
+    progress = await run(mock_context, BulkInstallationInput(installs=make_installs(10), concurrency=1_000_000))
+
+    assert max_in_flight == 4
+    assert progress.succeeded == 10
+    # Once when started, after the 3rd, 6th and 9th completions, and once done
+    progress_writes = [call for call in mock_context.set.call_args_list if call.args[0] == "progress"]
+    assert [call.args[1]["completed"] for call in progress_writes] == [0, 3, 6, 9, 10]
@@ -0,0 +1,172 @@
+import asyncio
+import pytest
+from nats.errors import NoRespondersError, TimeoutError as NATSTimeoutError
+from src.worker.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, RetryBudget, call_with_retries
+from src.worker.di import container
+from src.worker.services import EDGE_LINK_FAILURES, EdgeLinkCircuitBreaker, NATSClient, NATSClientOverloadedError
+from src.worker.utils import send_lightbulb_request
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_breaker(**kwargs) -> EdgeLinkCircuitBreaker:
+    options = dict(
+        failure_threshold=2, reset_timeout=1, max_reset_timeout=30, max_retries=2,
+        retry_base_delay=0, retry_max_delay=0, retry_budget_ratio=0.2,
+    )
+    return EdgeLinkCircuitBreaker(**{**options, **kwargs})
+
+
+async def succeed():
+    return "ok"
+
+
+async def time_out():
+    raise NATSTimeoutError()
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_fails_fast_and_recovers_through_a_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker("lightbulb", EDGE_LINK_FAILURES, failure_threshold=2, reset_timeout=4, clock=clock)
+
+    for _ in range(2):
+        with pytest.raises(NATSTimeoutError):
+            await breaker.call(time_out)
+    assert breaker.state == OPEN
+
+    calls = []
+
+    async def record():
+        calls.append(1)
+
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(record)
+    assert calls == []
+
+    # Jittered between half and all of the reset timeout
+    clock.now = 4
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(NATSTimeoutError):
+        await breaker.call(time_out)
+    assert breaker.state == OPEN
+    assert 4 <= breaker.open_until - clock.now <= 8
+
+    clock.now = 12
+    assert await breaker.call(succeed) == "ok"
+    assert breaker.snapshot() == {"state": CLOSED, "consecutive_failures": 0, "reopenings": 0, "retry_in": 0.0}
+
+
+@pytest.mark.asyncio
+async def test_half_open_allows_one_probe_and_ignores_other_errors():
+    clock = FakeClock()
+    breaker = CircuitBreaker("lightbulb", EDGE_LINK_FAILURES, failure_threshold=1, reset_timeout=1, clock=clock)
+    with pytest.raises(NATSTimeoutError):
+        await breaker.call(time_out)
+    clock.now = 1
+
+    async def overloaded():
+        # A second call while the probe is running fails fast
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(succeed)
+        raise NATSClientOverloadedError()
+
+    with pytest.raises(NATSClientOverloadedError):
+        await breaker.call(overloaded)
+
+    # Shedding load locally says nothing about the edge link, the next call probes again
+    assert breaker.state == HALF_OPEN
+    assert breaker.probes == 0
+    assert await breaker.call(succeed) == "ok"
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_calls_admitted_while_closed_do_not_move_a_half_open_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker("lightbulb", EDGE_LINK_FAILURES, failure_threshold=1, reset_timeout=1, clock=clock)
+    release = asyncio.Event()
+
+    async def slow(result):
+        await release.wait()
+        if result == "fail":
+            raise NATSTimeoutError()
+        return result
+
+    late_success = asyncio.create_task(breaker.call(lambda: slow("ok")))
+    late_failure = asyncio.create_task(breaker.call(lambda: slow("fail")))
+    await asyncio.sleep(0)
+    with pytest.raises(NATSTimeoutError):
+        await breaker.call(time_out)
+    clock.now = 1
+    assert breaker.state == HALF_OPEN
+
+    release.set()
+    assert await late_success == "ok"
+    with pytest.raises(NATSTimeoutError):
+        await late_failure
+    assert breaker.state == HALF_OPEN
+
+    assert await breaker.call(succeed) == "ok"
+    assert breaker.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_retries_are_capped_by_the_budget():
+    breaker = CircuitBreaker("lightbulb", EDGE_LINK_FAILURES, failure_threshold=100)
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    attempts = []
+
+    async def no_responders():
+        attempts.append(1)
+        raise NoRespondersError()
+
+    for _ in range(3):
+        with pytest.raises(NoRespondersError):
+            await call_with_retries(breaker, budget, no_responders, EDGE_LINK_FAILURES, max_retries=2, base_delay=0, max_delay=0)
+
+    # Two retries spend the budget, after which every call only earns half a retry back
+    assert len(attempts) == 3 + 1 + 2
+    assert budget.tokens == 0
+
+
+@pytest.mark.asyncio
+async def test_mutations_are_not_retried_after_timeouts():
+    breaker = make_breaker(failure_threshold=100)
+    attempts = []
+
+    async def counted_timeout():
+        attempts.append(1)
+        raise NATSTimeoutError()
+
+    with pytest.raises(NATSTimeoutError):
+        await breaker.call("lightbulb.3.toggle", counted_timeout)
+    assert len(attempts) == 1
+
+    with pytest.raises(NATSTimeoutError):
+        await breaker.call("lightbulb.3.get", counted_timeout)
+    assert len(attempts) == 1 + 3
+
+
+@pytest.mark.asyncio
+async def test_send_lightbulb_request_fails_fast_once_open(mock_nats_client):
+    def unreachable(data):
+        raise NoRespondersError()
+
+    client = mock_nats_client({"lightbulb.get": unreachable})
+    breaker = make_breaker(max_retries=0)
+    with container.override.service(target=NATSClient, new=client), container.override.service(target=EdgeLinkCircuitBreaker, new=breaker):
+        for _ in range(2):
+            with pytest.raises(NoRespondersError):
+                await send_lightbulb_request("bulb_1", "lightbulb.get")
+        with pytest.raises(CircuitOpenError):
+            await send_lightbulb_request("bulb_1", "lightbulb.get")
+
+    assert len(client.calls) == 2
+    assert breaker.snapshot()["circuits"]["lightbulb"]["state"] == OPEN
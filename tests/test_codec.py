@@ -0,0 +1,83 @@
+import zlib
+
+import pytest
+from src.codec import (
+    ACCEPT, ACCEPT_ENCODING, BINARY, CONTENT_ENCODING, CONTENT_TYPE, JSON, CodecError, WireFormat, decode, pack,
+    reply_format, unpack,
+)
+from src.models import LightbulbBatchResponse, LightbulbRequest, LightbulbResponse
+
+
+def batch_response(count: int) -> LightbulbBatchResponse:
+    return LightbulbBatchResponse(success=True, results=[
+        LightbulbResponse(id=f"bulb_{i}", success=True, data={"ctx": {"room": "kitchen", "floor": i % 3}, "status": "ON"})
+        for i in range(count)
+    ] + [LightbulbResponse(id="missing", success=False, error_message="Lightbulb ID not found")])
+
+
+def test_pack_round_trips_json_values():
+    value = {
+        "none": None, "flags": [True, False], "ints": [0, 1, -1, 63, -64, 2**40, -(2**70)], "float": -1.5,
+        "text": "ünïcødé " * 10, "nested": {"list": [{"a": []}, {}], "empty": ""},
+    }
+
+    assert unpack(pack(value)) == value
+
+
+@pytest.mark.parametrize("content_type", [JSON, BINARY])
+@pytest.mark.parametrize("compression_threshold", [None, 0])
+def test_wire_format_round_trips_models(content_type, compression_threshold):
+    wire_format = WireFormat(content_type, compression_threshold)
+    response = batch_response(50)
+
+    payload, headers = wire_format.encode(response)
+
+    assert decode(payload, headers, LightbulbBatchResponse) == response
+    assert (headers or {}).get(CONTENT_TYPE, JSON) == content_type
+    assert ((headers or {}).get(CONTENT_ENCODING) == "zlib") == (compression_threshold is not None)
+
+
+def test_binary_is_smaller_than_json_and_json_stays_headerless():
+    response = batch_response(100)
+
+    json_payload, json_headers = WireFormat().encode(response)
+    binary_payload, _ = WireFormat(BINARY).encode(response)
+
+    assert json_headers is None
+    assert json_payload == response.model_dump_json().encode()
+    assert len(binary_payload) < len(json_payload) / 2
+
+
+def test_compression_only_above_threshold():
+    _, small_headers = WireFormat(BINARY, 1024).encode(LightbulbRequest(id="bulb_1"))
+    _, large_headers = WireFormat(BINARY, 1024).encode(batch_response(100))
+
+    assert CONTENT_ENCODING not in small_headers
+    assert large_headers[CONTENT_ENCODING] == "zlib"
+
+
+def test_reply_format_negotiation():
+    assert reply_format(None, 100) == WireFormat()
+    assert reply_format({CONTENT_TYPE: BINARY}, 100) == WireFormat()
+    assert reply_format({ACCEPT: "application/cbor, application/x-lightbulb"}, 100) == WireFormat(BINARY)
+    assert reply_format({ACCEPT: JSON, ACCEPT_ENCODING: "gzip, zlib"}, 100) == WireFormat(JSON, 100)
+    assert WireFormat(BINARY, 100).accept_headers() == {ACCEPT: BINARY, ACCEPT_ENCODING: "zlib"}
+    assert WireFormat().accept_headers() is None
+
+
+@pytest.mark.parametrize("payload, headers", [
+    (b"", {CONTENT_TYPE: BINARY}),
+    (b"\x02\x00", {CONTENT_TYPE: BINARY}),
+    (pack({"id": "bulb_1"})[:-2], {CONTENT_TYPE: BINARY}),
+    (pack({"id": "bulb_1"}) + b"\x00", {CONTENT_TYPE: BINARY}),
+    (b"\x01\x7f", {CONTENT_TYPE: BINARY}),
+    # A dict keyed by a list
+    (bytes([1, 8, 1, 7, 0, 0]), {CONTENT_TYPE: BINARY}),
+    (b"not zlib", {CONTENT_ENCODING: "zlib"}),
+    (zlib.compress(b'{"id": "bulb_1"}')[:-4], {CONTENT_ENCODING: "zlib"}),
+    (b'{"id": "bulb_1"}', {CONTENT_ENCODING: "br"}),
+    (b'{"id": "bulb_1"}', {CONTENT_TYPE: "text/plain"}),
+])
+def test_decode_rejects_malformed_payloads(payload, headers):
+    with pytest.raises(CodecError):
+        decode(payload, headers, LightbulbRequest)
@@ -0,0 +1,283 @@
+import asyncio
+import json
+import pytest
+from src.edge_link import main as edge_link
+from src.codec import ACCEPT, ACCEPT_ENCODING, BINARY, CONTENT_TYPE, WireFormat, decode
+from src.models import LightbulbRequest, LightbulbResponse
+
+
+@pytest.fixture(autouse=True)
+def clear_light_bulbs():
+    edge_link.light_bulbs.clear()
+    edge_link.pending_events.clear()
+    yield
+    edge_link.light_bulbs.clear()
+    edge_link.pending_events.clear()
+
+
+def request(id: str, data: dict | None = None) -> str:
+    return json.dumps({"id": id, "data": data})
+
+
+def test_install_toggle_uninstall():
+    response = edge_link.get_response("lightbulb.install", request("test_id", {"room": "kitchen"}))
+    assert response.success is True
+    assert response.data == {"ctx": {"room": "kitchen"}, "status": "OFF"}
+
+    response = edge_link.get_response("lightbulb.install", request("test_id"))
+    assert response.success is False
+    assert response.error_message == "Lightbulb ID already exists"
+
+    response = edge_link.get_response("lightbulb.toggle", request("test_id"))
+    assert response.data["status"] == "ON"
+
+    response = edge_link.get_response("lightbulb.get", request("test_id"))
+    assert response.data["status"] == "ON"
+
+    response = edge_link.get_response("lightbulb.uninstall", request("test_id"))
+    assert response.success is True
+
+    response = edge_link.get_response("lightbulb.get", request("test_id"))
+    assert response.success is False
+    assert response.error_message == "Lightbulb ID not found"
+
+
+def test_get_batch():
+    edge_link.get_response("lightbulb.install", request("bulb_1"))
+    edge_link.get_response("lightbulb.install", request("bulb_2"))
+    edge_link.get_response("lightbulb.toggle", request("bulb_2"))
+
+    response = edge_link.get_response("lightbulb.get_batch", json.dumps({"ids": ["bulb_2", "missing", "bulb_1"]}))
+
+    assert response.success is True
+    assert [(result.id, result.success) for result in response.results] == [("bulb_2", True), ("missing", False), ("bulb_1", True)]
+    assert response.results[0].data["status"] == "ON"
+    assert response.results[2].data["status"] == "OFF"
+
+
+def test_invalid_request():
+    response = edge_link.get_response("lightbulb.get", json.dumps({"data": {}}))
+    assert response.success is False
+
+    response = edge_link.get_response("lightbulb.unknown", request("test_id"))
+    assert response.error_message == "Unknown subject"
+
+
+class FakeNATS:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, subject: str, payload: bytes, headers: dict | None = None):
+        self.published.append((subject, json.loads(payload) if headers is None else decode(payload, headers, LightbulbResponse).model_dump()))
+
+
+class FakeMsg:
+    def __init__(self, subject: str, data: str | bytes, reply: str, headers: dict | None = None):
+        self.subject = subject
+        self.data = data.encode() if isinstance(data, str) else data
+        self.reply = reply
+        self.headers = headers
+
+
+def test_get_responses_isolates_invalid_messages():
+    edge_link.get_response("lightbulb.install", request("bulb_1"))
+
+    responses = edge_link.get_responses([
+        ("lightbulb.toggle", request("bulb_1").encode()),
+        ("lightbulb.get", b'{"data": {}}'),
+        ("lightbulb.get", request("bulb_1").encode()),
+        ("lightbulb.get_batch", b'{"ids": ["bulb_1"]}'),
+        ("lightbulb.unknown", request("bulb_1").encode()),
+    ])
+
+    assert responses[0].data["status"] == "ON"
+    assert responses[1].success is False
+    assert responses[2].data["status"] == "ON"
+    assert responses[3].results[0].id == "bulb_1"
+    assert responses[4].error_message == "Unknown subject"
+
+
+def test_get_responses_does_not_let_payloads_combine():
+    edge_link.get_response("lightbulb.install", request("c"))
+
+    responses = edge_link.get_responses([
+        ("lightbulb.get", b'{"id":"a","data":{"x":"'),
+        ("lightbulb.uninstall", b'"},"k":"'),
+        ("lightbulb.install", b'"},{"id":"c"},{"id":"d"}'),
+    ])
+
+    assert [response.success for response in responses] == [False, False, False]
+    assert "c" in edge_link.light_bulbs
+    assert "d" not in edge_link.light_bulbs
+
+
+@pytest.mark.asyncio
+async def test_batch_processor_replies_in_order():
+    nc = FakeNATS()
+    processor = edge_link.BatchProcessor(nc)
+    processor.start()
+
+    await processor.enqueue(FakeMsg("lightbulb.install", request("bulb_1"), "reply.1"))
+    await processor.enqueue(FakeMsg("lightbulb.toggle", request("bulb_1"), "reply.2"))
+    await processor.enqueue(FakeMsg("lightbulb.get", request("missing"), "reply.3"))
+    await processor.stop()
+
+    assert [subject for subject, _ in nc.published] == [
+        "reply.1", "reply.2", "reply.3", "lightbulb.events.bulb_1", "lightbulb.events.bulb_1",
+    ]
+    assert nc.published[1][1]["data"]["status"] == "ON"
+    assert nc.published[2][1]["success"] is False
+
+
+@pytest.mark.asyncio
+async def test_batch_processor_survives_a_failed_reply():
+    class ReconnectingNATS(FakeNATS):
+        async def publish(self, subject: str, payload: bytes, headers: dict | None = None):
+            if subject == "reply.1":
+                raise ConnectionError("reconnecting")
+            await super().publish(subject, payload, headers)
+
+    nc = ReconnectingNATS()
+    processor = edge_link.BatchProcessor(nc)
+    processor.start()
+
+    # The first two share a batch
+    await processor.enqueue(FakeMsg("lightbulb.get", request("missing"), "reply.1"))
+    await processor.enqueue(FakeMsg("lightbulb.get", request("missing"), "reply.2"))
+    await asyncio.sleep(0)
+    await processor.enqueue(FakeMsg("lightbulb.get", request("missing"), "reply.3"))
+    await processor.stop()
+
+    assert [subject for subject, _ in nc.published] == ["reply.2", "reply.3"]
+
+
+@pytest.mark.asyncio
+async def test_handler_publishes_state_change_events():
+    nc = FakeNATS()
+    handler = edge_link.construct_handler(nc)
+
+    await handler(FakeMsg("lightbulb.install", request("bulb_1"), "reply.1"))
+    await handler(FakeMsg("lightbulb.get", request("bulb_1"), "reply.2"))
+    await handler(FakeMsg("lightbulb.toggle", request("bulb_1"), "reply.3"))
+    await handler(FakeMsg("lightbulb.uninstall", request("bulb_1"), "reply.4"))
+    await handler(FakeMsg("lightbulb.install", request("bad id"), "reply.5"))
+
+    events = [(subject, payload) for subject, payload in nc.published if not subject.startswith("reply.")]
+    assert events == [
+        ("lightbulb.events.bulb_1", {"id": "bulb_1", "data": {"ctx": {}, "status": "OFF"}}),
+        ("lightbulb.events.bulb_1", {"id": "bulb_1", "data": {"ctx": {}, "status": "ON"}}),
+        ("lightbulb.events.bulb_1", {"id": "bulb_1", "data": None}),
+    ]
+
+
+class BlockingNATS(FakeNATS):
+    """Holds back the replies to `blocked` until released"""
+
+    def __init__(self, blocked: str):
+        super().__init__()
+        self.blocked = blocked
+        self.release = asyncio.Event()
+
+    async def publish(self, subject: str, payload: bytes, headers: dict | None = None):
+        if subject.startswith(self.blocked):
+            await self.release.wait()
+        await super().publish(subject, payload, headers)
+
+
+def ids_on_separate_lanes(scheduler: edge_link.LaneScheduler) -> tuple[str, str]:
+    slow = "bulb_slow"
+    other = next(f"bulb_{i}" for i in range(100) if scheduler.lane_for(LightbulbRequest(id=f"bulb_{i}")) != scheduler.lane_for(LightbulbRequest(id=slow)))
+    return slow, other
+
+
+@pytest.mark.asyncio
+async def test_lane_scheduler_orders_per_bulb_and_runs_bulbs_in_parallel():
+    nc = BlockingNATS("reply.slow")
+    scheduler = edge_link.LaneScheduler(nc, lane_count=4)
+    slow, other = ids_on_separate_lanes(scheduler)
+    scheduler.start()
+
+    await scheduler.enqueue(FakeMsg("lightbulb.install", request(slow), "reply.slow.1"))
+    await scheduler.enqueue(FakeMsg("lightbulb.toggle", request(slow), "reply.2"))
+    await scheduler.enqueue(FakeMsg("lightbulb.install", request(other), "reply.3"))
+    await scheduler.enqueue(FakeMsg("lightbulb.toggle", request(other), "reply.4"))
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    # The other bulb is served while the slow bulb's lane waits on its first reply
+    replies = [(subject, payload) for subject, payload in nc.published if subject.startswith("reply.")]
+    assert [subject for subject, _ in replies] == ["reply.3", "reply.4"]
+    assert replies[1][1]["data"]["status"] == "ON"
+
+    nc.release.set()
+    await scheduler.stop()
+
+    replies = [subject for subject, _ in nc.published if subject.startswith("reply.")]
+    assert replies == ["reply.3", "reply.4", "reply.slow.1", "reply.2"]
+    assert sum(lane["processed"] for lane in scheduler.stats()) == 4
+
+
+@pytest.mark.asyncio
+async def test_lane_scheduler_bounds_lane_queues():
+    nc = BlockingNATS("reply.")
+    scheduler = edge_link.LaneScheduler(nc, lane_count=2, queue_size=1)
+    scheduler.start()
+    edge_link.get_response("lightbulb.install", request("bulb_1"))
+    edge_link.take_events()
+    lane = scheduler.lane_for(LightbulbRequest(id="bulb_1"))
+
+    await scheduler.enqueue(FakeMsg("lightbulb.get", request("bulb_1"), "reply.1"))
+    await asyncio.sleep(0)
+    await scheduler.enqueue(FakeMsg("lightbulb.get", request("bulb_1"), "reply.2"))
+    blocked = asyncio.ensure_future(scheduler.enqueue(FakeMsg("lightbulb.get", request("bulb_1"), "reply.3")))
+    await asyncio.sleep(0.01)
+
+    assert not blocked.done()
+    assert scheduler.stats()[lane]["depth"] == 1
+    assert scheduler.stats()[lane]["max_depth"] == 1
+
+    nc.release.set()
+    await blocked
+    await scheduler.stop()
+    assert [subject for subject, _ in nc.published] == ["reply.1", "reply.2", "reply.3"]
+
+
+@pytest.mark.asyncio
+async def test_lane_scheduler_replies_to_invalid_messages():
+    nc = FakeNATS()
+    scheduler = edge_link.LaneScheduler(nc, lane_count=2)
+    scheduler.start()
+
+    await scheduler.enqueue(FakeMsg("lightbulb.get", '{"data": {}}', "reply.1"))
+    await scheduler.enqueue(FakeMsg("lightbulb.get_batch", '{"ids": []}', "reply.2"))
+    await scheduler.stop()
+
+    assert nc.published[0][1]["success"] is False
+    assert nc.published[1][1] == {"success": True, "results": [], "error_message": None}
+
+
+@pytest.mark.asyncio
+async def test_handler_replies_in_negotiated_format():
+    nc = FakeNATS()
+    handler = edge_link.construct_handler(nc)
+    payload, headers = WireFormat(BINARY, 0).encode(LightbulbRequest(id="bulb_1", data={"room": "kitchen"}))
+
+    await handler(FakeMsg("lightbulb.install", payload, "reply.1", {**headers, ACCEPT: BINARY, ACCEPT_ENCODING: "zlib"}))
+    await handler(FakeMsg("lightbulb.get", request("bulb_1"), "reply.2"))
+    await handler(FakeMsg("lightbulb.get", b"\x01\xff", "reply.3", {CONTENT_TYPE: BINARY}))
+
+    replies = dict((subject, payload) for subject, payload in nc.published if subject.startswith("reply."))
+    assert replies["reply.1"]["data"] == {"ctx": {"room": "kitchen"}, "status": "OFF"}
+    assert replies["reply.2"]["data"] == {"ctx": {"room": "kitchen"}, "status": "OFF"}
+    assert replies["reply.3"]["success"] is False
+
+
+def test_get_responses_decodes_each_message_by_its_headers():
+    binary, headers = WireFormat(BINARY).encode(LightbulbRequest(id="bulb_1"))
+
+    responses = edge_link.get_responses(
+        [("lightbulb.install", binary), ("lightbulb.get", request("bulb_1").encode())],
+        [headers, None],
+    )
+
+    assert [response.success for response in responses] == [True, True]
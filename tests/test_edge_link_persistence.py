@@ -0,0 +1,105 @@
+import asyncio
+import errno
+import json
+import pytest
+from types import SimpleNamespace
+from src.edge_link import main as edge_link
+from src.edge_link.persistence import EdgeLinkPersistence, PersistenceError, WriteAheadLog
+from src.edge_link.store import LightbulbStore
+
+
+@pytest.fixture(autouse=True)
+def clear_light_bulbs():
+    edge_link.light_bulbs.clear()
+    yield
+    edge_link.light_bulbs.clear()
+
+
+def request(id: str, data: dict | None = None) -> str:
+    return json.dumps({"id": id, "data": data})
+
+
+async def start_persistence(monkeypatch, directory) -> EdgeLinkPersistence:
+    persistence = EdgeLinkPersistence(directory, commit_interval=0.001)
+    await persistence.start(edge_link.light_bulbs)
+    monkeypatch.setattr(edge_link, "persistence", persistence)
+    return persistence
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(monkeypatch, tmp_path):
+    persistence = await start_persistence(monkeypatch, tmp_path)
+    edge_link.get_response("lightbulb.install", request("bulb_1", {"room": "kitchen"}))
+    edge_link.get_response("lightbulb.install", request("bulb_2"))
+    edge_link.get_response("lightbulb.install", request("bulb_3"))
+    edge_link.get_response("lightbulb.toggle", request("bulb_1"))
+    edge_link.get_response("lightbulb.uninstall", request("bulb_2"))
+    await persistence.sync()
+    expected = dict(edge_link.light_bulbs.items())
+    await persistence.close()
+
+    recovered = LightbulbStore()
+    EdgeLinkPersistence(tmp_path).recover(recovered)
+
+    assert dict(recovered.items()) == expected
+    assert recovered.get("bulb_1") == {"ctx": {"room": "kitchen"}, "status": "ON"}
+
+
+@pytest.mark.asyncio
+async def test_snapshot_compacts_log(monkeypatch, tmp_path):
+    persistence = await start_persistence(monkeypatch, tmp_path)
+    for i in range(10):
+        edge_link.get_response("lightbulb.install", request(f"bulb_{i}"))
+    await persistence.snapshot(edge_link.light_bulbs)
+    edge_link.get_response("lightbulb.toggle", request("bulb_3"))
+    edge_link.get_response("lightbulb.uninstall", request("bulb_4"))
+    await persistence.close()
+
+    assert [path.name for path in sorted(tmp_path.iterdir())] == ["snapshot-00000001.dat", "wal-00000001.log"]
+
+    recovered = LightbulbStore()
+    EdgeLinkPersistence(tmp_path).recover(recovered)
+
+    assert len(recovered) == 9
+    assert recovered.get("bulb_3")["status"] == "ON"
+    assert "bulb_4" not in recovered
+
+
+@pytest.mark.asyncio
+async def test_recovery_ignores_torn_record(monkeypatch, tmp_path):
+    persistence = await start_persistence(monkeypatch, tmp_path)
+    edge_link.get_response("lightbulb.install", request("bulb_1"))
+    await persistence.close()
+
+    with open(tmp_path / "wal-00000000.log", "ab") as f:
+        f.write(b'["install","bulb_2"')
+
+    recovered = LightbulbStore()
+    next_seq = EdgeLinkPersistence(tmp_path).recover(recovered)
+
+    assert [id for id, _ in recovered.items()] == ["bulb_1"]
+    assert next_seq == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_write_fails_pending_and_later_syncs(monkeypatch, tmp_path):
+    persistence = await start_persistence(monkeypatch, tmp_path)
+    published = []
+
+    class FakeNATS:
+        async def publish(self, subject, payload, headers=None):
+            published.append((subject, json.loads(payload)))
+
+    def disk_full(fd, data):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(WriteAheadLog, "_write", staticmethod(disk_full))
+    handler = edge_link.construct_handler(FakeNATS())
+    await handler(SimpleNamespace(subject="lightbulb.install", data=request("bulb_1").encode(), reply="reply.1", headers=None))
+    while not published:
+        await asyncio.sleep(0.001)
+
+    assert published[0] == ("reply.1", {"success": False, "id": None, "data": None, "error_message": edge_link.NOT_DURABLE_ERROR})
+    with pytest.raises(PersistenceError):
+        await persistence.sync()
+    await persistence.close()
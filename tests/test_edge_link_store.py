@@ -0,0 +1,39 @@
+from src.edge_link.store import LightbulbStore
+
+
+def test_install_toggle_uninstall():
+    store = LightbulbStore()
+
+    assert store.install("bulb_1", {"room": "kitchen"}) == {"ctx": {"room": "kitchen"}, "status": "OFF"}
+    assert store.install("bulb_2") == {"ctx": {}, "status": "OFF"}
+    assert "bulb_1" in store
+    assert len(store) == 2
+
+    assert store.toggle("bulb_2") == {"ctx": {}, "status": "ON"}
+    assert store.get("bulb_1")["status"] == "OFF"
+    assert store.toggle("bulb_2")["status"] == "OFF"
+
+    assert store.uninstall("bulb_1") is True
+    assert store.uninstall("bulb_1") is False
+    assert store.get("bulb_1") is None
+    assert store.toggle("bulb_1") is None
+    assert len(store) == 1
+
+
+def test_reused_slot_starts_clean():
+    store = LightbulbStore()
+    store.install("bulb_1", {"room": "kitchen"})
+    store.toggle("bulb_1")
+    store.uninstall("bulb_1")
+
+    assert store.install("bulb_2") == {"ctx": {}, "status": "OFF"}
+
+
+def test_many_bulbs_keep_independent_status_bits():
+    store = LightbulbStore()
+    for i in range(100):
+        store.install(f"bulb_{i}")
+    for i in range(0, 100, 3):
+        store.toggle(f"bulb_{i}")
+
+    assert [status == "ON" for _, status, _ in store.rows()] == [i % 3 == 0 for i in range(100)]
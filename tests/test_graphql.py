@@ -0,0 +1,263 @@
+import asyncio
+import json
+import httpx
+import pytest
+from src.api import graphql
+from src.api.graphql import call_restate, create_lightbulb_loader, fetch_lightbulb, fetch_lightbulbs, schema
+from src.api.restate_client import create_restate_client
+
+
+def make_restate_client(handler):
+    return create_restate_client(base_url="http://restate:8080", transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_call_restate_uses_shared_client():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"success": True})
+
+    async with make_restate_client(handler) as client:
+        key_1 = await call_restate(client, "LightbulbManagementSvc", "toggle_lightbulb", {"id": "test_id"})
+        key_2 = await call_restate(client, "LightbulbManagementSvc", "toggle_lightbulb", {"id": "test_id"})
+
+    assert key_1 == key_2
+    assert len(requests) == 2
+    assert str(requests[0].url) == "http://restate:8080/LightbulbManagementSvc/toggle_lightbulb"
+    assert requests[0].headers["idempotency-key"] == key_1
+    assert json.loads(requests[0].content) == {"id": "test_id"}
+
+
+@pytest.mark.asyncio
+async def test_lightbulb_query():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"success": True, "id": "test_id", "data": {"ctx": {}, "status": "ON"}})
+
+    async with make_restate_client(handler) as client:
+        result = await schema.execute(
+            '{ lightbulb(id: "test_id") { id status } }',
+            context_value={"restate_client": client},
+        )
+
+    assert result.errors is None
+    assert result.data == {"lightbulb": {"id": "test_id", "status": "ON"}}
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("read_mode, expected_paths", [
+    ("direct", ["/LightbulbManagementSvc/get_lightbulb"]),
+    ("output", ["/LightbulbManagementSvc/get_lightbulb", "/restate/invocation/LightbulbManagementSvc/get_lightbulb/{key}/output"]),
+])
+async def test_fetch_lightbulb_read_modes(read_mode, expected_paths):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"success": True, "id": "test_id", "data": {"ctx": {}, "status": "OFF"}})
+
+    async with make_restate_client(handler) as client:
+        result = await fetch_lightbulb(client, "test_id", read_mode=read_mode)
+
+    key = requests[0].headers["idempotency-key"]
+    assert result["data"]["status"] == "OFF"
+    assert [request.url.path for request in requests] == [path.format(key=key) for path in expected_paths]
+
+
+@pytest.mark.asyncio
+async def test_fetch_lightbulb_without_dedup():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"success": True, "id": "test_id", "data": {"ctx": {}, "status": "OFF"}})
+
+    async with make_restate_client(handler) as client:
+        await fetch_lightbulb(client, "test_id", read_mode="direct", dedup=False)
+
+    assert "idempotency-key" not in requests[0].headers
+
+
+@pytest.mark.asyncio
+async def test_lightbulbs_query_batches_ids():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        ids = json.loads(request.content)["ids"]
+        return httpx.Response(200, json={
+            "success": True,
+            "results": [
+                {"id": id, "success": True, "data": {"ctx": {}, "status": "OFF"}} if id != "missing"
+                else {"id": id, "success": False, "error_message": "Lightbulb ID not found"}
+                for id in ids
+            ],
+        })
+
+    ids = [f"bulb_{i}" for i in range(250)] + ["missing"]
+    async with make_restate_client(handler) as client:
+        result = await schema.execute(
+            "query ($ids: [String!]!) { lightbulbs(ids: $ids) { id status } }",
+            variable_values={"ids": ids},
+            context_value={"restate_client": client, "lightbulb_loader": create_lightbulb_loader(client)},
+        )
+
+    assert result.errors is None
+    assert [bulb["id"] if bulb else None for bulb in result.data["lightbulbs"]] == ids[:-1] + [None]
+    assert all(request.url.path == "/LightbulbManagementSvc/get_lightbulbs" for request in requests)
+    assert len(requests) == 3
+
+
+@pytest.mark.asyncio
+async def test_install_lightbulbs_starts_bulk_workflow():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.path.endswith("/get_progress"):
+            return httpx.Response(200, json={"status": "running", "total": 2, "completed": 1, "succeeded": 0, "failed": 1})
+        return httpx.Response(200, json={"invocationId": "inv_1", "status": "Accepted"})
+
+    async with make_restate_client(handler) as client:
+        result = await schema.execute(
+            'mutation { installLightbulbs(inputs: [{id: "a"}, {id: "b"}], concurrency: 10) { key } }',
+            context_value={"restate_client": client},
+        )
+        key = result.data["installLightbulbs"]["key"]
+        progress = await schema.execute(
+            'query ($key: String!) { installationProgress(key: $key) { status completed failed } }',
+            variable_values={"key": key},
+            context_value={"restate_client": client},
+        )
+        invalid = await schema.execute(
+            'query { installationFailures(key: "../../restate/deployments?x=") { id } }',
+            context_value={"restate_client": client},
+        )
+
+    assert result.errors is None
+    assert invalid.errors[0].message == "Invalid installation key"
+    assert len(requests) == 2
+    assert requests[0].url.path == f"/BulkInstallationWorkflow/{key}/run/send"
+    body = json.loads(requests[0].content)
+    assert [install["id"] for install in body["installs"]] == ["a", "b"]
+    assert body["concurrency"] == 10
+    assert requests[1].url.path == f"/BulkInstallationWorkflow/{key}/get_progress"
+    assert progress.data == {"installationProgress": {"status": "running", "completed": 1, "failed": 1}}
+
+
+@pytest.mark.asyncio
+async def test_object_routing_reads_bulb_objects():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        id = request.url.path.split("/")[2]
+        if id == "missing":
+            return httpx.Response(500, json={"message": "Lightbulb ID not found"})
+        return httpx.Response(200, json={"success": True, "id": id, "data": {"ctx": {}, "status": "ON"}})
+
+    async with make_restate_client(handler) as client:
+        bulb = await fetch_lightbulb(client, "a", routing="object")
+        bulbs = await fetch_lightbulbs(client, ["a", "missing", "b"], routing="object")
+
+    assert bulb["id"] == "a"
+    assert [bulb and bulb["id"] for bulb in bulbs] == ["a", None, "b"]
+    assert sorted(request.url.path for request in requests) == [
+        "/Lightbulb/a/get", "/Lightbulb/a/get", "/Lightbulb/b/get", "/Lightbulb/missing/get",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_invocation_result_shares_one_attachment_between_waiters():
+    requests = []
+    release = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.path.endswith("/attach"):
+            await release.wait()
+        return httpx.Response(200, json={"success": True, "id": "test_id", "data": {"ctx": {}, "status": "ON"}})
+
+    query = 'query ($key: String!) { invocationResult(key: $key, timeoutMs: 1000) { ready output error } }'
+    async with make_restate_client(handler) as client:
+        mutation = await schema.execute('mutation { toggleLightbulb(id: "test_id") { key } }', context_value={"restate_client": client})
+        key = mutation.data["toggleLightbulb"]["key"]
+        waiters = [
+            asyncio.ensure_future(schema.execute(query, variable_values={"key": key}, context_value={"restate_client": client}))
+            for _ in range(5)
+        ]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+    idempotency_key = requests[0].headers["idempotency-key"]
+    assert key == f"invocation/LightbulbManagementSvc/toggle_lightbulb/{idempotency_key}"
+    assert [request.url.path for request in requests] == [
+        "/LightbulbManagementSvc/toggle_lightbulb", f"/restate/{key}/attach",
+    ]
+    assert all(result.data["invocationResult"]["ready"] for result in results)
+    assert results[0].data["invocationResult"]["output"]["data"]["status"] == "ON"
+
+
+@pytest.mark.asyncio
+async def test_invocation_result_times_out_and_reports_failures():
+    paths = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        paths.append(request.url.raw_path)
+        if "slow" in request.url.path:
+            await asyncio.sleep(1)
+        if "missing" in request.url.path:
+            return httpx.Response(404, json={"message": "not found"})
+        return httpx.Response(500, json={"message": "Lightbulb ID not found"})
+
+    query = 'query ($key: String!) { invocationResult(key: $key, timeoutMs: 20) { ready error } }'
+    async with make_restate_client(handler) as client:
+        results = [
+            (await schema.execute(query, variable_values={"key": key}, context_value={"restate_client": client})).data
+            for key in ("workflow/InstallationWorkflow/slow", "workflow/InstallationWorkflow/missing", "workflow/InstallationWorkflow/a?b#c%")
+        ]
+        invalid = await schema.execute(query, variable_values={"key": "deployments"}, context_value={"restate_client": client})
+
+    assert [result["invocationResult"] for result in results] == [
+        {"ready": False, "error": None},
+        {"ready": True, "error": "Invocation not found"},
+        {"ready": True, "error": "Lightbulb ID not found"},
+    ]
+    assert invalid.errors[0].message == "Invalid invocation key"
+    # Bulb IDs are encoded rather than read as a query string or fragment
+    assert paths[-1] == b"/restate/workflow/InstallationWorkflow/a%3Fb%23c%25/attach"
+
+
+@pytest.mark.asyncio
+async def test_async_install_streams_workflow_result(monkeypatch):
+    monkeypatch.setattr(graphql, "LIGHTBULB_ASYNC_MUTATIONS", True)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.path.endswith("/attach"):
+            return httpx.Response(200, json={"success": True, "id": "test_id", "data": {"ctx": {}, "status": "OFF"}})
+        return httpx.Response(202, json={"invocationId": "inv_1", "status": "Accepted"})
+
+    async with make_restate_client(handler) as client:
+        mutation = await schema.execute('mutation { installLightbulb(input: {id: "test_id"}) { key } }', context_value={"restate_client": client})
+        key = mutation.data["installLightbulb"]["key"]
+        subscription = await schema.subscribe(
+            'subscription ($key: String!) { invocationResult(key: $key) { ready output } }',
+            variable_values={"key": key},
+            context_value={"restate_client": client},
+        )
+        results = [result async for result in subscription]
+
+    assert key == "workflow/InstallationWorkflow/test_id"
+    assert [request.url.path for request in requests] == [
+        "/InstallationWorkflow/test_id/run/send", "/restate/workflow/InstallationWorkflow/test_id/attach",
+    ]
+    assert [result.data["invocationResult"]["ready"] for result in results] == [True]
+    assert results[0].data["invocationResult"]["output"]["data"]["status"] == "OFF"
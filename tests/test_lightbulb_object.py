@@ -0,0 +1,91 @@
+import inspect
+import json
+import pytest
+import pytest_asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+from src.worker.lightbulb_object import get, install, refresh, toggle, uninstall
+from src.worker.models import LightbulbDataInput
+from src.worker.services import NATSClient
+from src.worker.di import container
+
+
+@pytest_asyncio.fixture
+def mock_context():
+    ctx = AsyncMock()
+    state = {}
+
+    async def mocked_run(description, func_call, serde=None, max_attempts=None):
+        if inspect.iscoroutinefunction(func_call):
+            return await func_call()
+        return func_call()
+
+    ctx.run.side_effect = mocked_run
+    ctx.key = MagicMock(return_value="test_id")
+    ctx.get = AsyncMock(side_effect=state.get)
+    ctx.set = MagicMock(side_effect=state.__setitem__)
+    ctx.clear = MagicMock(side_effect=lambda name: state.pop(name, None))
+    ctx.object_send = MagicMock()
+    ctx.request = MagicMock(return_value=SimpleNamespace(headers={}))
+    ctx.state = state
+    return ctx
+
+
+def bulb_response(status):
+    return json.dumps({"id": "test_id", "success": True, "data": {"ctx": {}, "status": status}})
+
+
+@pytest.mark.asyncio
+async def test_get_serves_cached_state(mock_context, mock_nats_client):
+    mock_client = mock_nats_client()
+    mock_context.state["bulb"] = {"ctx": {}, "status": "ON"}
+
+    with container.override.service(target=NATSClient, new=mock_client):
+        response = await get(mock_context)
+
+    assert response.data == {"ctx": {}, "status": "ON"}
+    assert mock_client.calls == []
+    mock_context.object_send.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_miss_reads_edge_link_and_refreshes(mock_context, mock_nats_client):
+    mock_client = mock_nats_client({"lightbulb.get": bulb_response("OFF")})
+
+    with container.override.service(target=NATSClient, new=mock_client):
+        response = await get(mock_context)
+        mock_context.object_send.assert_called_once_with(refresh, key="test_id", arg=None)
+        await refresh(mock_context)
+
+    assert response.data["status"] == "OFF"
+    assert mock_context.state["bulb"] == {"ctx": {}, "status": "OFF"}
+
+
+@pytest.mark.asyncio
+async def test_writes_update_cached_state(mock_context, mock_nats_client):
+    mock_client = mock_nats_client({
+        "lightbulb.install": bulb_response("OFF"),
+        "lightbulb.toggle": bulb_response("ON"),
+        "lightbulb.uninstall": json.dumps({"id": "test_id", "success": True}),
+    })
+
+    with container.override.service(target=NATSClient, new=mock_client):
+        await install(mock_context, LightbulbDataInput())
+        assert mock_context.state["bulb"]["status"] == "OFF"
+
+        await toggle(mock_context)
+        assert mock_context.state["bulb"]["status"] == "ON"
+
+        assert await uninstall(mock_context) is True
+        assert "bulb" not in mock_context.state
+
+
+@pytest.mark.asyncio
+async def test_refresh_clears_state_of_missing_bulb(mock_context, mock_nats_client):
+    mock_client = mock_nats_client({"lightbulb.get": json.dumps({"success": False, "error_message": "Lightbulb ID not found"})})
+    mock_context.state["bulb"] = {"ctx": {}, "status": "ON"}
+
+    with container.override.service(target=NATSClient, new=mock_client):
+        await refresh(mock_context)
+
+    assert "bulb" not in mock_context.state
@@ -1,23 +1,27 @@
 import json
 import pytest
+from datetime import timedelta
 import pytest_asyncio
-from unittest.mock import AsyncMock
-from src.worker.lightbulb_service import install_lightbulb, get_lightbulb, toggle_lightbulb, uninstall_lightbulb
-from src.worker.models import LightbulbIdInput, LightbulbDataIo
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+from src.worker.lightbulb_service import install_lightbulb, get_lightbulb, get_lightbulbs, toggle_lightbulb, uninstall_lightbulb
+from src.worker.models import LightbulbIdInput, LightbulbIdsInput, LightbulbDataIo
 from src.worker.services import NATSClient
 from src.worker.di import container
+from src.models import LightbulbResponse
 
 @pytest_asyncio.fixture
 def mock_context():
     ctx = AsyncMock()
     # Configure the run method to forward its second argument's result
-    async def mocked_run(description, func_call, max_attempts=None):
+    async def mocked_run(description, func_call, serde=None, max_attempts=None):
         # Just call the function that was wrapped by wrap_async_call
         if callable(func_call):
             return await func_call()
         return func_call
     
     ctx.run.side_effect = mocked_run
+    ctx.request = MagicMock(return_value=SimpleNamespace(headers={}))
     return ctx
 
 @pytest_asyncio.fixture
@@ -89,7 +93,7 @@ async def test_toggle_lightbulb(mock_context, mock_id_input, mock_nats_client):
     })
     
     # Need to handle both the send_lightbulb_request and the get_random_delay calls
-    async def mocked_run(description, func_call, max_attempts=None):
+    async def mocked_run(description, func_call, serde=None, max_attempts=None):
         if description == "getting random delay":
             return 1
         # Otherwise, call the function
@@ -105,6 +109,7 @@ async def test_toggle_lightbulb(mock_context, mock_id_input, mock_nats_client):
         assert response.id == "test_id"
         assert response.data["status"] == "OFF"
         assert response.run_time == 1
+        mock_context.sleep.assert_awaited_once_with(timedelta(seconds=1))
         
         assert len(mock_client.calls) == 1
         assert mock_client.calls[0]["subject"] == "lightbulb.toggle"
@@ -125,3 +130,49 @@ async def test_uninstall_lightbulb(mock_context, mock_id_input, mock_nats_client
         
         assert len(mock_client.calls) == 1
         assert mock_client.calls[0]["subject"] == "lightbulb.uninstall"
+
+@pytest.mark.asyncio
+async def test_get_lightbulbs(mock_context, mock_nats_client):
+    mock_client = mock_nats_client({
+        "lightbulb.get_batch": lambda data: json.dumps({
+            "success": True,
+            "results": [
+                {"id": id, "success": True, "data": {"status": "ON"}} if id == "test_id"
+                else {"id": id, "success": False, "error_message": "Lightbulb ID not found"}
+                for id in data["ids"]
+            ]
+        })
+    })
+
+    with container.override.service(target=NATSClient, new=mock_client):
+        response = await get_lightbulbs(mock_context, LightbulbIdsInput(ids=["test_id", "missing_id"]))
+
+        assert response.success is True
+        assert [result.id for result in response.results] == ["test_id", "missing_id"]
+        assert response.results[0].data["status"] == "ON"
+        assert response.results[1].success is False
+
+        assert len(mock_client.calls) == 1
+        assert mock_client.calls[0]["subject"] == "lightbulb.get_batch"
+        assert json.loads(mock_client.calls[0]["data"]) == {"ids": ["test_id", "missing_id"]}
+
+@pytest.mark.asyncio
+async def test_get_lightbulb_replays_typed_journal_entry(mock_context, mock_id_input, mock_nats_client):
+    journal = []
+
+    # Journal the result with the provided serde, then return it as a replay would
+    async def replaying_run(description, func_call, serde=None, max_attempts=None):
+        journal.append(serde.serialize(await func_call()))
+        return serde.deserialize(journal[-1])
+
+    mock_context.run.side_effect = replaying_run
+    mock_client = mock_nats_client({
+        "lightbulb.get": json.dumps({"id": "test_id", "success": True, "data": {"status": "ON"}})
+    })
+
+    with container.override.service(target=NATSClient, new=mock_client):
+        response = await get_lightbulb(mock_context, mock_id_input)
+
+    assert isinstance(response, LightbulbResponse)
+    assert response.data == {"status": "ON"}
+    assert json.loads(journal[0])["id"] == "test_id"
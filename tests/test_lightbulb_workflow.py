@@ -2,10 +2,12 @@ import json
 import pytest
 import pytest_asyncio
 import inspect
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock
 from src.worker.lightbulb_workflow import run
 from src.worker.lightbulb_service import install_lightbulb, get_lightbulb, toggle_lightbulb, uninstall_lightbulb
-from src.worker.models import LightbulbDataIo
+from restate.exceptions import TerminalError
+from src.worker.models import InstallationInput
 from src.worker.services import NATSClient
 from src.worker.di import container
 
@@ -14,13 +16,15 @@ def mock_context():
     context = AsyncMock()
     # Make ctx.set return a regular MagicMock instead of a coroutine to avoid unawaited coroutine warnings
     context.set = MagicMock()
+    context.object_send = MagicMock()
+    context.request = MagicMock(return_value=SimpleNamespace(headers={}))
     return context
 
 @pytest_asyncio.fixture
 def mock_service_context():
     ctx = AsyncMock()
     # Configure the run method to handle both coroutines and regular functions
-    async def mocked_run(description, func_call, max_attempts=None):
+    async def mocked_run(description, func_call, serde=None, max_attempts=None):
         if description == "getting random delay":
             return 1  # Special case for the delay
             
@@ -33,11 +37,12 @@ def mock_service_context():
         return func_call
     
     ctx.run.side_effect = mocked_run
+    ctx.request = MagicMock(return_value=SimpleNamespace(headers={}))
     return ctx
 
 @pytest_asyncio.fixture
 def mock_input():
-    return LightbulbDataIo(id="test_id", data={"status": "ON"})
+    return InstallationInput(id="test_id", data={"status": "ON"})
 
 @pytest.mark.asyncio
 async def test_run(mock_context, mock_service_context, mock_input, mock_nats_client):
@@ -95,3 +100,38 @@ async def test_run(mock_context, mock_service_context, mock_input, mock_nats_cli
         assert mock_client.calls[2]["subject"] == "lightbulb.toggle"
         # The last call should be to toggle again to restore original state
         assert mock_client.calls[3]["subject"] == "lightbulb.toggle"
+
+
+@pytest.mark.asyncio
+async def test_run_inline(mock_context, mock_service_context, mock_nats_client):
+    mock_client = mock_nats_client({
+        "lightbulb.get": json.dumps({"id": "test_id", "success": True, "data": {"status": "OFF"}}),
+        "lightbulb.toggle": json.dumps({"id": "test_id", "success": True, "data": {"status": "ON"}}),
+    })
+    # Inline steps are journaled by the workflow's own context
+    mock_context.run.side_effect = mock_service_context.run.side_effect
+
+    with container.override.service(target=NATSClient, new=mock_client):
+        await run(mock_context, InstallationInput(id="test_id", mode="inline"))
+
+    mock_context.service_call.assert_not_called()
+    assert [call["subject"] for call in mock_client.calls] == [
+        "lightbulb.install", "lightbulb.get", "lightbulb.toggle", "lightbulb.toggle",
+    ]
+    assert mock_context.sleep.await_count == 2
+    mock_context.set.assert_called_with("installation_status", "completed")
+
+
+@pytest.mark.asyncio
+async def test_run_inline_uninstalls_when_toggle_fails(mock_context, mock_service_context, mock_nats_client):
+    unchanged = json.dumps({"id": "test_id", "success": True, "data": {"status": "OFF"}})
+    mock_client = mock_nats_client({"lightbulb.get": unchanged, "lightbulb.toggle": unchanged})
+    mock_context.run.side_effect = mock_service_context.run.side_effect
+
+    with container.override.service(target=NATSClient, new=mock_client):
+        with pytest.raises(TerminalError):
+            await run(mock_context, InstallationInput(id="test_id", mode="inline"))
+
+    assert [call["subject"] for call in mock_client.calls] == [
+        "lightbulb.install", "lightbulb.get", "lightbulb.toggle", "lightbulb.uninstall",
+    ]
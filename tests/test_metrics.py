@@ -0,0 +1,130 @@
+import httpx
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+from src import metrics
+from src.api.graphql import RESOLVER_DURATION, schema
+from src.api.restate_client import create_restate_client
+from src.edge_link import main as edge_link
+from src.models import LightbulbRequest
+from src.worker.di import container
+from src.worker.lightbulb_service import toggle_lightbulb
+from src.worker.models import LightbulbIdInput
+from src.worker.services import NATS_REQUEST_DURATION, InMemoryTransport, NATSClient
+from src.worker.utils import HANDLER_DURATION, STEP_DURATION, STEP_ERRORS, run_step
+
+
+def test_render_prometheus_text_format():
+    registry = metrics.Registry()
+    requests = registry.register(metrics.Counter("requests_total", "Requests", ("subject",)))
+    latency = registry.register(metrics.Histogram("latency_seconds", "Latency", ("subject",), buckets=(0.1, 1.0)))
+    registry.register(metrics.Gauge("bulbs", "Bulbs", lambda: 3))
+    registry.register(metrics.Gauge("broken", "Fails when scraped", lambda: 1 / 0))
+
+    requests.inc('say "hi"')
+    requests.inc('say "hi"', amount=2)
+    for value in (0.05, 0.1, 0.5, 2):
+        latency.observe(value, "get")
+
+    assert registry.render() == "\n".join([
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{subject="say \\"hi\\""} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{subject="get",le="0.1"} 2',
+        'latency_seconds_bucket{subject="get",le="1.0"} 3',
+        'latency_seconds_bucket{subject="get",le="+Inf"} 4',
+        'latency_seconds_count{subject="get"} 4',
+        'latency_seconds_sum{subject="get"} 2.65',
+        "# HELP bulbs Bulbs",
+        "# TYPE bulbs gauge",
+        "bulbs 3",
+    ]) + "\n"
+
+
+@pytest.mark.asyncio
+async def test_http_server_serves_metrics():
+    server = await metrics.start_http_server(0, "127.0.0.1")
+    port = server.sockets[0].getsockname()[1]
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            scrape = await client.get("/metrics")
+            missing = await client.get("/")
+    finally:
+        server.close()
+        await server.wait_closed()
+
+    assert scrape.status_code == 200
+    assert scrape.headers["content-type"] == metrics.CONTENT_TYPE
+    assert "# TYPE edge_link_lightbulbs gauge" in scrape.text
+    assert missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_worker_and_api_serve_metrics():
+    from src.api.main import app as api_app
+    from src.worker.main import app as worker_app
+
+    for app in (api_app, worker_app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/metrics")
+
+        assert response.status_code == 200
+        assert "# TYPE restate_handler_duration_seconds histogram" in response.text
+
+
+@pytest.mark.asyncio
+async def test_requests_are_recorded_across_services():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"success": True, "id": "test_id", "data": {"ctx": {}, "status": "ON"}})
+
+    async def mocked_run(name, action, serde=None, max_attempts=None):
+        return await action() if name != "getting random delay" else action()
+
+    resolver_count = RESOLVER_DURATION.count("Query", "lightbulb")
+    handler_count = HANDLER_DURATION.count("LightbulbManagementSvc", "toggle_lightbulb")
+    step_count = STEP_DURATION.count("toggling lightbulb status")
+    nats_count = NATS_REQUEST_DURATION.count("lightbulb.toggle")
+    edge_link_count = edge_link.REQUEST_DURATION.count("lightbulb.toggle")
+
+    async with create_restate_client(base_url="http://restate:8080", transport=httpx.MockTransport(handler)) as client:
+        await schema.execute('{ lightbulb(id: "test_id") { id status } }', context_value={"restate_client": client})
+
+    ctx = AsyncMock()
+    ctx.run.side_effect = mocked_run
+    ctx.request = MagicMock(return_value=SimpleNamespace(headers={}))
+    edge_link.light_bulbs.install("test_id")
+    try:
+        with container.override.service(target=NATSClient, new=NATSClient("memory://", transport=InMemoryTransport(typed=False))):
+            await toggle_lightbulb(ctx, LightbulbIdInput(id="test_id"))
+    finally:
+        edge_link.light_bulbs.clear()
+        edge_link.pending_events.clear()
+
+    assert RESOLVER_DURATION.count("Query", "lightbulb") == resolver_count + 1
+    assert HANDLER_DURATION.count("LightbulbManagementSvc", "toggle_lightbulb") == handler_count + 1
+    assert STEP_DURATION.count("toggling lightbulb status") == step_count + 1
+    assert NATS_REQUEST_DURATION.count("lightbulb.toggle") == nats_count + 1
+    assert edge_link.REQUEST_DURATION.count("lightbulb.toggle") == edge_link_count + 1
+
+
+@pytest.mark.asyncio
+async def test_failed_steps_and_edge_link_requests_are_counted():
+    errors = STEP_ERRORS.get("failing step", "RuntimeError")
+    failures = edge_link.REQUEST_FAILURES.get("lightbulb.get")
+
+    async def fail():
+        raise RuntimeError("edge link unavailable")
+
+    async def mocked_run(name, action, **options):
+        return await action()
+
+    ctx = AsyncMock()
+    ctx.run.side_effect = mocked_run
+    with pytest.raises(RuntimeError):
+        await run_step(ctx, "failing step", fail)
+    edge_link.handle_request("lightbulb.get", LightbulbRequest(id="missing"))
+
+    assert STEP_ERRORS.get("failing step", "RuntimeError") == errors + 1
+    assert edge_link.REQUEST_FAILURES.get("lightbulb.get") == failures + 1
@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from nats.errors import TimeoutError as NATSTimeoutError
+from src.codec import BINARY, WireFormat
+from src.edge_link import main as edge_link
+from src.models import LightbulbBatchRequest, LightbulbBatchResponse, LightbulbRequest, LightbulbResponse
+from src.worker.services import InMemoryTransport, NATSClient, NATSClientOverloadedError, NATSConnectionPool
+
+
+class FakeConnection:
+    def __init__(self, delay: float = 0, error: Exception | None = None):
+        self.delay = delay
+        self.error = error
+        self.requests = []
+        self.max_concurrent = 0
+        self._concurrent = 0
+
+    async def request(self, subject: str, payload: bytes, timeout: float, headers: dict | None = None):
+        self.requests.append((subject, timeout))
+        self._concurrent += 1
+        self.max_concurrent = max(self.max_concurrent, self._concurrent)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error:
+                raise self.error
+            return SimpleNamespace(data=payload, headers=None)
+        finally:
+            self._concurrent -= 1
+
+
+def make_client(connections: list[FakeConnection], **kwargs) -> NATSClient:
+    transport = NATSConnectionPool("nats://test:4222", pool_size=len(connections))
+    transport.connections = connections
+    return NATSClient("nats://test:4222", transport=transport, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_request_limits_in_flight_and_round_robins():
+    connections = [FakeConnection(delay=0.01), FakeConnection(delay=0.01)]
+    client = make_client(connections, max_in_flight=2)
+
+    responses = await asyncio.gather(*(client.request("lightbulb.get", f"{i}") for i in range(6)))
+
+    assert responses == [f"{i}" for i in range(6)]
+    assert [len(c.requests) for c in connections] == [3, 3]
+    assert sum(c.max_concurrent for c in connections) <= 2
+    assert client.stats.snapshot()["requests"] == 6
+    assert client.stats.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_request_sheds_load_when_queue_is_full():
+    client = make_client([FakeConnection(delay=0.05)], max_in_flight=1, max_queue=1)
+
+    results = await asyncio.gather(*(client.request("lightbulb.get", "{}") for _ in range(3)), return_exceptions=True)
+
+    assert [isinstance(result, NATSClientOverloadedError) for result in results] == [False, False, True]
+    assert client.stats.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_request_uses_per_subject_timeouts():
+    connection = FakeConnection()
+    client = make_client([connection], default_timeout=1, subject_timeouts={"lightbulb.get_batch": 3})
+
+    await client.request("lightbulb.get", "{}")
+    await client.request("lightbulb.2.get_batch", "{}")
+
+    assert [timeout for _, timeout in connection.requests] == [1, 3]
+
+
+@pytest.mark.asyncio
+async def test_request_counts_timeouts():
+    client = make_client([FakeConnection(error=NATSTimeoutError())])
+
+    with pytest.raises(NATSTimeoutError):
+        await client.request("lightbulb.get", "{}")
+
+    assert client.stats.timeouts == 1
+    assert client.stats.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_in_memory_transport_matches_json_and_detaches_state():
+    typed = NATSClient("memory://", transport=InMemoryTransport(typed=True))
+    untyped = NATSClient("memory://", transport=InMemoryTransport(typed=False))
+    ctx = {"room": "kitchen"}
+    try:
+        installed = await typed.request_model("lightbulb.install", LightbulbRequest(id="bulb_1", data=ctx), LightbulbResponse)
+        ctx["room"] = "garage"
+        installed.data["ctx"]["room"] = "attic"
+
+        typed_get = await typed.request_model("lightbulb.0.get", LightbulbRequest(id="bulb_1"), LightbulbResponse)
+        json_get = await untyped.request_model("lightbulb.0.get", LightbulbRequest(id="bulb_1"), LightbulbResponse)
+    finally:
+        edge_link.light_bulbs.clear()
+        edge_link.pending_events.clear()
+
+    assert typed_get == json_get
+    assert typed_get.data == {"ctx": {"room": "kitchen"}, "status": "OFF"}
+    assert typed.stats.snapshot()["requests"] == 2
+
+
+@pytest.mark.asyncio
+async def test_request_model_negotiates_wire_format():
+    client = NATSClient("memory://", transport=InMemoryTransport(typed=False), wire_format=WireFormat(BINARY, 0))
+    try:
+        installed = await client.request_model("lightbulb.install", LightbulbRequest(id="bulb_1", data={"room": "kitchen"}), LightbulbResponse)
+        batch = await client.request_model("lightbulb.get_batch", LightbulbBatchRequest(ids=["bulb_1", "missing"]), LightbulbBatchResponse)
+    finally:
+        edge_link.light_bulbs.clear()
+        edge_link.pending_events.clear()
+
+    assert installed.data == {"ctx": {"room": "kitchen"}, "status": "OFF"}
+    assert [(result.id, result.success) for result in batch.results] == [("bulb_1", True), ("missing", False)]
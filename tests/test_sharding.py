@@ -0,0 +1,51 @@
+import json
+import pytest
+from src.sharding import base_subject, route_subject, shard_for, shard_subject
+from src.worker.di import container
+from src.worker.services import NATSClient, ShardRouter
+from src.worker.utils import send_lightbulb_batch_request, send_lightbulb_request
+
+
+def test_shard_subjects():
+    assert shard_subject("lightbulb.install", 3) == "lightbulb.3.install"
+    assert base_subject("lightbulb.3.install") == "lightbulb.install"
+    assert base_subject("lightbulb.get_batch") == "lightbulb.get_batch"
+    assert route_subject("lightbulb.get", "test_id", 1) == "lightbulb.get"
+    assert route_subject("lightbulb.get", "test_id", 4) == f"lightbulb.{shard_for('test_id', 4)}.get"
+
+
+def test_shard_for_is_stable_and_spread():
+    counts = [0] * 4
+    for i in range(4000):
+        counts[shard_for(f"bulb-{i}", 4)] += 1
+
+    assert shard_for("test_id", 4) == shard_for("test_id", 4)
+    assert all(count > 800 for count in counts)
+
+
+@pytest.mark.asyncio
+async def test_send_lightbulb_request_routes_to_shard(mock_nats_client):
+    mock_client = mock_nats_client()
+
+    with container.override.service(target=NATSClient, new=mock_client), container.override.service(target=ShardRouter, new=ShardRouter(4)):
+        await send_lightbulb_request("test_id", "lightbulb.toggle")
+
+    assert mock_client.calls[0]["subject"] == f"lightbulb.{shard_for('test_id', 4)}.toggle"
+
+
+@pytest.mark.asyncio
+async def test_send_lightbulb_batch_request_fans_out_per_shard(mock_nats_client):
+    def batch_response(data):
+        return json.dumps({"success": True, "results": [{"id": id, "success": True, "data": {"status": "OFF"}} for id in data["ids"]]})
+
+    ids = [f"bulb-{i}" for i in range(20)]
+    mock_client = mock_nats_client({f"lightbulb.{shard}.get_batch": batch_response for shard in range(4)})
+
+    with container.override.service(target=NATSClient, new=mock_client), container.override.service(target=ShardRouter, new=ShardRouter(4)):
+        response = await send_lightbulb_batch_request(ids)
+
+    assert [result.id for result in response.results] == ids
+    assert len(mock_client.calls) == 4
+    for call in mock_client.calls:
+        shard = int(call["subject"].split(".")[1])
+        assert all(shard_for(id, 4) == shard for id in json.loads(call["data"])["ids"])
@@ -0,0 +1,69 @@
+import asyncio
+import httpx
+import pytest
+from src.api.graphql import call_restate, fetch_lightbulb, restate_calls
+from src.api.singleflight import SingleFlight
+from .test_graphql import make_restate_client
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_call():
+    singleflight = SingleFlight()
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(singleflight.do("key", call, name="get") for _ in range(5)))
+
+    assert results == [1] * 5
+    assert calls == 1
+    assert singleflight.stats() == {"get": {"hits": 4, "misses": 1}}
+    assert len(singleflight) == 0
+
+    assert await singleflight.do("key", call, name="get") == 2
+
+
+@pytest.mark.asyncio
+async def test_exceptions_are_shared_and_cancelling_a_caller_keeps_the_call():
+    singleflight = SingleFlight()
+    release = asyncio.Event()
+
+    async def call():
+        await release.wait()
+        raise ValueError("failed")
+
+    first = asyncio.create_task(singleflight.do("key", call))
+    second = asyncio.create_task(singleflight.do("key", call))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    with pytest.raises(ValueError):
+        await second
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_restate_reads_are_coalesced():
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"success": True, "id": "a", "data": {"ctx": {}, "status": "ON"}})
+
+    async with make_restate_client(handler) as client:
+        results = await asyncio.gather(*(fetch_lightbulb(client, "a", dedup=False) for _ in range(10)))
+        await asyncio.gather(*(call_restate(client, "LightbulbManagementSvc", "toggle_lightbulb", {"id": "a"}, include_idempotency_key=False) for _ in range(2)))
+        # Policies are per service, so a handler sharing a read's name elsewhere gets the default policy
+        await asyncio.gather(*(call_restate(client, "InstallationWorkflow/a", "get", include_idempotency_key=False) for _ in range(2)))
+
+    assert all(result["data"]["status"] == "ON" for result in results)
+    # One read, and both toggles since without the idempotency key they are not deduplicated by Restate
+    assert [request.url.path for request in requests] == ["/LightbulbManagementSvc/get_lightbulb"] + ["/LightbulbManagementSvc/toggle_lightbulb"] * 2 + ["/InstallationWorkflow/a/get"] * 2
+    assert restate_calls.hits["get_lightbulb"] >= 9
+
@@ -0,0 +1,76 @@
+import httpx
+import pytest
+from src.api.graphql import schema
+from src.api.status_view import LightbulbStatusView
+from src.models import LightbulbEvent
+from .test_graphql import make_restate_client
+
+
+def bulb(status: str) -> dict:
+    return {"ctx": {}, "status": status}
+
+
+def test_view_applies_events():
+    view = LightbulbStatusView()
+
+    assert view.get("a") == (False, None)
+    view.apply(LightbulbEvent(id="a", data=bulb("ON")))
+    assert view.get("a") == (True, bulb("ON"))
+    view.apply(LightbulbEvent(id="a", data=None))
+    assert view.get("a") == (True, None)
+    assert (view.hits, view.misses) == (2, 1)
+
+
+def test_view_evicts_least_recently_used():
+    view = LightbulbStatusView(max_size=2)
+    view.apply(LightbulbEvent(id="a", data=bulb("ON")))
+    view.apply(LightbulbEvent(id="b", data=bulb("ON")))
+    view.get("a")
+    view.apply(LightbulbEvent(id="c", data=bulb("ON")))
+
+    assert len(view) == 2
+    assert view.get("b") == (False, None)
+    assert view.get("a")[0] and view.get("c")[0]
+
+
+def test_view_expires_entries():
+    view = LightbulbStatusView(ttl=0)
+    view.apply(LightbulbEvent(id="a", data=bulb("ON")))
+
+    assert view.get("a") == (False, None)
+
+
+def test_fill_does_not_overwrite_newer_events():
+    view = LightbulbStatusView()
+    since_version = view.version
+    view.apply(LightbulbEvent(id="a", data=bulb("ON")))
+
+    view.fill("a", bulb("OFF"), since_version)
+    assert view.get("a") == (True, bulb("ON"))
+
+    view.fill("a", bulb("OFF"), view.version)
+    assert view.get("a") == (True, bulb("OFF"))
+
+
+@pytest.mark.asyncio
+async def test_lightbulb_query_reads_from_view():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"success": True, "id": "b", "data": bulb("OFF")})
+
+    view = LightbulbStatusView()
+    view.apply(LightbulbEvent(id="a", data=bulb("ON")))
+
+    async with make_restate_client(handler) as client:
+        context = {"restate_client": client, "status_view": view}
+        hit = await schema.execute('{ lightbulb(id: "a") { id status } }', context_value=context)
+        miss = await schema.execute('{ lightbulb(id: "b") { id status } }', context_value=context)
+        cached = await schema.execute('{ lightbulb(id: "b") { id status } }', context_value=context)
+
+    assert hit.data == {"lightbulb": {"id": "a", "status": "ON"}}
+    assert miss.data == cached.data == {"lightbulb": {"id": "b", "status": "OFF"}}
+    assert len(requests) == 1
+    # Filling the view never reuses a deduplicated result
+    assert "idempotency-key" not in requests[0].headers
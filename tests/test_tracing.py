@@ -0,0 +1,142 @@
+import httpx
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+from src import tracing
+from src.api.graphql import call_restate, schema
+from src.api.restate_client import create_restate_client
+from src.edge_link import main as edge_link
+from src.worker.di import container
+from src.worker.lightbulb_service import toggle_lightbulb
+from src.worker.models import LightbulbIdInput
+from src.worker.services import InMemoryTransport, NATSClient
+
+
+@pytest.fixture
+def exporter():
+    exporter = tracing.InMemoryExporter()
+    tracing.set_exporter(exporter)
+    yield exporter
+    tracing.set_exporter(None)
+    edge_link.light_bulbs.clear()
+    edge_link.pending_events.clear()
+
+
+def test_traceparent_round_trip():
+    context = tracing.SpanContext("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", sampled=True)
+
+    assert context.traceparent == "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    assert tracing.parse_traceparent(context.traceparent) == context
+    assert tracing.extract({"Traceparent": context.traceparent}) == context
+    for invalid in (None, "", "00-abc-def-01", "00-" + "0" * 32 + "-00f067aa0ba902b7-01", "ff-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"):
+        assert tracing.parse_traceparent(invalid) is None
+
+
+def test_spans_nest_and_propagate(exporter):
+    with tracing.span("outer", "test") as outer:
+        headers = tracing.inject({"Accept": "application/json"})
+        with tracing.span("inner", "test") as inner:
+            pass
+
+    remote = tracing.start_span("remote", "test", tracing.extract(headers))
+    remote.end()
+
+    spans = {span["name"]: span for span in exporter.spans}
+    assert headers["Accept"] == "application/json"
+    assert {span["trace_id"] for span in spans.values()} == {outer.context.trace_id}
+    assert spans["inner"]["parent_id"] == spans["remote"]["parent_id"] == outer.context.span_id
+    assert spans["outer"]["parent_id"] is None
+    assert inner.context.span_id != outer.context.span_id
+
+
+def test_unsampled_and_untraced_spans_are_not_exported(exporter):
+    unsampled = tracing.SpanContext("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", sampled=False)
+    with tracing.span("unsampled", "test", unsampled):
+        assert tracing.inject()[tracing.TRACEPARENT].endswith("-00")
+
+    tracing.set_exporter(None)
+    with tracing.span("untraced", "test") as span:
+        assert tracing.inject() is None
+
+    assert span.context is None
+    assert not exporter.spans
+
+
+def test_breakdown_reports_self_time():
+    spans = [
+        {"trace_id": "t", "span_id": "a", "parent_id": None, "name": "api", "duration_ms": 10.0},
+        {"trace_id": "t", "span_id": "b", "parent_id": "a", "name": "worker", "duration_ms": 6.0},
+        {"trace_id": "t", "span_id": "c", "parent_id": "b", "name": "edge", "duration_ms": 1.0},
+    ]
+
+    report = tracing.breakdown(spans)
+
+    assert [(name, stage["self_p50_ms"]) for name, stage in report.items()] == [("worker", 5.0), ("api", 4.0), ("edge", 1.0)]
+    assert report["api"]["p50_ms"] == 10.0
+
+
+@pytest.mark.asyncio
+async def test_toggle_is_traced_from_api_to_edge_link(exporter):
+    ingress_headers = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        ingress_headers.update(request.headers)
+        return httpx.Response(200, json={"success": True})
+
+    async with create_restate_client(base_url="http://restate:8080", transport=httpx.MockTransport(handler)) as client:
+        await schema.execute('mutation { toggleLightbulb(id: "test_id") { key } }', context_value={"restate_client": client})
+
+    # The worker receives the ingress headers with the invocation
+    async def mocked_run(name, action, serde=None, max_attempts=None):
+        return 1 if name == "getting random delay" else await action()
+
+    ctx = AsyncMock()
+    ctx.run.side_effect = mocked_run
+    ctx.request = MagicMock(return_value=SimpleNamespace(headers=ingress_headers))
+    edge_link.light_bulbs.install("test_id")
+    with container.override.service(target=NATSClient, new=NATSClient("memory://", transport=InMemoryTransport(typed=False))):
+        await toggle_lightbulb(ctx, LightbulbIdInput(id="test_id"))
+
+    spans = {span["name"]: span for span in exporter.spans}
+    assert list(spans) == [
+        "restate LightbulbManagementSvc/toggle_lightbulb", "graphql toggleLightbulb",
+        "edge_link lightbulb.toggle", "nats lightbulb.toggle", "worker LightbulbManagementSvc/toggle_lightbulb",
+    ]
+    assert len({span["trace_id"] for span in spans.values()}) == 1
+    assert spans["worker LightbulbManagementSvc/toggle_lightbulb"]["parent_id"] == spans["restate LightbulbManagementSvc/toggle_lightbulb"]["span_id"]
+    assert spans["edge_link lightbulb.toggle"]["parent_id"] == spans["nats lightbulb.toggle"]["span_id"]
+    assert set(exporter.breakdown()) == set(spans)
+
+
+@pytest.mark.asyncio
+async def test_restate_spans_are_named_per_handler_not_per_bulb(exporter):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"success": True})
+
+    async with create_restate_client(base_url="http://restate:8080", transport=httpx.MockTransport(handler)) as client:
+        for id in ("bulb_1", "bulb_2"):
+            await call_restate(client, f"Lightbulb/{id}", "toggle")
+
+    assert [(span["name"], span["attributes"]["key"]) for span in exporter.spans] == [
+        ("restate Lightbulb/toggle", "bulb_1"), ("restate Lightbulb/toggle", "bulb_2"),
+    ]
+    assert list(exporter.breakdown()) == ["restate Lightbulb/toggle"]
+
+
+@pytest.mark.asyncio
+async def test_edge_link_handler_continues_trace_from_nats_headers(exporter):
+    published = []
+
+    class FakeNATS:
+        async def publish(self, subject, payload, headers=None):
+            published.append(subject)
+
+    with tracing.span("nats lightbulb.install", "worker") as parent:
+        headers = tracing.inject()
+    msg = SimpleNamespace(subject="lightbulb.install", data=b'{"id": "bulb_1"}', reply="reply.1", headers=headers)
+
+    await edge_link.construct_handler(FakeNATS())(msg)
+
+    edge_span = next(span for span in exporter.spans if span["name"] == "edge_link lightbulb.install")
+    assert edge_span["parent_id"] == parent.context.span_id
+    assert edge_span["service"] == "edge_link"